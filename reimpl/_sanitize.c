@@ -0,0 +1,191 @@
+/*
+ * Compiled implementation of travis_job_helper.__strip_meta_characters.
+ *
+ * Removes ANSI CSI sequences (as matched by sanitize1), a leading "M\n"
+ * (as matched by sanitize2) and all characters that are not printable ASCII
+ * in a single pass. Build with: python setup_sanitize.py build_ext --inplace
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+
+#define READ(i) PyUnicode_READ(kind, data, (i))
+
+static int
+is_terminator(Py_UCS4 c)
+{
+    return c == 'm' || c == ',' || c == 'K' || c == 'H' || c == 'f' || c == 'J';
+}
+
+/*
+ * Length of the CSI sequence starting with ESC at position i, 0 if there is none.
+ * Equivalent to \x1B\[(([0-9]{1,2})?(;)?([0-9]{1,2})?)?[m,K,H,f,J] matched at i.
+ */
+static Py_ssize_t
+csi_length(int kind, const void *data, Py_ssize_t i, Py_ssize_t n)
+{
+    Py_ssize_t j = i + 2;
+    int digits = 0;
+    int digits_after_semicolon = 0;
+    int semicolon = 0;
+
+    if (i + 1 >= n || READ(i + 1) != '[') {
+        return 0;
+    }
+
+    while (j < n) {
+        Py_UCS4 c = READ(j);
+
+        if (c >= '0' && c <= '9') {
+            if (semicolon) {
+                digits_after_semicolon++;
+            }
+            else {
+                digits++;
+            }
+        }
+        else if (c == ';' && !semicolon) {
+            semicolon = 1;
+        }
+        else {
+            break;
+        }
+
+        /* No valid sequence has more than five parameter characters */
+        if (j - i - 2 >= 5) {
+            return 0;
+        }
+
+        j++;
+    }
+
+    if (j >= n || !is_terminator(READ(j))) {
+        return 0;
+    }
+
+    if (semicolon ? (digits > 2 || digits_after_semicolon > 2) : digits > 4) {
+        return 0;
+    }
+
+    return j - i + 1;
+}
+
+static void
+emit(char *out, Py_ssize_t *out_length, Py_UCS4 c)
+{
+    if (c >= 32 && c <= 126) {
+        out[(*out_length)++] = (char) c;
+    }
+}
+
+static Py_ssize_t
+strip(int kind, const void *data, Py_ssize_t n, char *out)
+{
+    Py_ssize_t i = 0;
+    Py_ssize_t out_length = 0;
+    Py_ssize_t stripped_index = 0;
+    int pending_m = 0;
+
+    while (i < n) {
+        Py_UCS4 c = READ(i);
+
+        if (c == 0x1B) {
+            Py_ssize_t length = csi_length(kind, data, i, n);
+            if (length > 0) {
+                i += length;
+                continue;
+            }
+        }
+
+        /* sanitize2 only matches "M\n" at the very start of the CSI-stripped string */
+        if (stripped_index == 0 && c == 'M') {
+            pending_m = 1;
+        }
+        else if (stripped_index == 1 && pending_m) {
+            pending_m = 0;
+            if (c != '\n') {
+                emit(out, &out_length, 'M');
+                emit(out, &out_length, c);
+            }
+        }
+        else {
+            emit(out, &out_length, c);
+        }
+
+        stripped_index++;
+        i++;
+    }
+
+    if (pending_m) {
+        emit(out, &out_length, 'M');
+    }
+
+    return out_length;
+}
+
+static PyObject *
+strip_meta_characters(PyObject *self, PyObject *arg)
+{
+    int kind;
+    const void *data;
+    Py_ssize_t n;
+    Py_ssize_t out_length;
+    char *out;
+    PyObject *result;
+
+    if (PyUnicode_Check(arg)) {
+        if (PyUnicode_READY(arg) < 0) {
+            return NULL;
+        }
+        kind = PyUnicode_KIND(arg);
+        data = PyUnicode_DATA(arg);
+        n = PyUnicode_GET_LENGTH(arg);
+    }
+    else if (PyBytes_Check(arg)) {
+        kind = PyUnicode_1BYTE_KIND;
+        data = PyBytes_AS_STRING(arg);
+        n = PyBytes_GET_SIZE(arg);
+    }
+    else {
+        PyErr_SetString(PyExc_TypeError, "strip_meta_characters() argument must be str or bytes");
+        return NULL;
+    }
+
+    out = PyMem_Malloc(n > 0 ? n : 1);
+    if (out == NULL) {
+        return PyErr_NoMemory();
+    }
+
+    out_length = strip(kind, data, n, out);
+
+    if (PyBytes_Check(arg)) {
+        result = PyBytes_FromStringAndSize(out, out_length);
+    }
+    else {
+        result = PyUnicode_DecodeASCII(out, out_length, NULL);
+    }
+
+    PyMem_Free(out);
+
+    return result;
+}
+
+static PyMethodDef sanitize_methods[] = {
+    {"strip_meta_characters", strip_meta_characters, METH_O,
+     "Removes color codes and other irrelevant meta-characters from a log line (str or bytes)."},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef sanitize_module = {
+    PyModuleDef_HEAD_INIT,
+    "_sanitize",
+    "Compiled log line sanitizer",
+    -1,
+    sanitize_methods
+};
+
+PyMODINIT_FUNC
+PyInit__sanitize(void)
+{
+    return PyModule_Create(&sanitize_module);
+}
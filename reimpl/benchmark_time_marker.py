@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+# Micro-benchmark of travis_time:end parsing: split-based parsing as used before vs. time_end_regex
+#   python benchmark_time_marker.py [-n <marker_count>]
+
+import getopt
+import sys
+import timeit
+
+import travis_job_helper
+
+
+def parse_time_end_split(line):
+    lower_line = line.lower()
+    colon_split = line.split(':')
+    timings = None
+
+    if 'start' and 'finish' and 'duration' in lower_line:
+        if len(colon_split) == 4:
+            timings = line.split(':')[3]
+        elif len(colon_split) == 3:
+            timings = line.split(',')[1]
+
+    if timings is None:
+        return None
+
+    start_value = int(timings.split(',')[0].split('=')[1])
+    finish_value = int(timings.split(',')[1].split('=')[1])
+    duration_value = int(timings.split(',')[2].split('=')[1])
+
+    return start_value, finish_value, duration_value
+
+
+def parse_time_end_regex(line):
+    time_end_match = travis_job_helper.time_end_regex.match(line.lower())
+
+    if time_end_match is None:
+        return None
+
+    return tuple(int(value) for value in time_end_match.groups())
+
+
+def main(argv):
+    usage_string = "Usage: benchmark_time_marker.py [-n <marker_count>]"
+    marker_count = 200000
+
+    try:
+        opts, args = getopt.getopt(argv, "hn:", ["markers="])
+    except getopt.GetoptError:
+        print(usage_string)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == '-h':
+            print(usage_string)
+            sys.exit()
+        elif opt in ("-n", "--markers"):
+            marker_count = int(arg)
+
+    markers = ["travis_time:end:{:08x}:start={},finish={},duration={}".format(
+        i, 1450000000000000000 + i * 1000, 1450000000000000000 + i * 2000, i * 1000) for i in range(marker_count)]
+
+    for marker in markers[:1000]:
+        if parse_time_end_split(marker) != parse_time_end_regex(marker):
+            print("Mismatch for " + marker)
+            sys.exit(1)
+
+    split_duration = timeit.timeit(lambda: [parse_time_end_split(marker) for marker in markers], number=3) / 3
+    regex_duration = timeit.timeit(lambda: [parse_time_end_regex(marker) for marker in markers], number=3) / 3
+
+    print("{} markers".format(marker_count))
+    print("split: {:.3f}s ({:.0f} markers/s)".format(split_duration, marker_count / split_duration))
+    print("regex: {:.3f}s ({:.0f} markers/s)".format(regex_duration, marker_count / regex_duration))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,11 @@
+#!/usr/bin/env python
+
+# Builds the optional compiled sanitizer next to travis_job_helper.py:
+#   python setup_sanitize.py build_ext --inplace
+
+from setuptools import Extension, setup
+
+setup(
+    name="travis-log-sanitize",
+    ext_modules=[Extension("_sanitize", sources=["_sanitize.c"], extra_compile_args=["-O3"])]
+)
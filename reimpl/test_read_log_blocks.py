@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+# Checks that truncating overlong lines (max_line_length) does not change which lines are found or their line numbers
+# and byte offsets, for lines that end at a block boundary of travis_job_helper.__read_log_blocks, and that the RSS
+# limit (max_rss_bytes) only counts the memory taken while reading a log
+
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import travis_job_helper
+
+block_size = 4096
+max_line_length = 100
+
+folds = b"travis_fold:start:first\ntravis_fold:start:second\ntravis_fold:end:second\n"
+
+
+class ReadLogBlocksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.read_block_size = travis_job_helper.read_block_size
+        travis_job_helper.read_block_size = block_size
+
+    def tearDown(self):
+        travis_job_helper.read_block_size = self.read_block_size
+        shutil.rmtree(self.folder)
+
+    def parse_folds(self, content, **options):
+        log_file = os.path.join(self.folder, "1_abcdef_99.log")
+        with open(log_file, "wb") as log:
+            log.write(content)
+
+        fold_index = []
+        diagnostics = {}
+        travis_job_helper.parse_job_log_file(log_file, logging.getLogger("test_read_log_blocks"),
+                                             fold_index=fold_index, diagnostics=diagnostics, **options)
+        return fold_index, diagnostics
+
+    def assert_same_folds(self, content):
+        folds_without_limit, diagnostics = self.parse_folds(content)
+        folds_with_limit, diagnostics = self.parse_folds(content, max_line_length=max_line_length)
+
+        self.assertEqual(2, len(folds_without_limit))
+        self.assertEqual(folds_without_limit, folds_with_limit)
+        self.assertEqual(1, diagnostics.get("truncated_lines"))
+
+    def test_terminated_line_at_block_end(self):
+        # The overlong line including its \n fills the first block
+        self.assert_same_folds(b"x" * (block_size - 1) + b"\n" + folds)
+
+    def test_carriage_return_line_at_block_end(self):
+        # The \n of the \r\n ending the overlong line is the first byte of the next block
+        self.assert_same_folds(b"x" * (block_size - 1) + b"\r\n" + folds)
+
+    def test_carriage_return_line_before_block_end(self):
+        self.assert_same_folds(b"x" * (block_size - 2) + b"\r\n" + folds)
+
+    def test_skipped_line_end_at_block_end(self):
+        # The rest of the overlong line is skipped up to the end of the second block
+        self.assert_same_folds(b"x" * (2 * block_size - 1) + b"\n" + folds)
+
+    def test_unterminated_line_at_block_end(self):
+        self.assert_same_folds(b"x" * block_size + b"\n" + folds)
+
+    def test_rss_limit_applies_to_growth(self):
+        # Memory held before the log is opened, e.g. after an earlier large log, does not count against the limit
+        held = bytearray(64 * 1024 * 1024)
+        content = folds + b"x" * (travis_job_helper.rss_check_blocks * block_size)
+
+        fold_index, diagnostics = self.parse_folds(content, max_rss_bytes=16 * 1024 * 1024)
+
+        self.assertEqual(len(held), 64 * 1024 * 1024)
+        self.assertNotIn("quarantined", diagnostics)
+        self.assertEqual(2, len(fold_index))
+
+
+if __name__ == "__main__":
+    unittest.main()
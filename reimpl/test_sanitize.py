@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+# Checks that the compiled sanitizer (see setup_sanitize.py) produces the same output as the pure-Python version on
+# a fuzzed corpus, for str lines and for raw lines as they are sanitized by travis_job_helper.parse_job_log_file
+
+import os
+import random
+import unittest
+
+import travis_job_helper
+
+fragments = ["\x1b[", "\x1b[0m", "\x1b[33;1m", "\x1b[0K", "\x1b[123m", "\x1b[12;345m", "\x1b[1;2;3m",
+             "\x1b[;m", "\x1b[2J", "\x1b[,", "\x1b", "[", ";", "M\n", "M", "\n", "\r", "\t", "^M",
+             "travis_fold:start:worker_info", "travis_time:end:abc:start=1,finish=2,duration=1",
+             "é", "✓", "\x00", "\x7f", "0", "12", "m", "K", "H", "f", "J", "abc def"]
+
+# Byte sequences that are not valid UTF-8 on their own or next to other fragments
+raw_fragments = [b"\xc3", b"\xa9", b"\xe2\x9c", b"\xff", b"\xc3\x1b[0m", b"\xed\xa0\x80", b"\xf0\x9f\x98\x80"]
+
+line_count = 20000
+
+
+def fuzz_line(rng):
+    return "".join(rng.choice(fragments) if rng.random() < 0.7 else chr(rng.randrange(0, 300))
+                   for i in range(rng.randrange(0, 12)))
+
+
+def fuzz_raw_line(rng):
+    return b"".join(rng.choice(raw_fragments) if rng.random() < 0.2 else rng.choice(fragments).encode("utf-8")
+                    for i in range(rng.randrange(0, 12)))
+
+
+class SanitizeConformanceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.compiled = travis_job_helper._load_compiled_sanitizer(os.path.dirname(os.path.abspath(__file__)))
+
+        if self.compiled is None:
+            self.skipTest("Compiled sanitizer not built, run: python setup_sanitize.py build_ext --inplace")
+
+    def test_str_lines(self):
+        python_version = getattr(travis_job_helper, "__strip_meta_characters_python")
+        rng = random.Random(0)
+
+        for i in range(line_count):
+            line = fuzz_line(rng)
+            self.assertEqual(python_version(line), self.compiled(line), repr(line))
+
+    def test_raw_lines(self):
+        # The fallback decodes raw lines as UTF-8, the compiled version works on the bytes
+        python_version = getattr(travis_job_helper, "__strip_meta_characters_raw_python")
+        rng = random.Random(1)
+
+        for i in range(line_count):
+            raw_line = fuzz_raw_line(rng)
+            self.assertEqual(python_version(raw_line), self.compiled(raw_line), repr(raw_line))
+
+    def test_compiled_version_is_used(self):
+        # Found through the module folder, whether or not it is on sys.path
+        self.assertIsNot(getattr(travis_job_helper, "__strip_meta_characters_raw"),
+                         getattr(travis_job_helper, "__strip_meta_characters_raw_python"))
+
+
+if __name__ == "__main__":
+    unittest.main()
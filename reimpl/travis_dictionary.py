@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+
+# Code used for None values
+NULL_CODE = -1
+
+
+class StringDictionary:
+    """Interns strings and maps them to compact integer codes"""
+
+    def __init__(self):
+        self.__codes = {}
+        self.__strings = []
+
+    def __len__(self):
+        return len(self.__strings)
+
+    @property
+    def strings(self):
+        return self.__strings
+
+    def encode(self, value):
+        if value is None:
+            return NULL_CODE
+
+        code = self.__codes.get(value)
+        if code is None:
+            code = len(self.__strings)
+            self.__codes[value] = code
+            self.__strings.append(value)
+
+        return code
+
+    def decode(self, code):
+        if code == NULL_CODE:
+            return None
+
+        return self.__strings[code]
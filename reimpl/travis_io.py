@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+import multiprocessing
+import os
+import time
+
+# Throttle of the log reads of this process, shared with the worker processes (see set_io_throttle), None for
+# unthrottled reads
+io_throttle = None
+
+# Seconds of full-rate transfer the token buckets can hold, i.e. the maximum burst after an idle period
+burst_seconds = 1.0
+
+
+class IoThrottle:
+    """
+    Token buckets limiting the bandwidth and the number of read operations of all processes sharing the object.
+    The state lives in a multiprocessing array, so the object has to be passed to worker processes on their creation
+    (e.g. as initargs of a pool initializer).
+    """
+
+    # Positions in the shared state
+    __BYTE_TOKENS = 0
+    __READ_TOKENS = 1
+    __REFILL_TIME = 2
+    __THROTTLED_SECONDS = 3
+
+    def __init__(self, bytes_per_second=None, reads_per_second=None):
+        self.bytes_per_second = bytes_per_second
+        self.reads_per_second = reads_per_second
+        self.__state = multiprocessing.Array("d", [(bytes_per_second or 0) * burst_seconds,
+                                                   (reads_per_second or 0) * burst_seconds, time.monotonic(), 0.0])
+        # Seconds this process waited for tokens
+        self.throttled_seconds = 0.0
+
+    def acquire(self, byte_count, read_count=1):
+        """
+        Takes tokens for a read from the buckets, waiting until they are available. Tokens are reserved before
+        waiting, so concurrent readers are served in the order of their requests and reads larger than a bucket
+        do not starve.
+        :param byte_count: Number of bytes to read
+        :param read_count: Number of read operations
+        :return: Seconds waited
+        """
+
+        with self.__state.get_lock():
+            now = time.monotonic()
+            elapsed = max(0.0, now - self.__state[IoThrottle.__REFILL_TIME])
+            self.__state[IoThrottle.__REFILL_TIME] = now
+
+            wait_seconds = 0.0
+
+            for position, rate, count in ((IoThrottle.__BYTE_TOKENS, self.bytes_per_second, byte_count),
+                                          (IoThrottle.__READ_TOKENS, self.reads_per_second, read_count)):
+                if rate:
+                    tokens = min(rate * burst_seconds, self.__state[position] + elapsed * rate) - count
+                    self.__state[position] = tokens
+                    wait_seconds = max(wait_seconds, -tokens / rate)
+
+            self.__state[IoThrottle.__THROTTLED_SECONDS] += wait_seconds
+
+        if wait_seconds > 0:
+            time.sleep(wait_seconds)
+            self.throttled_seconds += wait_seconds
+
+        return wait_seconds
+
+    @property
+    def total_throttled_seconds(self):
+        """Seconds all processes sharing the throttle waited for tokens"""
+
+        return self.__state[IoThrottle.__THROTTLED_SECONDS]
+
+
+def set_io_throttle(throttle):
+    """
+    Sets the throttle of the log reads of this process, used as initializer of worker pools
+    :param throttle: IoThrottle object or None
+    """
+
+    global io_throttle
+    io_throttle = throttle
+
+
+def get_throttled_seconds():
+    """
+    :return: Seconds this process waited for the I/O throttle, 0 if reads are not throttled
+    """
+
+    return io_throttle.throttled_seconds if io_throttle is not None else 0.0
+
+
+class ThrottledLogReader:
+    """
+    Reads a log file through the I/O throttle. The reads are the sequential, page-aligned blocks requested by the
+    caller (see travis_job_helper.read_block_size). The kernel is advised to read ahead and to drop pages that have
+    been read from the page cache, so that extracting a large archive does not evict the page cache of other
+    tenants.
+    """
+
+    def __init__(self, log_file_path, throttle):
+        self.__throttle = throttle
+        self.__file = open(log_file_path, "rb", buffering=0)
+        self.__size = os.fstat(self.__file.fileno()).st_size
+        self.__position = 0
+
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(self.__file.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+    def read(self, size):
+        if self.__position >= self.__size:
+            return self.__file.read(size)
+
+        self.__throttle.acquire(min(size, self.__size - self.__position))
+        block = self.__file.read(size)
+
+        if block and hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(self.__file.fileno(), self.__position, len(block), os.POSIX_FADV_DONTNEED)
+
+        self.__position += len(block)
+
+        return block
+
+    def close(self):
+        self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
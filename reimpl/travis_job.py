@@ -1,6 +1,48 @@
+from travis_dictionary import StringDictionary
+
+# Dictionary shared by all jobs of this process for fields with only a handful of distinct values
+field_dictionary = StringDictionary()
+
+
 class TravisJob:
     """Data storage for one TravisTorrent Job"""
 
+    # Fields stored as codes of field_dictionary instead of as strings
+    DICTIONARY_FIELDS = ("worker_hostname", "worker_version", "os_dist_id", "os_dist_release", "os_description",
+                         "build_language")
+
+    FIELDS = ("build_number", "commit_hash", "job_id", "build_id", "startup_duration", "worker_hostname",
+              "worker_version", "worker_instance", "os_dist_id", "os_dist_release", "os_description",
+              "build_language", "using_worker_header", "travis_fold_worker_info", "travis_fold_system_info",
+              "travis_fold_count", "step_first_start", "step_last_end", "duration_aggregated_timestamp",
+              "duration_diff_timestamp")
+
+    # CSV header name -> field name, in output order
+    CSV_COLUMNS = {
+        "build_number": "build_number",
+        "commit_hash": "commit_hash",
+        "job_id": "job_id",
+        "build_id": "build_id",
+        "startup_duration_seconds": "startup_duration",
+        "worker_hostname": "worker_hostname",
+        "worker_version": "worker_version",
+        "worker_instance": "worker_instance",
+        "os_dist_id": "os_dist_id",
+        "os_dist_release": "os_dist_release",
+        "os_description": "os_description",
+        "build_language": "build_language",
+        "using_worker_header": "using_worker_header",
+        "travis_fold_worker_info": "travis_fold_worker_info",
+        "travis_fold_system_info": "travis_fold_system_info",
+        "travis_fold_count": "travis_fold_count",
+        "step_first_start_datetime": "step_first_start",
+        "step_last_end_datetime": "step_last_end",
+        "duration_aggregated_milliseconds": "duration_aggregated_timestamp",
+        "duration_diff_seconds": "duration_diff_timestamp"
+    }
+
+    __slots__ = tuple("_TravisJob__" + name for name in FIELDS)
+
     def __init__(self, build_number, commit_hash, job_id):
         self.__build_number = build_number
         self.__commit_hash = commit_hash
@@ -9,13 +51,13 @@ class TravisJob:
         # Initialize all values with None resp. with 0
         self.__build_id = None
         self.__startup_duration = None
-        self.__worker_hostname = None
-        self.__worker_version = None
+        self.__worker_hostname = field_dictionary.encode(None)
+        self.__worker_version = field_dictionary.encode(None)
         self.__worker_instance = None
-        self.__os_dist_id = None
-        self.__os_dist_release = None
-        self.__os_description = None
-        self.__build_language = None
+        self.__os_dist_id = field_dictionary.encode(None)
+        self.__os_dist_release = field_dictionary.encode(None)
+        self.__os_description = field_dictionary.encode(None)
+        self.__build_language = field_dictionary.encode(None)
         self.__using_worker_header = None
         self.__travis_fold_worker_info = False
         self.__travis_fold_system_info = False
@@ -48,6 +90,28 @@ class TravisJob:
 
         return return_value
 
+    def __getstate__(self):
+        # Codes are only valid within this process, pickle the decoded values instead
+        return {name: getattr(self, name) for name in TravisJob.FIELDS}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            if name in TravisJob.DICTIONARY_FIELDS:
+                value = field_dictionary.encode(value)
+            setattr(self, "_TravisJob__" + name, value)
+
+    def get_code(self, name):
+        """
+        Returns the field_dictionary code of a dictionary-encoded field
+        :param name: Name of one of the DICTIONARY_FIELDS
+        :return: Integer code
+        """
+
+        if name not in TravisJob.DICTIONARY_FIELDS:
+            raise KeyError(name)
+
+        return getattr(self, "_TravisJob__" + name)
+
     @property
     def build_number(self):
         return self.__build_number
@@ -60,6 +124,74 @@ class TravisJob:
     def job_id(self):
         return self.__job_id
 
+    @property
+    def build_id(self):
+        return self.__build_id
+
+    @property
+    def startup_duration(self):
+        return self.__startup_duration
+
+    @property
+    def worker_hostname(self):
+        return field_dictionary.decode(self.__worker_hostname)
+
+    @property
+    def worker_version(self):
+        return field_dictionary.decode(self.__worker_version)
+
+    @property
+    def worker_instance(self):
+        return self.__worker_instance
+
+    @property
+    def os_dist_id(self):
+        return field_dictionary.decode(self.__os_dist_id)
+
+    @property
+    def os_dist_release(self):
+        return field_dictionary.decode(self.__os_dist_release)
+
+    @property
+    def os_description(self):
+        return field_dictionary.decode(self.__os_description)
+
+    @property
+    def build_language(self):
+        return field_dictionary.decode(self.__build_language)
+
+    @property
+    def using_worker_header(self):
+        return self.__using_worker_header
+
+    @property
+    def travis_fold_worker_info(self):
+        return self.__travis_fold_worker_info
+
+    @property
+    def travis_fold_system_info(self):
+        return self.__travis_fold_system_info
+
+    @property
+    def travis_fold_count(self):
+        return self.__travis_fold_count
+
+    @property
+    def step_first_start(self):
+        return self.__step_first_start
+
+    @property
+    def step_last_end(self):
+        return self.__step_last_end
+
+    @property
+    def duration_aggregated_timestamp(self):
+        return self.__duration_aggregated_timestamp
+
+    @property
+    def duration_diff_timestamp(self):
+        return self.__duration_diff_timestamp
+
     def assign_properties(self,
                           build_id,
                           startup_duration,
@@ -81,13 +213,13 @@ class TravisJob:
                           ):
         self.__build_id = TravisJob.__cast_or_none(build_id, int)
         self.__startup_duration = TravisJob.__cast_or_none(startup_duration, int)
-        self.__worker_hostname = TravisJob.__cast_or_none(worker_hostname, str)
-        self.__worker_version = TravisJob.__cast_or_none(worker_version, str)
+        self.__worker_hostname = field_dictionary.encode(TravisJob.__cast_or_none(worker_hostname, str))
+        self.__worker_version = field_dictionary.encode(TravisJob.__cast_or_none(worker_version, str))
         self.__worker_instance = TravisJob.__cast_or_none(worker_instance, str)
-        self.__os_dist_id = TravisJob.__cast_or_none(os_dist_id, str)
-        self.__os_dist_release = TravisJob.__cast_or_none(os_dist_release, str)
-        self.__os_description = TravisJob.__cast_or_none(os_description, str)
-        self.__build_language = TravisJob.__cast_or_none(build_language, str)
+        self.__os_dist_id = field_dictionary.encode(TravisJob.__cast_or_none(os_dist_id, str))
+        self.__os_dist_release = field_dictionary.encode(TravisJob.__cast_or_none(os_dist_release, str))
+        self.__os_description = field_dictionary.encode(TravisJob.__cast_or_none(os_description, str))
+        self.__build_language = field_dictionary.encode(TravisJob.__cast_or_none(build_language, str))
         self.__using_worker_header = bool(using_worker_header)
         self.__travis_fold_worker_info = bool(travis_fold_worker_info)
         self.__travis_fold_system_info = bool(travis_fold_system_info)
@@ -97,20 +229,24 @@ class TravisJob:
         self.__duration_aggregated_timestamp = TravisJob.__cast_or_none(duration_aggregated_timestamp, int)
         self.__duration_diff_timestamp = TravisJob.__cast_or_none(duration_diff_timestamp, str)
 
-    def get_as_csv(self):
+    def get_as_csv(self, columns=None):
+        if columns is not None:
+            return ",".join("{}".format(TravisJob.__csv_prep(getattr(self, TravisJob.CSV_COLUMNS[column])))
+                            for column in columns)
+
         return "{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{}".format(
             TravisJob.__csv_prep(self.__build_number),
             TravisJob.__csv_prep(self.__commit_hash),
             TravisJob.__csv_prep(self.__job_id),
             TravisJob.__csv_prep(self.__build_id),
             TravisJob.__csv_prep(self.__startup_duration),
-            TravisJob.__csv_prep(self.__worker_hostname),
-            TravisJob.__csv_prep(self.__worker_version),
+            TravisJob.__csv_prep(field_dictionary.decode(self.__worker_hostname)),
+            TravisJob.__csv_prep(field_dictionary.decode(self.__worker_version)),
             TravisJob.__csv_prep(self.__worker_instance),
-            TravisJob.__csv_prep(self.__os_dist_id),
-            TravisJob.__csv_prep(self.__os_dist_release),
-            TravisJob.__csv_prep(self.__os_description),
-            TravisJob.__csv_prep(self.__build_language),
+            TravisJob.__csv_prep(field_dictionary.decode(self.__os_dist_id)),
+            TravisJob.__csv_prep(field_dictionary.decode(self.__os_dist_release)),
+            TravisJob.__csv_prep(field_dictionary.decode(self.__os_description)),
+            TravisJob.__csv_prep(field_dictionary.decode(self.__build_language)),
             TravisJob.__csv_prep(self.__using_worker_header),
             TravisJob.__csv_prep(self.__travis_fold_worker_info),
             TravisJob.__csv_prep(self.__travis_fold_system_info),
@@ -122,7 +258,10 @@ class TravisJob:
         )
 
     @staticmethod
-    def get_csv_header():
+    def get_csv_header(columns=None):
+        if columns is not None:
+            return ",".join(columns) + "\n"
+
         return "{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{}\n".format(
             "build_number",
             "commit_hash",
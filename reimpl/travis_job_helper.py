@@ -2,11 +2,16 @@
 
 from curses.ascii import isprint
 from datetime import timedelta, datetime
+import importlib.machinery
+import importlib.util
+import io
 import logging
+import mmap
 import re
 import os
 
 from travis_job import TravisJob
+import travis_io
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -23,13 +28,31 @@ log_stream_handler.setLevel(logging.INFO)
 log_stream_handler.setFormatter(log_stream_formatter)
 logger.addHandler(log_stream_handler)
 
+# Files exceeding the configured limits are recorded in the quarantine log as "<path>\t<reason>"
+quarantine_logger = logging.getLogger("quarantine")
+
+# Logs are read in blocks of this many bytes
+read_block_size = 1024 * 1024
+
+# When max_rss_bytes is set, the growth of the worker's memory since the log was opened is checked every this many
+# blocks
+rss_check_blocks = 16
+
+# Logs are split into chunks of at least this many bytes when they are scanned in parallel
+min_chunk_bytes = 16 * 1024 * 1024
+
 sanitize1 = re.compile(r'\x1B\[(([0-9]{1,2})?(;)?([0-9]{1,2})?)?[m,K,H,f,J]')
 sanitize2 = re.compile(r'^M\n')
+# travis_time:end markers with and without timer id, e.g.
+#   travis_time:end:0a1b2c3d:start=1450000000000000000,finish=1450000001000000000,duration=1000000000
+#   travis_time:end:start=1450000000000000000,finish=1450000001000000000,duration=1000000000
+time_end_regex = re.compile(r'travis_time:end:(?:[^:,=]*[:,])?\s*start=(\d+),\s*finish=(\d+),\s*duration=(\d+)')
+time_end_key_regex = re.compile(r'(start|finish|duration)=(\S*?)(?=,|\s|$)')
 startup_duration_regex = \
     re.compile(r'((?P<hours>\d+?)h)?((?P<minutes>\d+?)m)?((?P<seconds>\d+?)?)(.\d+)?s')
 
 
-def __strip_meta_characters(log_string):
+def __strip_meta_characters_python(log_string):
     """
     Removes color codes and other irrelevant meta-characters
     :param log_string: Log string
@@ -44,7 +67,62 @@ def __strip_meta_characters(log_string):
     return out
 
 
-def __extract_startup_duration(duration_string):
+def _load_compiled_sanitizer(extension_folder):
+    """
+    Loads the compiled sanitizer from the folder it was built in, independent of sys.path
+    :param extension_folder: Folder containing the built _sanitize extension (see setup_sanitize.py)
+    :return: strip_meta_characters of the extension, None if it has not been built
+    """
+
+    for suffix in importlib.machinery.EXTENSION_SUFFIXES:
+        extension_file = os.path.join(extension_folder, "_sanitize" + suffix)
+
+        if os.path.isfile(extension_file):
+            spec = importlib.util.spec_from_file_location("_sanitize", extension_file)
+            extension = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(extension)
+            return extension.strip_meta_characters
+
+    return None
+
+
+# Use the compiled sanitizer (see _sanitize.c) if it has been built next to this module
+__strip_meta_characters = _load_compiled_sanitizer(os.path.dirname(os.path.abspath(__file__)))
+
+
+def __strip_meta_characters_raw_python(raw_line):
+    return __strip_meta_characters_python(raw_line.decode("utf-8", errors="replace")).encode("ascii")
+
+
+# Sanitizers of raw lines (bytes in, printable ASCII bytes out). The compiled sanitizer handles bytes directly, so
+# only lines handed to extractors need to be decoded.
+if __strip_meta_characters is None:
+    __strip_meta_characters = __strip_meta_characters_python
+    __strip_meta_characters_raw = __strip_meta_characters_raw_python
+else:
+    __strip_meta_characters_raw = __strip_meta_characters
+
+
+def classify_time_end_marker(lower_line):
+    """
+    Determines why a travis_time:end marker does not match time_end_regex
+    :param lower_line: Lower case marker line
+    :return: One of missing_timings, incomplete_timings, non_numeric_timings or unknown_layout
+    """
+
+    timings = dict(time_end_key_regex.findall(lower_line))
+
+    if not timings:
+        return "missing_timings"
+    elif len(timings) < 3:
+        return "incomplete_timings"
+    elif not all(value.isdigit() for value in timings.values()):
+        return "non_numeric_timings"
+    else:
+        return "unknown_layout"
+
+
+def _extract_startup_duration(duration_string):
     """
     Extracts total duration in seconds from duration string.
     """
@@ -62,237 +140,1081 @@ def __extract_startup_duration(duration_string):
     return timedelta(**time_params).seconds
 
 
-def __extract_job_base(log_file):
+# Log file names: <build_number>_<commit_hash>_<job_id>.log
+log_file_name_regex = re.compile(r'^(\d+)_([0-9a-fA-F]+)_(\d+)\.log$')
+
+
+class LogFileNameError(ValueError):
+    """Raised when a log file name does not have the format <build_number>_<commit_hash>_<job_id>.log"""
+
+    def __init__(self, log_file_path):
+        super().__init__("File name format error in {}. Expected <build_number>_<commit_hash>_<job_id>.log".format(
+            log_file_path))
+        self.log_file_path = log_file_path
+
+
+def parse_log_file_name(log_file_path):
+    """
+    Parses the job key from the name of a log file, raises LogFileNameError for names not matching
+    log_file_name_regex
+    :param log_file_path: Log file path or name
+    :return: Tuple (build_number, commit_hash, job_id)
+    """
+
+    log_file_name_match = log_file_name_regex.match(os.path.basename(log_file_path))
+
+    if log_file_name_match is None:
+        raise LogFileNameError(log_file_path)
+
+    return int(log_file_name_match.group(1)), log_file_name_match.group(2), int(log_file_name_match.group(3))
+
+
+def __extract_job_base(log_file, job_key=None):
     """
     Extracts base information from the log_file name
     :param log_file: Log file for the job
+    :param job_key: Tuple (build_number, commit_hash, job_id) if the name has been parsed already
     :return: TravisTorrentJob object
     """
 
-    if '_' in log_file:
-        log_file_name = os.path.splitext(os.path.basename(log_file))[0]
-        log_file_split = log_file_name.split('_')
+    if job_key is None:
+        job_key = parse_log_file_name(log_file)
 
-        build_number = int(log_file_split[0])
-        commit_hash = str(log_file_split[1])
-        job_id = int(log_file_split[2])
+    return TravisJob(*job_key)
 
-        return TravisJob(build_number, commit_hash, job_id)
-    else:
-        raise Exception("File name format error in {}. File name contains different segments.".format(log_file))
+
+# Timestamp of January 1st 2018, later travis_time values are considered invalid
+upper_time_limit = int(1514761200)
+upper_time_limit_ns = upper_time_limit * 1000000000
 
 
-def __convert_timestamp_to_datetime(timestamp):
+def _is_valid_timestamp(timestamp):
+    """
+    Checks whether a raw travis_time timestamp (nanoseconds) can be converted
+    :param timestamp: Timestamp to be checked
+    :return: True if the timestamp is set and within the time limit
+    """
+
+    return timestamp is not None and not timestamp == 0 and timestamp <= upper_time_limit_ns
+
+
+def _convert_timestamp_to_datetime(timestamp):
     """
     Converts a travis_time timestamp to a DateTime string
     :param timestamp: Timestamp to be converted
     :return: Timestamp in DateTime format
     """
 
-    # Timestamp of January 1st 2018
-    upper_time_limit = int(1514761200)
-
-    if not timestamp == 0 and timestamp is not None:
+    if _is_valid_timestamp(timestamp):
         # Scale down resolution to seconds
-        ts = int(timestamp)/1000000000
+        return datetime.utcfromtimestamp(timestamp // 1000000000)
+    else:
+        return None
 
-        if ts > upper_time_limit:
-            return None
-        else:
-            return datetime.utcfromtimestamp(ts).replace(microsecond=0)
+
+def _convert_timestamp_to_epoch(timestamp):
+    """
+    Converts a travis_time timestamp to seconds since the epoch
+    :param timestamp: Timestamp to be converted
+    :return: Timestamp in seconds since the epoch
+    """
+
+    if _is_valid_timestamp(timestamp):
+        return timestamp // 1000000000
     else:
         return None
 
 
-def parse_job_log_file(log_file_path, parser_error_logger):
+class LogScan:
+    """State of one scan over a log that is shared by all extractors"""
+
+    def __init__(self, log_file_path, parser_error_logger):
+        self.log_file_path = log_file_path
+        self.parser_error_logger = parser_error_logger
+        # Number of the line currently fed to the extractors, starting at 1
+        self.line_number = 0
+        # Byte offsets of the beginning of the current line and of the line following it
+        self.offset = 0
+        self.next_offset = 0
+        # Counters describing problems found while scanning, e.g. malformed_markers and truncated_lines
+        self.diagnostics = {}
+
+
+class LogExtractor:
+    """
+    Base class of the field extractors run by parse_job_log_file. An extractor declares the lower case line
+    prefixes it needs and the CSV columns it fills; feed is only called for lines starting with one of its prefixes.
+    """
+
+    name = None
+    prefixes = ()
+    columns = ()
+    # Whether the extractor can scan a log in chunks (see merge). Other extractors only read the first chunk.
+    reducible = False
+
+    def __init__(self, **options):
+        self.options = options
+        # Set once no further lines are needed, the scan stops early when all extractors are complete
+        self.complete = False
+
+    def feed(self, line, lower_line, scan):
+        """
+        Processes a sanitized log line starting with one of the declared prefixes
+        :param line: Sanitized line
+        :param lower_line: Lower case line
+        :param scan: LogScan of the current log
+        """
+
+        raise NotImplementedError
+
+    def get_fields(self):
+        """
+        Returns the extracted values
+        :return: Dict of TravisJob field names to values
+        """
+
+        raise NotImplementedError
+
+    def merge(self, other, line_offset):
+        """
+        Combines the state of this extractor with that of an extractor of the same class that scanned the chunk of
+        the log following the lines scanned by this one. Only needed for reducible extractors.
+        :param other: Extractor of the following chunk
+        :param line_offset: Number of lines before the following chunk, its line numbers start at 1
+        """
+
+        raise NotImplementedError
+
+
+# Registered extractors by name. For fields filled by several extractors the value of the first registered
+# extractor that found one is used.
+EXTRACTORS = {}
+
+# Extractors needed per CSV column, columns taken from the file name need none
+COLUMN_EXTRACTORS = {"build_number": (), "commit_hash": (), "job_id": ()}
+
+# Compiled prefix scanners per combination of extractors
+_prefix_scanners = {}
+
+
+def register_extractor(extractor_class):
+    """
+    Registers an extractor, e.g. for another log layout. Can be used as a class decorator.
+    :param extractor_class: LogExtractor subclass
+    :return: extractor_class
+    """
+
+    if extractor_class.name in EXTRACTORS:
+        raise ValueError("Extractor {} is already registered".format(extractor_class.name))
+
+    for column in extractor_class.columns:
+        if column not in TravisJob.CSV_COLUMNS:
+            raise ValueError("Unknown column {} of extractor {}".format(column, extractor_class.name))
+
+    for prefix in extractor_class.prefixes:
+        if prefix != prefix.lower():
+            raise ValueError("Prefix {} of extractor {} is not lower case".format(prefix, extractor_class.name))
+
+    EXTRACTORS[extractor_class.name] = extractor_class
+
+    for column in extractor_class.columns:
+        COLUMN_EXTRACTORS[column] = COLUMN_EXTRACTORS.get(column, ()) + (extractor_class.name,)
+
+    _prefix_scanners.clear()
+
+    return extractor_class
+
+
+@register_extractor
+class WorkerInfoExtractor(LogExtractor):
+    """Worker information section (hostname, version, instance)"""
+
+    name = "worker"
+    prefixes = ("worker information", "operating system details", "travis_fold:end:worker_info", "hostname:",
+                "version:", "instance:")
+    columns = ("worker_hostname", "worker_version", "worker_instance")
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.in_section = False
+        self.worker_hostname = None
+        self.worker_version = None
+        self.worker_instance = None
+
+    def feed(self, line, lower_line, scan):
+        if lower_line.startswith("worker information"):
+            self.in_section = True
+        elif lower_line.startswith("operating system details"):
+            self.in_section = False
+        elif lower_line.startswith("travis_fold:end:worker_info"):
+            self.in_section = False
+            self.complete = True
+        elif self.in_section:
+            if lower_line.startswith("hostname:"):
+                self.worker_hostname = line.split(':')[1]
+            elif lower_line.startswith("version:"):
+                self.worker_version = " ".join(line.split(' ')[1:])
+            elif lower_line.startswith("instance:"):
+                self.worker_instance = line.split(' ')[1]
+
+    def get_fields(self):
+        return {"worker_hostname": self.worker_hostname,
+                "worker_version": self.worker_version,
+                "worker_instance": self.worker_instance}
+
+
+@register_extractor
+class WorkerHeaderExtractor(LogExtractor):
+    """"Using worker" header at the beginning of the log"""
+
+    name = "header"
+    prefixes = ("using worker", "travis_fold:end:worker_info")
+    columns = ("worker_hostname", "using_worker_header")
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.using_worker_header = None
+        self.worker_hostname = None
+
+    def feed(self, line, lower_line, scan):
+        if lower_line.startswith("using worker") and self.using_worker_header is None:
+            self.using_worker_header = True
+            self.worker_hostname = line.split(' ')[2]
+
+        # The header precedes the worker information section
+        self.complete = True
+
+    def get_fields(self):
+        return {"using_worker_header": self.using_worker_header,
+                "worker_hostname": self.worker_hostname}
+
+
+@register_extractor
+class BuildSystemInfoExtractor(LogExtractor):
+    """Build system information section (build id, build language)"""
+
+    name = "build_system"
+    prefixes = ("build system information", "operating system details", "travis_fold:end:system_info",
+                "build id:", "build language:")
+    columns = ("build_id", "build_language")
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.in_section = False
+        self.build_id = None
+        self.build_language = None
+
+    def feed(self, line, lower_line, scan):
+        if lower_line.startswith("build system information"):
+            self.in_section = True
+        elif lower_line.startswith("operating system details"):
+            self.in_section = False
+        elif lower_line.startswith("travis_fold:end:system_info"):
+            self.in_section = False
+            self.complete = True
+        elif self.in_section:
+            if lower_line.startswith("build id:"):
+                self.build_id = line.split(':')[1]
+            elif lower_line.startswith("build language:") and self.build_language is None:
+                self.build_language = line.split(':')[1]
+
+    def get_fields(self):
+        return {"build_id": self.build_id,
+                "build_language": self.build_language}
+
+
+@register_extractor
+class OsDetailsExtractor(LogExtractor):
+    """Operating System Details block of the system information section"""
+
+    name = "os"
+    prefixes = ("operating system details", "worker information", "travis_fold:end:system_info", "description:",
+                "distributor id", "release:", "build language")
+    columns = ("os_dist_id", "os_dist_release", "os_description", "build_language")
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.in_section = False
+        self.os_dist_id = None
+        self.os_dist_release = None
+        self.os_description = None
+        self.build_language = None
+
+    def feed(self, line, lower_line, scan):
+        if lower_line.startswith("operating system details"):
+            self.in_section = True
+        elif lower_line.startswith("worker information"):
+            self.in_section = False
+        elif lower_line.startswith("travis_fold:end:system_info"):
+            self.in_section = False
+            self.complete = True
+        elif self.in_section:
+            if lower_line.startswith("description:"):
+                self.os_description = line.split(":")[1]
+            elif lower_line.startswith("distributor id"):
+                self.os_dist_id = line.split(":")[1]
+            elif lower_line.startswith("release:"):
+                self.os_dist_release = line.split(":")[1]
+            elif lower_line.startswith("build language") and self.build_language is None:
+                self.build_language = line.split(":")[1]
+
+    def get_fields(self):
+        return {"os_dist_id": self.os_dist_id,
+                "os_dist_release": self.os_dist_release,
+                "os_description": self.os_description,
+                "build_language": self.build_language}
+
+
+@register_extractor
+class FoldFlagsExtractor(LogExtractor):
+    """Presence of the worker_info and system_info folds"""
+
+    name = "fold_flags"
+    prefixes = ("travis_fold:start:worker_info", "travis_fold:start:system_info", "travis_fold:end:worker_info",
+                "travis_fold:end:system_info")
+    columns = ("travis_fold_worker_info", "travis_fold_system_info")
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.travis_fold_worker_info = False
+        self.travis_fold_system_info = False
+        self.worker_section_done = False
+        self.system_section_done = False
+
+    def feed(self, line, lower_line, scan):
+        if lower_line.startswith("travis_fold:start:worker_info"):
+            self.travis_fold_worker_info = True
+        elif lower_line.startswith("travis_fold:start:system_info"):
+            self.travis_fold_system_info = True
+        elif lower_line.startswith("travis_fold:end:worker_info"):
+            self.worker_section_done = True
+        else:
+            self.system_section_done = True
+
+        self.complete = self.worker_section_done and self.system_section_done
+
+    def get_fields(self):
+        return {"travis_fold_worker_info": self.travis_fold_worker_info,
+                "travis_fold_system_info": self.travis_fold_system_info}
+
+
+@register_extractor
+class FoldCountExtractor(LogExtractor):
+    """Number of travis_fold:start markers"""
+
+    name = "fold_count"
+    prefixes = ("travis_fold:start",)
+    columns = ("travis_fold_count",)
+    reducible = True
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.travis_fold_count = 0
+
+    def feed(self, line, lower_line, scan):
+        self.travis_fold_count += 1
+
+    def get_fields(self):
+        return {"travis_fold_count": self.travis_fold_count}
+
+    def merge(self, other, line_offset):
+        self.travis_fold_count += other.travis_fold_count
+
+
+@register_extractor
+class StartupExtractor(LogExtractor):
+    """Worker startup duration, the last startup line wins"""
+
+    name = "startup"
+    prefixes = ("startup:",)
+    columns = ("startup_duration_seconds",)
+    reducible = True
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.startup_duration = None
+
+    def feed(self, line, lower_line, scan):
+        self.startup_duration = int(_extract_startup_duration(line.split(' ')[1]))
+
+    def get_fields(self):
+        return {"startup_duration": self.startup_duration}
+
+    def merge(self, other, line_offset):
+        if other.startup_duration is not None:
+            self.startup_duration = other.startup_duration
+
+
+@register_extractor
+class TimeMarkerExtractor(LogExtractor):
+    """
+    travis_time:end markers: first start, last end and aggregated duration of the steps. Supports the option
+    epoch_timestamps to report start and end as seconds since the epoch.
+    """
+
+    name = "timing"
+    prefixes = ("travis_time:end",)
+    columns = ("step_first_start_datetime", "step_last_end_datetime", "duration_aggregated_milliseconds",
+               "duration_diff_seconds")
+    reducible = True
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.duration_aggregated_timestamp = None
+        # Raw travis_time values in nanoseconds, converted once after the scan
+        self.step_first_start_ns = None
+        self.step_last_end_ns = None
+
+    def feed(self, line, lower_line, scan):
+        time_end_match = time_end_regex.match(lower_line)
+
+        if time_end_match is None:
+            malformed_category = classify_time_end_marker(lower_line)
+            malformed_markers = scan.diagnostics.setdefault("malformed_markers", {})
+            malformed_markers[malformed_category] = malformed_markers.get(malformed_category, 0) + 1
+            scan.parser_error_logger.warning("Invalid travis_time:end line (" + malformed_category
+                                             + ") in " + scan.log_file_path + "\n> " + line)
+            return
+
+        start_value, finish_value, duration_value = (int(value) for value in time_end_match.groups())
+
+        # Milliseconds
+        duration_value_ms = duration_value / 1000000
+
+        if self.duration_aggregated_timestamp is None:
+            self.duration_aggregated_timestamp = duration_value_ms
+        else:
+            self.duration_aggregated_timestamp += duration_value_ms
+
+        if self.step_first_start_ns is None and _is_valid_timestamp(start_value):
+            self.step_first_start_ns = start_value
+
+        self.step_last_end_ns = finish_value
+
+    def get_fields(self):
+        step_first_start = _convert_timestamp_to_datetime(self.step_first_start_ns)
+        step_last_end = _convert_timestamp_to_datetime(self.step_last_end_ns)
+        duration_diff_timestamp = None
+
+        if step_first_start is not None and step_last_end is not None:
+            duration_diff_timestamp = (step_last_end - step_first_start).total_seconds()
+
+        if self.options.get("epoch_timestamps"):
+            step_first_start = _convert_timestamp_to_epoch(self.step_first_start_ns)
+            step_last_end = _convert_timestamp_to_epoch(self.step_last_end_ns)
+
+        return {"step_first_start": step_first_start,
+                "step_last_end": step_last_end,
+                "duration_aggregated_timestamp": self.duration_aggregated_timestamp,
+                "duration_diff_timestamp": duration_diff_timestamp}
+
+    def merge(self, other, line_offset):
+        if other.duration_aggregated_timestamp is not None:
+            if self.duration_aggregated_timestamp is None:
+                self.duration_aggregated_timestamp = other.duration_aggregated_timestamp
+            else:
+                self.duration_aggregated_timestamp += other.duration_aggregated_timestamp
+
+        if self.step_first_start_ns is None:
+            self.step_first_start_ns = other.step_first_start_ns
+
+        # Set by every well-formed marker, so the following chunk has the last one if it has any
+        if other.duration_aggregated_timestamp is not None:
+            self.step_last_end_ns = other.step_last_end_ns
+
+
+@register_extractor
+class FoldIndexExtractor(LogExtractor):
+    """
+    Name, line numbers and byte offsets of every fold. Fills no columns, the folds are appended to the list given
+    as option fold_index as lists [fold, start_line, end_line, start_offset, end_offset]. The end offset is
+    exclusive and includes the travis_fold:end line; end_line and end_offset are None for folds that are not closed.
+    """
+
+    name = "fold_index"
+    prefixes = ("travis_fold:start:", "travis_fold:end:")
+    reducible = True
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.open_folds = {}
+        # Folds started in the scanned lines and travis_fold:end lines of other folds as lists
+        # [fold, line, next_offset]. The latter may close folds opened in a preceding chunk.
+        self.started_folds = set()
+        self.unmatched_ends = []
+
+    def feed(self, line, lower_line, scan):
+        fold = line.split(":", 2)[2].strip()
+
+        if lower_line.startswith("travis_fold:start:"):
+            fold_entry = [fold, scan.line_number, None, scan.offset, None]
+            self.options["fold_index"].append(fold_entry)
+            self.open_folds[fold] = fold_entry
+            self.started_folds.add(fold)
+        else:
+            fold_entry = self.open_folds.pop(fold, None)
+            if fold_entry is not None:
+                fold_entry[2] = scan.line_number
+                fold_entry[4] = scan.next_offset
+            elif fold not in self.started_folds:
+                self.unmatched_ends.append([fold, scan.line_number, scan.next_offset])
+
+    def get_fields(self):
+        return {}
+
+    def merge(self, other, line_offset):
+        for fold, line_number, next_offset in other.unmatched_ends:
+            fold_entry = self.open_folds.pop(fold, None)
+            if fold_entry is not None:
+                fold_entry[2] = line_number + line_offset
+                fold_entry[4] = next_offset
+
+        for fold_entry in other.options["fold_index"]:
+            fold_entry[1] += line_offset
+            if fold_entry[2] is not None:
+                fold_entry[2] += line_offset
+            self.options["fold_index"].append(fold_entry)
+
+        # A fold started again replaces the open one of the same name, even if it is closed in the same chunk
+        for fold in other.started_folds:
+            self.open_folds.pop(fold, None)
+
+        self.open_folds.update(other.open_folds)
+        self.started_folds.update(other.started_folds)
+
+
+def read_fold_section(log_file_path, start_offset, end_offset=None):
+    """
+    Reads one fold of a log using the offsets recorded in a fold index, without reading the rest of the log
+    :param log_file_path: Path of the log file
+    :param start_offset: Byte offset of the travis_fold:start line
+    :param end_offset: Byte offset after the travis_fold:end line, None to read until the end of the log
+    :return: Raw text of the section including both fold lines
+    """
+
+    with open(log_file_path, "rb") as log:
+        log.seek(start_offset)
+        section = log.read() if end_offset is None else log.read(end_offset - start_offset)
+
+    return section.decode("utf-8", errors="replace")
+
+
+def get_required_extractors(columns=None):
+    """
+    Determines the extractors needed to fill the given output columns
+    :param columns: List of CSV column names, None for all columns
+    :return: Set of extractor names
+    """
+
+    if columns is None:
+        return set(name for name, extractor_class in EXTRACTORS.items() if extractor_class.columns)
+
+    required_extractors = set()
+
+    for column in columns:
+        if column not in COLUMN_EXTRACTORS:
+            raise ValueError("Unknown column {}. Valid columns: {}".format(column, ", ".join(COLUMN_EXTRACTORS)))
+        required_extractors.update(COLUMN_EXTRACTORS[column])
+
+    return required_extractors
+
+
+def get_prefix_scanner(extractor_names):
+    """
+    Compiles a single pattern matching the prefixes of all given extractors. Prefixes are ordered longest first,
+    so the match is the longest declared prefix of a line, and every extractor with a prefix of the match is fed.
+    :param extractor_names: Names of registered extractors
+    :return: Tuple (extractor names in registration order, compiled bytes pattern, dict matched prefix (bytes) ->
+             tuple of positions in the extractor names)
+    """
+
+    names = tuple(name for name in EXTRACTORS if name in extractor_names)
+    scanner = _prefix_scanners.get(names)
+
+    if scanner is None:
+        prefixes = sorted(set(prefix for name in names for prefix in EXTRACTORS[name].prefixes),
+                          key=lambda prefix: (-len(prefix), prefix))
+        prefix_regex = re.compile(b"|".join(re.escape(prefix.encode("ascii")) for prefix in prefixes), re.IGNORECASE)
+        dispatch = {prefix.encode("ascii"): tuple(position for position, name in enumerate(names)
+                                  if any(prefix.startswith(extractor_prefix)
+                                         for extractor_prefix in EXTRACTORS[name].prefixes))
+                    for prefix in prefixes}
+
+        scanner = (names, prefix_regex, dispatch)
+        _prefix_scanners[names] = scanner
+
+    return scanner
+
+
+def __open_log(log_file_path, log_content=None):
+    """
+    Opens a log for binary line-wise reading, either from the file system or from content already in memory. Files
+    are read through travis_io.io_throttle if it is set.
+    :param log_file_path: Path of the log file
+    :param log_content: Log content as bytes or str, None to read log_file_path
+    :return: File object
+    """
+
+    if log_content is None:
+        if travis_io.io_throttle is not None:
+            return travis_io.ThrottledLogReader(log_file_path, travis_io.io_throttle)
+        return open(log_file_path, "rb")
+    elif isinstance(log_content, str):
+        log_content = log_content.encode("utf-8")
+
+    return io.BytesIO(log_content)
+
+
+class LogLimitExceeded(Exception):
+    """Raised when a log file exceeds one of the configured resource limits"""
+
+    def __init__(self, log_file_path, reason):
+        super().__init__("Limit exceeded for {}: {}".format(log_file_path, reason))
+        self.log_file_path = log_file_path
+        self.reason = reason
+
+    def __reduce__(self):
+        # Raised in chunk scanning workers and pickled back to the parent
+        return LogLimitExceeded, (self.log_file_path, self.reason)
+
+
+def __get_rss_bytes():
+    """
+    Returns the current resident set size of this process
+    :return: RSS in bytes, None if not available
+    """
+
+    try:
+        with open("/proc/self/statm", "r") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def __truncate_lines(block_offset, raw_lines, max_line_length, scan):
+    """
+    Splits a block of lines at lines longer than max_line_length, which are truncated to their beginning
+    :return: Generator of tuples (offset of the first line, list of raw lines)
+    """
+
+    run_start = 0
+    run_offset = block_offset
+    line_offset = block_offset
+
+    for index, raw_line in enumerate(raw_lines):
+        if len(raw_line) > max_line_length:
+            if index > run_start:
+                yield run_offset, raw_lines[run_start:index]
+
+            yield line_offset, [raw_line[:max_line_length] + b"\n"]
+            scan.diagnostics["truncated_lines"] = scan.diagnostics.get("truncated_lines", 0) + 1
+
+            run_start = index + 1
+            run_offset = line_offset + len(raw_line)
+
+        line_offset += len(raw_line)
+
+    if run_start < len(raw_lines):
+        yield run_offset, raw_lines[run_start:]
+
+
+def __find_line_end(block):
+    """
+    :return: Position after the first line break (\\r, \\n or \\r\\n) in block, -1 if there is none
+    """
+
+    newline = block.find(b"\n")
+    carriage_return = block.find(b"\r")
+
+    if carriage_return != -1 and (newline == -1 or carriage_return < newline):
+        return carriage_return + 2 if newline == carriage_return + 1 else carriage_return + 1
+
+    return newline + 1 if newline != -1 else -1
+
+
+def __read_log_blocks(log, scan, max_line_length=None, max_rss_bytes=None, start_offset=0):
+    """
+    Reads a log opened in binary mode in blocks of read_block_size bytes and splits them into lines. Like universal
+    newlines mode, \\r, \\n and \\r\\n end a line. Lines longer than max_line_length bytes are truncated to their
+    beginning (enough for all marker prefix checks) and the rest is skipped without being held in memory.
+    :param log: Log file object opened in binary mode
+    :param scan: LogScan in which truncated lines are counted
+    :param max_line_length: Maximum line length in bytes, None for no limit
+    :param max_rss_bytes: Maximum growth of the worker's resident set size in bytes while reading the log, None for
+                          no limit
+    :param start_offset: Byte offset in the log of the first byte read from log
+    :return: Generator of tuples (byte offset of the first line, list of raw lines), the lines of a tuple are
+             contiguous in the log
+    """
+
+    # Offset of the first byte not yet handed out
+    block_offset = start_offset
+    incomplete_line = b""
+    skipping = False
+    # Whether a \n at the beginning of the next block ends a truncated line that ended with \r
+    skip_newline = False
+    # The limit applies to the growth while reading this log, the RSS of a worker does not shrink after earlier logs
+    start_rss_bytes = __get_rss_bytes() if max_rss_bytes else None
+    block_count = 0
+
+    while True:
+        block = log.read(read_block_size)
+        block_count += 1
+
+        if start_rss_bytes is not None and block_count % rss_check_blocks == 0:
+            rss_bytes = __get_rss_bytes()
+            if rss_bytes is not None and rss_bytes - start_rss_bytes > max_rss_bytes:
+                raise LogLimitExceeded(scan.log_file_path, "worker RSS grew by {} bytes, more than {}".format(
+                    rss_bytes - start_rss_bytes, max_rss_bytes))
+
+        if skipping and block:
+            # Remainder of a truncated line
+            line_end = __find_line_end(block)
+
+            if line_end == -1:
+                block_offset += len(block)
+                continue
+
+            skip_newline = line_end == len(block) and block.endswith(b"\r")
+            block_offset += line_end
+            block = block[line_end:]
+            skipping = False
+
+            # The truncated line ends at the end of the block, an empty block would end the log
+            if not block:
+                continue
+
+        if skip_newline and block:
+            skip_newline = False
+
+            if block.startswith(b"\n"):
+                block_offset += 1
+                block = block[1:]
+
+                if not block:
+                    continue
+
+        if not block:
+            if incomplete_line and not skipping:
+                yield block_offset, [incomplete_line]
+            return
+
+        raw_lines = (incomplete_line + block).splitlines(True) if incomplete_line else block.splitlines(True)
+
+        # The last line may continue in the next block (even a line ending with \r may be followed by \n)
+        incomplete_line = raw_lines.pop()
+
+        if max_line_length and raw_lines and max(map(len, raw_lines)) > max_line_length:
+            for truncated_block in __truncate_lines(block_offset, raw_lines, max_line_length, scan):
+                yield truncated_block
+        elif raw_lines:
+            yield block_offset, raw_lines
+
+        block_offset += sum(map(len, raw_lines))
+
+        if max_line_length and len(incomplete_line) > max_line_length:
+            yield block_offset, [incomplete_line[:max_line_length] + b"\n"]
+            scan.diagnostics["truncated_lines"] = scan.diagnostics.get("truncated_lines", 0) + 1
+
+            block_offset += len(incomplete_line)
+            # Only the rest of a line without line break is in the next blocks
+            skipping = not incomplete_line.endswith((b"\n", b"\r"))
+            skip_newline = incomplete_line.endswith(b"\r")
+            incomplete_line = b""
+
+
+def __scan_log_blocks(blocks, scan, extractors, prefix_regex, dispatch):
+    """
+    Feeds the lines of a log to the extractors until all of them are complete
+    :param blocks: Tuples (byte offset of the first line, list of raw lines) as returned by __read_log_blocks
+    :param scan: LogScan of the log
+    :param extractors: LogExtractor objects
+    :param prefix_regex: Compiled prefix pattern as returned by get_prefix_scanner
+    :param dispatch: Dispatch table as returned by get_prefix_scanner
+    """
+
+    line_number = scan.line_number
+
+    for block_offset, raw_lines in blocks:
+        next_offset = block_offset
+
+        for raw_line in raw_lines:
+            line_number += 1
+            line_offset = next_offset
+            next_offset += len(raw_line)
+
+            sanitized_line = __strip_meta_characters_raw(raw_line)
+
+            prefix_match = prefix_regex.match(sanitized_line)
+            if prefix_match is None:
+                continue
+
+            scan.line_number = line_number
+            scan.offset = line_offset
+            scan.next_offset = next_offset
+
+            line = sanitized_line.decode("ascii")
+            lower_line = line.lower()
+
+            for position in dispatch[prefix_match.group(0).lower()]:
+                extractors[position].feed(line, lower_line, scan)
+
+            if all(extractor.complete for extractor in extractors):
+                return
+
+    scan.line_number = line_number
+
+
+class _MappedLogRange:
+    """Reads a byte range of a memory-mapped log like a file opened in binary mode"""
+
+    def __init__(self, log_map, start_offset, end_offset):
+        self.log_map = log_map
+        self.position = start_offset
+        self.end_offset = end_offset
+
+    def read(self, size):
+        if travis_io.io_throttle is not None and self.position < self.end_offset:
+            travis_io.io_throttle.acquire(min(size, self.end_offset - self.position))
+
+        block = self.log_map[self.position:min(self.position + size, self.end_offset)]
+        self.position += len(block)
+        return block
+
+
+def get_log_chunks(log_file_path, chunk_bytes):
+    """
+    Splits a log into byte ranges of about chunk_bytes bytes that begin at the beginning of a line
+    :param log_file_path: Path of the log file
+    :param chunk_bytes: Desired chunk size in bytes, at least min_chunk_bytes are used
+    :return: List of tuples (start offset, end offset), the end offset is exclusive
+    """
+
+    chunk_bytes = max(chunk_bytes, min_chunk_bytes)
+    chunks = []
+
+    with open(log_file_path, "rb") as log:
+        log_size = os.fstat(log.fileno()).st_size
+
+        if log_size == 0:
+            return [(0, 0)]
+
+        with mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ) as log_map:
+            start_offset = 0
+
+            while start_offset < log_size:
+                end_offset = start_offset + chunk_bytes
+
+                if end_offset >= log_size:
+                    end_offset = log_size
+                elif log_map[end_offset - 1:end_offset] == b"\r":
+                    # A line begins at end_offset, unless it splits a \r\n
+                    if log_map[end_offset:end_offset + 1] == b"\n":
+                        end_offset += 1
+                else:
+                    # Move the end after the next line break (\r, \n or \r\n)
+                    newline = log_map.find(b"\n", end_offset)
+                    carriage_return = log_map.find(b"\r", end_offset, newline if newline != -1 else log_size)
+
+                    if carriage_return != -1:
+                        end_offset = carriage_return + 2 if newline == carriage_return + 1 else carriage_return + 1
+                    elif newline != -1:
+                        end_offset = newline + 1
+                    else:
+                        end_offset = log_size
+
+                chunks.append((start_offset, end_offset))
+                start_offset = end_offset
+
+    return chunks
+
+
+def scan_log_chunk(log_file_path, parser_error_logger, start_offset, end_offset, extractor_names,
+                   epoch_timestamps=False, fold_index=False, max_line_length=None, max_rss_bytes=None):
+    """
+    Scans a chunk of a log, run in a separate process by parse_job_log_file. The chunk is read from a memory map
+    of the log.
+    :param log_file_path: Path of the log file
+    :param parser_error_logger: Logger for parsing errors
+    :param start_offset: Byte offset of the beginning of the chunk, at the beginning of a line
+    :param end_offset: Byte offset after the end of the chunk, at the beginning of a line or the end of the log
+    :param extractor_names: Names of the extractors to run
+    :param epoch_timestamps: Option epoch_timestamps of the extractors
+    :param fold_index: Whether the fold index extractor collects folds
+    :param max_line_length: Lines longer than this are truncated, None for no limit
+    :param max_rss_bytes: Maximum growth of the worker's resident set size in bytes while scanning the chunk, None
+                          for no limit
+    :return: Tuple (dict of extractor name -> extractor, scan diagnostics, number of lines in the chunk)
+    """
+
+    extractor_names, prefix_regex, dispatch = get_prefix_scanner(extractor_names)
+    extractors = [EXTRACTORS[name](epoch_timestamps=epoch_timestamps, fold_index=[] if fold_index else None)
+                  for name in extractor_names]
+    scan = LogScan(log_file_path, parser_error_logger)
+
+    with open(log_file_path, "rb") as log:
+        with mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ) as log_map:
+            if hasattr(log_map, "madvise"):
+                log_map.madvise(mmap.MADV_SEQUENTIAL)
+
+            __scan_log_blocks(__read_log_blocks(_MappedLogRange(log_map, start_offset, end_offset), scan,
+                                                max_line_length, max_rss_bytes, start_offset),
+                              scan, extractors, prefix_regex, dispatch)
+
+    return dict(zip(extractor_names, extractors)), scan.diagnostics, scan.line_number
+
+
+def __scan_log_chunks(chunk_executor, chunks, scan, extractor_names, epoch_timestamps, fold_index, max_line_length,
+                      max_rss_bytes):
+    """
+    Scans the chunks of a log in parallel and reduces the results. All extractors run on the first chunk, only the
+    reducible ones on the others; their states are merged in log order.
+    :return: List of extractors in the order of extractor_names
+    """
+
+    reducible_names = set(name for name in extractor_names if EXTRACTORS[name].reducible)
+
+    futures = [chunk_executor.submit(scan_log_chunk, scan.log_file_path, scan.parser_error_logger, start_offset,
+                                     end_offset, set(extractor_names) if position == 0 else reducible_names,
+                                     epoch_timestamps, fold_index is not None, max_line_length, max_rss_bytes)
+               for position, (start_offset, end_offset) in enumerate(chunks)]
+
+    extractors, diagnostics, line_count = futures[0].result()
+
+    for future in futures[1:]:
+        chunk_extractors, chunk_diagnostics, chunk_line_count = future.result()
+
+        for name, chunk_extractor in chunk_extractors.items():
+            extractors[name].merge(chunk_extractor, line_count)
+
+        for name, value in chunk_diagnostics.items():
+            if name == "malformed_markers":
+                malformed_markers = diagnostics.setdefault(name, {})
+                for category, count in value.items():
+                    malformed_markers[category] = malformed_markers.get(category, 0) + count
+            else:
+                diagnostics[name] = diagnostics.get(name, 0) + value
+
+        line_count += chunk_line_count
+
+    scan.diagnostics.update(diagnostics)
+    scan.line_number = line_count
+
+    if fold_index is not None and FoldIndexExtractor.name in extractors:
+        fold_index.extend(extractors[FoldIndexExtractor.name].options["fold_index"])
+
+    return [extractors[name] for name in extractor_names]
+
+
+def parse_job_log_file(log_file_path, parser_error_logger, epoch_timestamps=False, columns=None, log_content=None,
+                       max_line_length=None, max_rss_bytes=None, max_file_bytes=None, fold_index=None,
+                       diagnostics=None, chunk_bytes=None, chunk_executor=None, job_key=None,
+                       quarantine_logger=quarantine_logger):
+    """
+    Parses a job log file with the registered extractors in a single scan
+    :param log_file_path: Path of the log file
+    :param parser_error_logger: Logger for parsing errors
+    :param epoch_timestamps: Report step_first_start and step_last_end as seconds since the epoch
+    :param columns: CSV column names that will be output, extractors not needed for them are skipped
+    :param log_content: Content of the log if it is not read from log_file_path (e.g. streamed via stdin)
+    :param max_line_length: Lines longer than this are truncated, None for no limit
+    :param max_rss_bytes: Files are quarantined if the worker's RSS grows by more than this while parsing them, None
+                          for no limit
+    :param max_file_bytes: Larger files are quarantined without parsing them, None for no limit
+    :param fold_index: List to which the folds of the log are appended (see FoldIndexExtractor), None to skip them
+    :param diagnostics: Dict that is filled with the problems found in the log: malformed_markers (count per
+                        category), truncated_lines, filename_error, quarantined (reason) and error (message of any
+                        other exception); None to skip them
+    :param chunk_bytes: Logs of at least twice this size are split into chunks that are scanned in parallel on
+                        chunk_executor, None to scan all logs in a single pass
+    :param chunk_executor: Executor (e.g. a ProcessPoolExecutor) running the chunk scans, None to scan all logs in a
+                           single pass
+    :param job_key: Tuple (build_number, commit_hash, job_id) as returned by parse_log_file_name, None to parse it
+                    from log_file_path
+    :param quarantine_logger: Logger recording the files exceeding the limits, by default the quarantine log
+    :return: TravisJob object or None
+    """
 
     job = None
+    scan = LogScan(log_file_path, parser_error_logger)
+
+    if diagnostics is None:
+        diagnostics = {}
 
-    if os.path.isfile(log_file_path):
-
-        # Initialization
-        job_build_id = None
-        job_startup_duration = None
-        job_worker_hostname = None
-        job_worker_version = None
-        job_worker_instance = None
-        job_os_dist_id = None
-        job_os_dist_release = None
-        job_os_description = None
-        job_build_language = None
-        job_using_worker_header = None
-        job_travis_fold_worker_info = False
-        job_travis_fold_system_info = False
-        job_travis_fold_count = 0
-        job_step_first_start = None
-        job_step_last_end = None
-        job_duration_aggregated_timestamp = None
-        job_duration_diff_timestamp = None
+    if log_content is None and not os.path.isfile(log_file_path):
+        diagnostics["error"] = "Log file not found: " + log_file_path
+
+    else:
 
         try:
-            job = __extract_job_base(log_file_path)
-
-            first_line = True
-            os_details_coming = False
-            worker_details_coming = False
-            build_system_details_coming = False
-
-            with open(log_file_path, "r") as log:
-                for raw_line in log:
-                    line = __strip_meta_characters(raw_line)
-                    lower_line = line.lower()
-
-                    if lower_line == '':
-                        continue
-
-                    # Worker Header
-                    if first_line and lower_line.startswith("using worker"):
-                        job_using_worker_header = True
-                        job_worker_hostname = line.split(' ')[2]
-                        first_line = False
-
-                    # Fold count
-                    elif lower_line.startswith("travis_fold:start"):
-                        job_travis_fold_count += 1
-
-                    # OS Info
-                    elif lower_line.startswith("Operating System Details"):
-                        os_details_coming = True
-                        worker_details_coming = False
-                        build_system_details_coming = False
-
-                    # Worker Info
-                    elif lower_line.startswith("worker information"):
-                        os_details_coming = False
-                        worker_details_coming = True
-
-                    # Build System Info
-                    elif lower_line.startswith("build system information"):
-                        build_system_details_coming = True
-
-                    # System Info
-                    elif lower_line.startswith("travis_fold:start:system_info"):
-                        job_travis_fold_system_info = True
-
-                    # End of System Info
-                    elif lower_line.startswith("travis_fold:end:system_info"):
-                        os_details_coming = False
-
-                    # Worker Info
-                    elif lower_line.startswith("travis_fold:start:worker_info"):
-                        job_travis_fold_worker_info = True
-
-                    # End of Worker Info
-                    elif lower_line.startswith("travis_fold:end:worker_info"):
-                        worker_details_coming = False
-
-                    # Startup time
-                    elif lower_line.startswith("startup:"):
-                        job_startup_duration = \
-                            int(__extract_startup_duration(line.split(' ')[1]))
-
-                    elif lower_line.startswith("travis_time:end"):
-                        colon_split = line.split(':')
-                        valid_time_end = False
-
-                        # Valid entries contain all three keywords
-                        if 'start' and 'finish' and 'duration' in lower_line:
-
-                            # Some entries contain 3 and some 4 colons
-                            if len(colon_split) == 4:
-                                timings = line.split(':')[3]
-                                valid_time_end = True
-
-                            elif len(colon_split) == 3:
-                                timings = line.split(',')[1]
-                                valid_time_end = True
-
-                        if not valid_time_end:
-                            parser_error_logger.warning("Invalid travis_time:end line in " + log_file_path + "\n> " + line)
-                        else:
-                            start_timings = timings.split(',')[0]
-                            start_value_x = start_timings.split('=')[1]
-                            if start_value_x.isdigit():
-                                start_value = int(start_value_x)
-
-                            finish_timings = timings.split(',')[1]
-                            finish_value_x = finish_timings.split('=')[1]
-                            if finish_value_x.isdigit():
-                                finish_value = int(finish_value_x)
-
-                            duration_timings = timings.split(',')[2]
-                            duration_value_x = duration_timings.split('=')[1]
-                            if duration_value_x.isdigit():
-                                duration_value = int(duration_value_x)
-
-                                # Milliseconds
-                                duration_value_ms = duration_value / 1000000
-
-                                if job_duration_aggregated_timestamp is None:
-                                    job_duration_aggregated_timestamp = duration_value_ms
-                                else:
-                                    job_duration_aggregated_timestamp += duration_value_ms
-
-                            if job_step_first_start is None:
-                                job_step_first_start = __convert_timestamp_to_datetime(start_value)
-
-                            job_step_last_end = __convert_timestamp_to_datetime(finish_value)
-
-                            if job_step_first_start is None or job_step_last_end is None:
-                                job_duration_diff_timestamp = None
-                            else:
-                                job_duration_diff_timestamp = (job_step_last_end - job_step_first_start).total_seconds()
-
-                    # System/OS Details
-                    if os_details_coming:
-                        if lower_line.startswith("description:"):
-                            job_os_description = line.split(":")[1]
-                        elif lower_line.startswith("distributor id"):
-                            job_os_dist_id = line.split(":")[1]
-                        elif lower_line.startswith("release:"):
-                            job_os_dist_release = line.split(":")[1]
-                        elif lower_line.startswith("build language") and job_build_language is None:
-                            job_build_language = line.split(":")[1]
-
-                    # Worker Details
-                    if worker_details_coming:
-                        if lower_line.startswith("hostname:"):
-                            job_worker_hostname = line.split(':')[1]
-
-                        if lower_line.startswith("version:"):
-                            job_worker_version = " ".join(line.split(' ')[1:])
-
-                        if lower_line.startswith("instance:"):
-                            job_worker_instance = line.split(' ')[1]
-
-                    # Build System Details
-                    if build_system_details_coming:
-                        if lower_line.startswith("build id:"):
-                            job_build_id = line.split(':')[1]
-                        if lower_line.startswith("build language:") and job_build_language is None:
-                            job_build_language = line.split(':')[1]
-
-                job.assign_properties(
-                                      build_id=job_build_id,
-                                      startup_duration=job_startup_duration,
-                                      worker_hostname=job_worker_hostname,
-                                      worker_version=job_worker_version,
-                                      worker_instance=job_worker_instance,
-                                      os_dist_id=job_os_dist_id,
-                                      os_dist_release=job_os_dist_release,
-                                      os_description=job_os_description,
-                                      build_language=job_build_language,
-                                      using_worker_header=job_using_worker_header,
-                                      travis_fold_worker_info=job_travis_fold_worker_info,
-                                      travis_fold_system_info=job_travis_fold_system_info,
-                                      travis_fold_count=job_travis_fold_count,
-                                      step_first_start=job_step_first_start,
-                                      step_last_end=job_step_last_end,
-                                      duration_aggregated_timestamp=job_duration_aggregated_timestamp,
-                                      duration_diff_timestamp=job_duration_diff_timestamp
-                                      )
+            job = __extract_job_base(log_file_path, job_key)
+
+            required_extractors = get_required_extractors(columns)
+            if fold_index is not None:
+                required_extractors.add(FoldIndexExtractor.name)
+
+            extractor_names, prefix_regex, dispatch = get_prefix_scanner(required_extractors)
+
+            if not extractor_names:
+                return job
+
+            if max_file_bytes is not None and log_content is None \
+                    and os.path.getsize(log_file_path) > max_file_bytes:
+                raise LogLimitExceeded(log_file_path, "file size {} bytes exceeds {}".format(
+                    os.path.getsize(log_file_path), max_file_bytes))
+
+            chunks = None
+
+            # Chunks only pay off if an extractor reads the whole log
+            if chunk_bytes and chunk_executor is not None and log_content is None \
+                    and os.path.getsize(log_file_path) >= 2 * max(chunk_bytes, min_chunk_bytes) \
+                    and any(EXTRACTORS[name].reducible for name in extractor_names):
+                chunks = get_log_chunks(log_file_path, chunk_bytes)
+
+            if chunks is not None and len(chunks) > 1:
+                extractors = __scan_log_chunks(chunk_executor, chunks, scan, extractor_names, epoch_timestamps,
+                                               fold_index, max_line_length, max_rss_bytes)
+            else:
+                extractors = [EXTRACTORS[name](epoch_timestamps=epoch_timestamps, fold_index=fold_index)
+                              for name in extractor_names]
+
+                with __open_log(log_file_path, log_content) as log:
+                    __scan_log_blocks(__read_log_blocks(log, scan, max_line_length, max_rss_bytes), scan,
+                                      extractors, prefix_regex, dispatch)
+
+            properties = {}
+            for extractor in extractors:
+                for field, value in extractor.get_fields().items():
+                    if properties.get(field) is None:
+                        properties[field] = value
+
+            job.assign_properties(**{field: properties.get(field) for field in TravisJob.FIELDS[3:]})
+
+            if scan.diagnostics.get("truncated_lines"):
+                parser_error_logger.warning("Truncated " + str(scan.diagnostics["truncated_lines"])
+                                            + " line(s) longer than " + str(max_line_length) + " in "
+                                            + log_file_path)
+
+        except LogFileNameError as e:
+            parser_error_logger.warning(e)
+            diagnostics["filename_error"] = str(e)
+
+        except LogLimitExceeded as e:
+            parser_error_logger.warning(e)
+            quarantine_logger.warning(log_file_path + "\t" + e.reason)
+            diagnostics["quarantined"] = e.reason
+            job = None
+
+        except MemoryError:
+            parser_error_logger.warning("Out of memory while parsing " + log_file_path)
+            quarantine_logger.warning(log_file_path + "\tout of memory")
+            diagnostics["quarantined"] = "out of memory"
+            job = None
 
         except Exception as e:
             parser_error_logger.warning(e)
+            diagnostics["error"] = str(e)
+
+    diagnostics.update(scan.diagnostics)
 
-        return job
+    return job
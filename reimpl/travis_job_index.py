@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+
+import csv
+import getopt
+import os
+import sqlite3
+import sys
+import time
+
+# Seconds to wait for other workers holding the write lock
+index_timeout = 300
+
+
+def open_index(index_file):
+    """
+    Opens (and if necessary creates) the job index, a SQLite database with B-tree indices on job_id, commit_hash
+    and (project, build_number)
+    :param index_file: Path of the index database
+    :return: sqlite3 connection
+    """
+
+    connection = sqlite3.connect(index_file, timeout=index_timeout)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript("""
+        CREATE TABLE IF NOT EXISTS projects (
+            project TEXT PRIMARY KEY,
+            csv_file TEXT,
+            csv_header TEXT
+        );
+        CREATE TABLE IF NOT EXISTS jobs (
+            project TEXT,
+            build_number INTEGER,
+            commit_hash TEXT,
+            job_id INTEGER,
+            csv_row TEXT
+        );
+        CREATE INDEX IF NOT EXISTS jobs_job_id ON jobs (job_id);
+        CREATE INDEX IF NOT EXISTS jobs_commit_hash ON jobs (commit_hash);
+        CREATE INDEX IF NOT EXISTS jobs_project_build_number ON jobs (project, build_number);
+    """)
+
+    return connection
+
+
+def __to_int_or_none(value):
+    return int(value) if value.isdigit() else None
+
+
+def get_project_from_csv_file(csv_file):
+    """
+    Derives the project name from the name of a per-project CSV file (org@name.csv)
+    :param csv_file: Per-project CSV file path
+    :return: Project name (org/name), None if the file name does not match the project folder format
+    """
+
+    project_folder_name = os.path.splitext(os.path.basename(csv_file))[0]
+
+    if "@" not in project_folder_name:
+        return None
+
+    return project_folder_name.replace("@", "/", 1)
+
+
+def index_project_csv(index_file, csv_file):
+    """
+    Replaces the index entries of the project(s) contained in a per-project CSV file. The project is taken from the
+    file name, so that re-indexing a CSV without rows removes the stale entries of its project.
+    :param index_file: Path of the index database
+    :param csv_file: Per-project CSV file as written by process_project_folder
+    :return: Number of indexed rows
+    """
+
+    with open(csv_file, "r") as project_csv:
+        csv_header = project_csv.readline()
+        columns = next(csv.reader([csv_header]))
+
+        if not {"project", "build_number", "commit_hash", "job_id"}.issubset(columns):
+            raise ValueError("Cannot index {}: project, build_number, commit_hash and job_id columns are required"
+                             .format(csv_file))
+
+        project_column = columns.index("project")
+        build_number_column = columns.index("build_number")
+        commit_hash_column = columns.index("commit_hash")
+        job_id_column = columns.index("job_id")
+
+        entries = []
+        for csv_row in project_csv:
+            values = next(csv.reader([csv_row]))
+            entries.append((values[project_column],
+                            __to_int_or_none(values[build_number_column]),
+                            values[commit_hash_column],
+                            __to_int_or_none(values[job_id_column]),
+                            csv_row.rstrip("\n")))
+
+    projects = set(entry[0] for entry in entries)
+
+    csv_project = get_project_from_csv_file(csv_file)
+    if csv_project is not None:
+        projects.add(csv_project)
+
+    connection = open_index(index_file)
+    try:
+        with connection:
+            for project in projects:
+                connection.execute("DELETE FROM jobs WHERE project = ?", (project,))
+                connection.execute("INSERT OR REPLACE INTO projects VALUES (?, ?, ?)",
+                                   (project, csv_file, csv_header.rstrip("\n")))
+            connection.executemany("INSERT INTO jobs VALUES (?, ?, ?, ?, ?)", entries)
+    finally:
+        connection.close()
+
+    return len(entries)
+
+
+def query_index(index_file, job_id=None, commit_hash=None, project=None, build_number=None):
+    """
+    Looks up extracted rows by job_id, commit_hash or project (and build_number)
+    :param index_file: Path of the index database
+    :return: List of tuples (csv_header, csv_row)
+    """
+
+    conditions = []
+    parameters = []
+
+    if job_id is not None:
+        conditions.append("jobs.job_id = ?")
+        parameters.append(job_id)
+    if commit_hash is not None:
+        conditions.append("jobs.commit_hash = ?")
+        parameters.append(commit_hash)
+    if project is not None:
+        conditions.append("jobs.project = ?")
+        parameters.append(project)
+    if build_number is not None:
+        conditions.append("jobs.build_number = ?")
+        parameters.append(build_number)
+
+    if not conditions:
+        raise ValueError("At least one of job_id, commit_hash or project is required")
+
+    connection = open_index(index_file)
+    try:
+        return connection.execute(
+            "SELECT projects.csv_header, jobs.csv_row FROM jobs JOIN projects ON jobs.project = projects.project "
+            "WHERE " + " AND ".join(conditions) + " ORDER BY jobs.project, jobs.build_number, jobs.job_id",
+            parameters).fetchall()
+    finally:
+        connection.close()
+
+
+def main(argv):
+    tool_name = "travis_job_index.py"
+    tool_params = " -x <index_file> [-j <job_id>] [-c <commit_hash>] [-p <org/name>] [-b <build_number>]"
+    usage_string = "Usage: " + tool_name + tool_params
+
+    index_file = None
+    query = {}
+
+    try:
+        opts, args = getopt.getopt(argv, "hx:j:c:p:b:", ["index=", "job=", "commit=", "project=", "build="])
+    except getopt.GetoptError:
+        print(usage_string)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == '-h':
+            print(usage_string)
+            sys.exit()
+        elif opt in ("-x", "--index"):
+            index_file = arg
+        elif opt in ("-j", "--job"):
+            query["job_id"] = int(arg)
+        elif opt in ("-c", "--commit"):
+            query["commit_hash"] = arg
+        elif opt in ("-p", "--project"):
+            query["project"] = arg
+        elif opt in ("-b", "--build"):
+            query["build_number"] = int(arg)
+
+    if index_file is None or not ({"job_id", "commit_hash", "project"} & set(query)):
+        print(usage_string)
+        sys.exit(2)
+
+    start_time = time.time()
+    results = query_index(index_file, **query)
+    query_duration = time.time() - start_time
+
+    last_header = None
+    for csv_header, csv_row in results:
+        if csv_header != last_header:
+            print(csv_header)
+            last_header = csv_header
+        print(csv_row)
+
+    print("{} row(s) in {:.3f} ms".format(len(results), query_duration * 1000), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+
+from array import array
+import calendar
+from datetime import datetime
+from multiprocessing import shared_memory
+
+from travis_dictionary import NULL_CODE, StringDictionary
+import travis_job
+from travis_job import TravisJob
+from travis_project import TravisProject
+
+# Null markers for the fixed-width columns
+NULL_INT = -2 ** 63
+NULL_BOOL = -1
+
+# (column name, array typecode, kind) in output order; kind is one of int, bool, str, dict or datetime. In a shared
+# memory block, dict columns hold codes of the travis_job.field_dictionary entries used by the block and str columns
+# codes of a per-block string table. The kinds match the types of the TravisJob fields, so that rows are output
+# exactly like the project CSVs.
+TABLE_COLUMNS = [
+    ("project", "i", "str"),
+    ("build_number", "q", "int"),
+    ("commit_hash", "i", "str"),
+    ("job_id", "q", "int"),
+    ("build_id", "q", "int"),
+    ("startup_duration", "q", "int"),
+    ("worker_hostname", "i", "dict"),
+    ("worker_version", "i", "dict"),
+    ("worker_instance", "i", "str"),
+    ("os_dist_id", "i", "dict"),
+    ("os_dist_release", "i", "dict"),
+    ("os_description", "i", "dict"),
+    ("build_language", "i", "dict"),
+    ("using_worker_header", "b", "bool"),
+    ("travis_fold_worker_info", "b", "bool"),
+    ("travis_fold_system_info", "b", "bool"),
+    ("travis_fold_count", "q", "int"),
+    ("step_first_start", "q", "datetime"),
+    ("step_last_end", "q", "datetime"),
+    ("duration_aggregated_timestamp", "q", "int"),
+    ("duration_diff_timestamp", "i", "str"),
+]
+
+
+def _encode_value(value, kind, string_table):
+    if kind == "str":
+        return string_table.encode(value)
+    elif value is None:
+        if kind == "bool":
+            return NULL_BOOL
+        else:
+            return NULL_INT
+    elif kind == "datetime":
+        return calendar.timegm(value.utctimetuple()) if isinstance(value, datetime) else int(value)
+    else:
+        return int(value)
+
+
+def _decode_value(value, kind, string_table, dictionary, epoch_timestamps=False):
+    if kind == "str":
+        return string_table.decode(value)
+    elif kind == "dict":
+        return dictionary.decode(value)
+    elif kind == "bool":
+        return None if value == NULL_BOOL else bool(value)
+    elif value == NULL_INT:
+        return None
+    elif kind == "datetime" and not epoch_timestamps:
+        return datetime.utcfromtimestamp(value)
+    else:
+        return value
+
+
+def write_jobs_to_shared_memory(project, jobs):
+    """
+    Writes jobs column by column into a shared memory block
+    :param project: Project name (org/name) stored with every row
+    :param jobs: List of TravisJob objects
+    :return: Descriptor (shm_name, row_count, strings, dictionary strings) to be passed to the parent process, the
+             dictionary strings are the field_dictionary entries used by the jobs
+    """
+
+    string_table = StringDictionary()
+    # field_dictionary code -> block code, only the entries used by the jobs are passed to the parent process
+    dictionary_codes = {}
+    columns = []
+
+    for name, typecode, kind in TABLE_COLUMNS:
+        if name == "project":
+            values = [string_table.encode(project)] * len(jobs)
+        elif kind == "dict":
+            values = [NULL_CODE if code == NULL_CODE else dictionary_codes.setdefault(code, len(dictionary_codes))
+                      for code in (job.get_code(name) for job in jobs)]
+        else:
+            values = [_encode_value(getattr(job, name), kind, string_table) for job in jobs]
+        columns.append(array(typecode, values))
+
+    size = sum(len(column) * column.itemsize for column in columns)
+
+    dictionary_strings = [travis_job.field_dictionary.decode(code) for code in dictionary_codes]
+
+    if size == 0:
+        return None, 0, string_table.strings, dictionary_strings
+
+    shm = shared_memory.SharedMemory(create=True, size=size)
+
+    offset = 0
+    for column in columns:
+        column_bytes = len(column) * column.itemsize
+        shm.buf[offset:offset + column_bytes] = column.tobytes()
+        offset += column_bytes
+
+    shm_name = shm.name
+    shm.close()
+
+    # The block stays registered with the resource tracker shared with the parent process (see collect_input_folder),
+    # which unlinks it once copied, or on exit if it was never copied
+    return shm_name, len(jobs), string_table.strings, dictionary_strings
+
+
+def release_shared(descriptor):
+    """
+    Releases a block written by write_jobs_to_shared_memory without copying it
+    :param descriptor: Descriptor returned by write_jobs_to_shared_memory
+    """
+
+    shm_name = descriptor[0]
+
+    if shm_name is None:
+        return
+
+    try:
+        shm = shared_memory.SharedMemory(name=shm_name)
+    except FileNotFoundError:
+        # Already released
+        return
+
+    shm.close()
+    shm.unlink()
+
+
+class JobTable:
+    """
+    Column-wise storage for jobs assembled from shared memory blocks of several workers. Timestamps are stored as
+    seconds since the epoch, epoch_timestamps decides whether they are output as such or as datetime.
+    """
+
+    def __init__(self, epoch_timestamps=False):
+        self.__epoch_timestamps = epoch_timestamps
+        self.__columns = [array(typecode) for name, typecode, kind in TABLE_COLUMNS]
+        self.__string_table = StringDictionary()
+        self.__dictionary = StringDictionary()
+
+    def __len__(self):
+        return len(self.__columns[0])
+
+    def column(self, name):
+        for (column_name, typecode, kind), column in zip(TABLE_COLUMNS, self.__columns):
+            if column_name == name:
+                return column
+
+        raise KeyError(name)
+
+    @property
+    def strings(self):
+        return self.__string_table.strings
+
+    @property
+    def dictionary(self):
+        """Dictionary for the codes stored in the dict columns"""
+        return self.__dictionary
+
+    def append_shared(self, descriptor):
+        """
+        Copies a block written by write_jobs_to_shared_memory into the table and releases the block
+        :param descriptor: Descriptor returned by write_jobs_to_shared_memory
+        :return: Number of appended rows
+        """
+
+        shm_name, row_count, strings, dictionary_strings = descriptor
+
+        if shm_name is None:
+            return 0
+
+        # Block codes are translated to table-wide codes
+        code_maps = {
+            "str": [self.__string_table.encode(value) for value in strings],
+            "dict": [self.__dictionary.encode(value) for value in dictionary_strings]
+        }
+
+        shm = shared_memory.SharedMemory(name=shm_name)
+        try:
+            offset = 0
+            for (name, typecode, kind), column in zip(TABLE_COLUMNS, self.__columns):
+                column_bytes = row_count * column.itemsize
+                block = array(typecode)
+                block.frombytes(shm.buf[offset:offset + column_bytes])
+                offset += column_bytes
+
+                if kind in code_maps:
+                    code_map = code_maps[kind]
+                    block = array(typecode, [NULL_CODE if code == NULL_CODE else code_map[code] for code in block])
+
+                column.extend(block)
+        finally:
+            shm.close()
+            shm.unlink()
+
+        return row_count
+
+    def get_row(self, index):
+        return [_decode_value(column[index], kind, self.__string_table, self.__dictionary, self.__epoch_timestamps)
+                for (name, typecode, kind), column in zip(TABLE_COLUMNS, self.__columns)]
+
+    def get_job(self, index):
+        """
+        Restores the job of a row
+        :param index: Row index
+        :return: (project name, TravisJob object)
+        """
+
+        values = dict(zip((name for name, typecode, kind in TABLE_COLUMNS), self.get_row(index)))
+        project = values.pop("project")
+
+        job = TravisJob(values.pop("build_number"), values.pop("commit_hash"), values.pop("job_id"))
+        job.assign_properties(**values)
+
+        return project, job
+
+    def get_as_csv(self, with_header=True, columns=None):
+        """
+        Formats the rows like TravisProject.get_as_csv, so the table is a drop-in replacement for the project CSVs
+        :param with_header: Output the header line first
+        :param columns: CSV column names to output, None for all columns
+        :return: Generator of CSV lines
+        """
+
+        if with_header:
+            yield TravisProject.get_csv_header(columns)
+
+        for index in range(len(self)):
+            project, job = self.get_job(index)
+            yield '"{}",{}\n'.format(project, job.get_as_csv(columns))
@@ -1,19 +1,33 @@
 #!/usr/bin/env python
 
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+import csv
 import datetime
 import getopt
 import glob
+import heapq
+import importlib.util
+import json
 import logging
+from multiprocessing import resource_tracker, util
 # from multiprocessing import Process, Queue
 import multiprocessing_logging
 import os
+import resource
 import sys
 import time
+import zlib
 
 from travis_project import TravisProject
 from travis_job import TravisJob
+import travis_io
 import travis_job_helper
+import travis_job_index
+import travis_job_table
+import travis_records
+import travis_resources
+import travis_rollup
+import travis_sampling
 
 # https://github.com/jruere/multiprocessing-logging
 multiprocessing_logging.install_mp_handler()
@@ -47,15 +61,328 @@ parsing_error_handler.setLevel(logging.WARNING)
 parsing_error_handler.setFormatter(parsing_error_formatter)
 parsing_error_logger.addHandler(parsing_error_handler)
 
+quarantine_logger = logging.getLogger("quarantine")
+quarantine_formatter = logging.Formatter('%(message)s')
+quarantine_handler = logging.FileHandler('quarantine.log')
+quarantine_handler.setLevel(logging.WARNING)
+quarantine_handler.setFormatter(quarantine_formatter)
+quarantine_logger.addHandler(quarantine_handler)
+
+# Discards the parse warnings and quarantine entries of the calibration, the workers parse the sampled logs again
+calibration_logger = logging.getLogger("calibration")
+calibration_logger.propagate = False
+calibration_logger.addHandler(logging.NullHandler())
+
+# Shard of the log files this process is responsible for as (index, count), None processes everything
+shard = None
+
+# Keyword arguments passed on to travis_job_helper.parse_job_log_file
+parse_options = {"max_line_length": 1024 * 1024}
+
+# CSV columns to output, None outputs all columns
+output_columns = None
+
+# Job index updated whenever a project CSV is written, None disables indexing
+index_file = None
+
+# Worker settings given on the command line (workers, prefetch, batch_bytes), the others are calibrated
+worker_settings = {}
+
+# Maximum number and total size of the logs parsed by the calibration of the worker settings
+calibration_sample_size = 16
+calibration_sample_bytes = 64 * 1024 * 1024
+
+# Size of the pool this process belongs to, set by the pool initializer (see create_worker_pool), 1 outside of pools
+pool_workers = 1
+
+# Pool of this process scanning the chunks of large logs (see get_chunk_executor), created on first use
+chunk_executor = None
+
+# Write a fold index (<project>.folds.csv) next to each project CSV
+fold_index_enabled = False
+
+# Additionally write one record per log with fields and parse diagnostics (ndjson or arrow), None for no records
+record_format = None
+
+# Header of the fold index files
+FOLD_INDEX_HEADER = "build_number,job_id,fold,start_line,end_line,start_offset,end_offset,log_file\n"
+
+# Sampling mode as dict with sample_rate or sample_count and seed, None parses every log
+sampling = None
+
+# File name of the estimates written by the sampling mode, sharded runs add the shard to the name
+sample_estimates_file = "sample_estimates.json"
+
+# File name of the rejected log file names per project
+rejected_log_files_file = "rejected_log_files.json"
+
+# File name of the resource report of a run, sharded runs add the shard to the name
+resource_report_file = "resource_report.json"
+
+# File name of the rollups merged over all projects, sharded runs add the shard to the name
+corpus_summary_file = "corpus_summary.json"
+
 
 def extract_project(project_folder_name):
     project_folder_name_split = project_folder_name.split('@')
     return TravisProject(project_folder_name_split[0], project_folder_name_split[1])
 
 
-def process_project_folder(project_folder):
+def parse_shard(shard_string):
+    """
+    Parses a shard specification of the form i/N
+    :param shard_string: Shard specification, e.g. "0/4"
+    :return: Tuple (shard_index, shard_count)
+    """
+
+    shard_split = shard_string.split('/')
+
+    if len(shard_split) != 2 or not shard_split[0].isdigit() or not shard_split[1].isdigit():
+        raise ValueError("Shard format error in {}. Expected i/N.".format(shard_string))
+
+    shard_index = int(shard_split[0])
+    shard_count = int(shard_split[1])
+
+    if shard_count < 1 or shard_index >= shard_count:
+        raise ValueError("Shard index out of range in {}.".format(shard_string))
+
+    return shard_index, shard_count
+
+
+def is_in_shard(project_folder_name, log_file, shard_index, shard_count):
+    """
+    Deterministically assigns a log file to a shard based on a stable hash of project and job id
+    :param project_folder_name: Project folder name (org@name)
+    :param log_file: Log file path
+    :param shard_index: Index of the shard to check
+    :param shard_count: Total number of shards
+    :return: True if the log file belongs to the shard
+    """
+
+    # Fall back to the whole file name if it does not follow the build_commit_job pattern
+    log_file_name = os.path.splitext(os.path.basename(log_file))[0]
+    log_file_split = log_file_name.split('_')
+    job_key = log_file_split[2] if len(log_file_split) > 2 else log_file_name
+
+    # crc32 instead of hash() as the latter is salted per interpreter
+    shard_hash = zlib.crc32((project_folder_name + '/' + job_key).encode('utf-8'))
+
+    return shard_hash % shard_count == shard_index
+
+
+def get_project_output_file(project_folder_name, project_shard=None):
+    if project_shard is None:
+        return output_file + os.sep + project_folder_name + ".csv"
+    else:
+        return output_file + os.sep + "{}.shard-{}-of-{}.csv".format(project_folder_name, *project_shard)
+
+
+def get_fold_index_file(project_folder_name, project_shard=None):
+    # Named like a project of its own, so that shard outputs are merged the same way
+    return get_project_output_file(project_folder_name + ".folds", project_shard)
+
+
+def get_record_file_base(project_folder_name, project_shard=None):
+    # Extension is added by the record writer
+    return os.path.splitext(get_project_output_file(project_folder_name, project_shard))[0] + ".records"
+
+
+def get_project_summary_file(project_folder_name, project_shard=None):
+    return os.path.splitext(get_project_output_file(project_folder_name, project_shard))[0] + ".summary.json"
+
+
+def get_shard_file_name(file_name, project_shard=None):
+    # Inserts the shard before the extension, like the shard outputs of a project
+    if project_shard is None:
+        return file_name
+
+    return "{}.shard-{}-of-{}{}".format(os.path.splitext(file_name)[0], project_shard[0], project_shard[1],
+                                        os.path.splitext(file_name)[1])
+
+
+def write_fold_index(fold_index_file, fold_rows):
+    """
+    Writes the fold index of a project
+    :param fold_index_file: Path of the fold index CSV
+    :param fold_rows: Tuples (build_number, job_id, fold entry, log file) as collected by parse_project_jobs
+    """
+
+    with open(fold_index_file, "w") as csv_file:
+        csv_file.write(FOLD_INDEX_HEADER)
+
+        for build_number, job_id, (fold, start_line, end_line, start_offset, end_offset), log_file in fold_rows:
+            csv_file.write('{},{},"{}",{},{},{},{},"{}"\n'.format(
+                build_number, job_id, fold.replace('"', '""'), start_line, "" if end_line is None else end_line,
+                start_offset, "" if end_offset is None else end_offset, log_file.replace('"', '""')))
+
+
+def list_project_log_files(project_folder, project_folder_name, rejected=None):
+    """
+    Lists the log files of a project folder (restricted to the current shard) and parses the job keys from their
+    names. Files with names not matching travis_job_helper.log_file_name_regex are rejected without opening them.
+    :param project_folder: Project folder path
+    :param project_folder_name: Project folder name (org@name)
+    :param rejected: List to which the names of rejected files are appended, None to only skip them
+    :return: Dict of log file path -> job key (build_number, commit_hash, job_id), in path order
+    """
+
+    log_files = {}
+
+    for item in sorted(glob.glob(project_folder + os.sep + "*.log")):
+        try:
+            job_key = travis_job_helper.parse_log_file_name(item)
+        except travis_job_helper.LogFileNameError:
+            if rejected is not None:
+                rejected.append(os.path.basename(item))
+            continue
+
+        if os.path.isfile(item) and (shard is None or is_in_shard(project_folder_name, item, *shard)):
+            log_files[item] = job_key
+
+    return log_files
+
+
+def report_rejected_log_files(project_list):
+    """
+    Logs the rejected log file names per project and writes them to rejected_log_files_file in the output folder
+    (once for all shards, as names are rejected before sharding)
+    :param project_list: Tuples (project_folder, log_files, total size, rejected names) of discover_project_folder
+    :return: Number of rejected log files
+    """
+
+    rejected_log_files = {}
+
+    for project_folder, log_files, project_size, rejected in project_list:
+        if rejected:
+            rejected_log_files[os.path.basename(project_folder)] = rejected
+            logger.warning(os.path.basename(project_folder) + ": rejected " + str(len(rejected))
+                           + " log file(s) with invalid names, e.g. " + ", ".join(rejected[:3]))
+
+    if output_file is not None and (shard is None or shard[0] == 0):
+        with open(output_file + os.sep + rejected_log_files_file, "w") as rejected_file:
+            json.dump(rejected_log_files, rejected_file, indent=2, sort_keys=True)
+
+    return sum(len(rejected) for rejected in rejected_log_files.values())
+
+
+def parse_project_jobs(project_folder, project_folder_name, log_files=None, fold_rows=None, record_writer=None):
+    """
+    Parses all log files of a project folder (restricted to the current shard)
+    :param project_folder: Project folder path
+    :param project_folder_name: Project folder name (org@name)
+    :param log_files: Dict of log file path -> job key of the log files to parse (see list_project_log_files), None
+                      to list them from project_folder
+    :param fold_rows: List to which the fold index rows of the jobs are appended, None to skip the fold index
+    :param record_writer: Record writer (see travis_records) to which one record per log file is written as soon
+                          as it is parsed, including logs that could not be parsed; None to write no records
+    :return: Tuple (list of parsed TravisJob objects, number of log files)
+    """
+
+    if log_files is None:
+        log_files = list_project_log_files(project_folder, project_folder_name)
+
+    if record_writer is not None:
+        project = extract_project(project_folder_name)
+        project_name = project.project_org + '/' + project.project_name
+
+    jobs = []
+
+    for log_file, job_key in log_files.items():
+        fold_index = [] if fold_rows is not None else None
+        diagnostics = {}
+
+        # Large logs are scanned in chunks, if this process has spare CPUs for them
+        if parse_options.get("chunk_bytes") and os.path.getsize(log_file) \
+                >= 2 * max(parse_options["chunk_bytes"], travis_job_helper.min_chunk_bytes):
+            log_chunk_executor = get_chunk_executor()
+        else:
+            log_chunk_executor = None
+
+        job = travis_job_helper.parse_job_log_file(log_file, parsing_error_logger, fold_index=fold_index,
+                                                   diagnostics=diagnostics, chunk_executor=log_chunk_executor,
+                                                   job_key=job_key, **parse_options)
+
+        if record_writer is not None:
+            record_writer.write(travis_records.get_record(project_name, log_file, job, diagnostics, output_columns))
+
+        if job is not None:
+            jobs.append(job)
+
+            if fold_index is not None:
+                fold_rows.extend((job.build_number, job.job_id, fold_entry, log_file) for fold_entry in fold_index)
+        else:
+            logger.warning("Result of parsing was None for: " + log_file)
+
+    # Each project is a sorted run, merged outputs only need a k-way merge of these runs
+    jobs.sort(key=lambda job: (job.build_number, job.job_id))
+
+    if fold_rows is not None:
+        fold_rows.sort(key=lambda fold_row: (fold_row[0], fold_row[1], fold_row[2][1]))
+
+    return jobs, len(log_files)
+
+
+def collect_project_folder(project_folder):
+    """
+    Parses a project folder and hands the jobs to the parent through shared memory instead of pickling them
+    :param project_folder: Project folder path
+    :return: Shared memory descriptor as returned by travis_job_table.write_jobs_to_shared_memory
+    """
+
+    project_folder_name = os.path.basename(project_folder)
+
+    if "@" not in project_folder_name:
+        logger.warning('Given project folder does not match project folder format (containing @): "'
+                       + project_folder + '"')
+        return None, 0, [], []
+
+    project = extract_project(project_folder_name)
+    jobs, log_files_total = parse_project_jobs(project_folder, project_folder_name)
+
+    return travis_job_table.write_jobs_to_shared_memory(project.project_org + '/' + project.project_name, jobs)
+
+
+def collect_input_folder(input_folder):
+    """
+    Parses all projects of input_folder in parallel and assembles the jobs in a single column-wise table
+    :param input_folder: Input folder containing the project folders
+    :return: JobTable with the jobs of all projects
+    """
+
+    job_table = travis_job_table.JobTable(parse_options.get("epoch_timestamps", False))
+
+    folder_list = sorted(item for item in glob.glob(input_folder + os.sep + "*") if os.path.isdir(item))
+
+    # Started before the workers, so that they share it: blocks that are never copied are unlinked by the tracker
+    # when this process exits
+    resource_tracker.ensure_running()
+
+    with create_worker_pool(get_worker_count()) as executor:
+        pending = [executor.submit(collect_project_folder, folder) for folder in folder_list]
+
+        try:
+            # Appended in project order for a deterministic table, the blocks wait in shared memory until then
+            while pending:
+                job_table.append_shared(pending[0].result())
+                pending.pop(0)
+        finally:
+            # After a failure the blocks of the remaining projects are released instead of copied
+            for f in pending:
+                f.cancel()
+
+            for f in pending:
+                if not f.cancelled() and f.exception() is None:
+                    travis_job_table.release_shared(f.result())
+
+    logger.info("Collected " + str(len(job_table)) + " jobs from " + str(len(folder_list)) + " projects")
+
+    return job_table
+
+
+def process_project_folder(project_folder, log_files=None):
 
     start_time = time.process_time()
+    start_usage = travis_resources.get_resource_usage()
 
     log_files_processed = 0
     log_files_total = 0
@@ -69,24 +396,34 @@ def process_project_folder(project_folder):
 
         logger.info("Started processing " + project_folder_name)
 
-        log_file_list = [item for item in glob.glob(project_folder + os.sep + "*.log") if os.path.isfile(item)]
-        log_files_total = len(log_file_list)
+        fold_rows = [] if fold_index_enabled else None
 
-        jobs = []
+        if record_format is not None:
+            with travis_records.open_record_writer(record_format, get_record_file_base(project_folder_name, shard),
+                                                   output_columns) as record_writer:
+                jobs, log_files_total = parse_project_jobs(project_folder, project_folder_name, log_files,
+                                                           fold_rows, record_writer)
+        else:
+            jobs, log_files_total = parse_project_jobs(project_folder, project_folder_name, log_files, fold_rows)
 
-        for log_file in log_file_list:
-            job = travis_job_helper.parse_job_log_file(log_file, parsing_error_logger)
-
-            if job is not None:
-                jobs.append(job)
-                log_files_processed += 1
-            else:
-                logger.warning("Result of parsing was None for: " + log_file)
+        log_files_processed = len(jobs)
 
         project.assign_jobs(jobs)
 
-        with open(output_file + os.sep + project_folder_name + ".csv", "w") as csv_file:
-            csv_file.writelines(project.get_as_csv())
+        project_output_file = get_project_output_file(project_folder_name, shard)
+
+        with open(project_output_file, "w") as csv_file:
+            csv_file.writelines(project.get_as_csv(columns=output_columns))
+
+        with open(get_project_summary_file(project_folder_name, shard), "w") as summary_file:
+            json.dump(project.get_summary(), summary_file, indent=2)
+
+        if fold_rows is not None:
+            write_fold_index(get_fold_index_file(project_folder_name, shard), fold_rows)
+
+        # Shard outputs are indexed once they are merged
+        if index_file is not None and shard is None:
+            update_index(project_output_file)
 
         end_time = time.process_time()
         processing_duration = end_time - start_time
@@ -101,11 +438,232 @@ def process_project_folder(project_folder):
     if project_folder_name is "":
         logger.error("Parsing for folder " + project_folder + " failed.")
 
-    return project_folder_name, log_files_processed, log_files_total, processing_duration
+    usage = travis_resources.get_usage_delta(start_usage, travis_resources.get_resource_usage())
+
+    return project_folder_name, log_files_processed, log_files_total, processing_duration, os.getpid(), usage
+
+
+def discover_project_folder(project_folder):
+    """
+    Lists the log files of a project folder together with their total size, used for scheduling
+    :param project_folder: Project folder path
+    :return: Tuple (project_folder, dict of log file path -> job key, total size in bytes, list of rejected names)
+    """
+
+    project_folder_name = os.path.basename(project_folder)
+
+    if "@" not in project_folder_name:
+        return project_folder, None, 0, []
+
+    rejected = []
+    log_files = list_project_log_files(project_folder, project_folder_name, rejected)
+
+    return project_folder, log_files, sum(os.path.getsize(item) for item in log_files), rejected
+
+
+def init_worker(io_throttle, workers):
+    """
+    Initializes a worker process of create_worker_pool
+    :param io_throttle: I/O throttle shared with the creating process, None for unthrottled reads
+    :param workers: Size of the pool
+    """
+
+    global pool_workers
+
+    travis_io.set_io_throttle(io_throttle)
+    pool_workers = workers
+
+
+def create_worker_pool(max_workers):
+    """
+    Creates a pool of worker processes that share the I/O throttle of this process (if any)
+    :param max_workers: Number of worker processes
+    :return: ProcessPoolExecutor
+    """
+
+    return ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker,
+                               initargs=(travis_io.io_throttle, max_workers))
+
+
+def get_chunk_executor():
+    """
+    Returns the pool of this process for the chunk scans of large logs, which is created on first use and reused for
+    all following logs. Its size is this process's share of the CPUs (the usable CPUs divided by the size of the pool
+    this process belongs to), so the chunk pools of all workers together do not oversubscribe the CPUs. The pool is
+    shut down when the process exits: a pool worker joins its child processes on exit and would otherwise wait for
+    the idle chunk workers forever. The shutdown has to run before the finalizers of the pool's queues (priority 10),
+    which stop the threads feeding them.
+    :return: ProcessPoolExecutor, None if the share is less than two CPUs and chunks would not be scanned in parallel
+    """
+
+    global chunk_executor
+
+    if chunk_executor is None:
+        chunk_workers = travis_resources.get_cpu_limit() // pool_workers
+
+        if chunk_workers < 2:
+            return None
+
+        chunk_executor = create_worker_pool(chunk_workers)
+        util.Finalize(None, chunk_executor.shutdown, exitpriority=20)
+
+    return chunk_executor
+
+
+def parse_calibration_log(log_file):
+    # Parsed like in process_project_folder, large logs are scanned in a single pass without a chunk pool
+    return travis_job_helper.parse_job_log_file(log_file, calibration_logger, quarantine_logger=calibration_logger,
+                                                **parse_options)
+
+
+def get_worker_count():
+    """
+    :return: Number of worker processes given on the command line, otherwise the number of usable CPUs
+    """
+
+    return worker_settings.get("workers") or travis_resources.get_cpu_limit()
+
+
+def get_worker_settings(log_file_list):
+    """
+    Determines worker count, prefetch depth (queued tasks per worker) and initial batch size. Settings given on the
+    command line are used as they are, the others are chosen from a calibration on a sample of log_file_list
+    within the CPU and memory limits of the process.
+    :param log_file_list: Log files to calibrate on
+    :return: Dict with workers, prefetch and batch_bytes
+    """
+
+    settings = dict(worker_settings)
+    cpus = travis_resources.get_cpu_limit()
+    memory_limit = travis_resources.get_memory_limit()
+
+    calibration = None
+
+    if {"workers", "prefetch", "batch_bytes"} - set(settings) and log_file_list:
+        calibration = travis_resources.calibrate(log_file_list, parse_calibration_log, calibration_sample_size,
+                                                 max_file_bytes=parse_options.get("max_file_bytes"),
+                                                 max_sample_bytes=calibration_sample_bytes)
+        logger.info("Calibration: " + str(calibration["files"]) + " logs, " + str(calibration["bytes"])
+                    + " bytes, read " + "{:.3f}".format(calibration["read_seconds"]) + " s, parse CPU "
+                    + "{:.3f}".format(calibration["parse_cpu_seconds"]) + " s, parse RSS increase "
+                    + str(calibration["worker_rss_bytes"]) + " bytes")
+
+    # No log may be sampled if all of them exceed max_file_bytes or calibration_sample_bytes
+    if calibration is not None and calibration["files"] > 0:
+        for name, value in travis_resources.choose_settings(calibration, cpus, memory_limit).items():
+            settings.setdefault(name, value)
+    else:
+        settings.setdefault("workers", cpus)
+        settings.setdefault("prefetch", 1)
+        settings.setdefault("batch_bytes", 1024 * 1024)
+
+    logger.info("Worker settings: " + str(settings["workers"]) + " workers, prefetch " + str(settings["prefetch"])
+                + ", batch size " + str(settings["batch_bytes"]) + " bytes (CPUs: " + str(cpus)
+                + ", memory limit: " + str(memory_limit) + " bytes, given: "
+                + (", ".join(sorted(worker_settings)) or "none") + ")")
+
+    return settings
+
+
+def process_project_batch(batch):
+    """
+    Processes several project folders in one task to amortize the per-task overhead for small projects
+    :param batch: List of tuples (project_folder, log_files)
+    :return: Tuple (list of process_project_folder results, wall-clock duration of the task)
+    """
+
+    start_time = time.time()
+
+    results = [process_project_folder(project_folder, log_files) for project_folder, log_files in batch]
+
+    return results, time.time() - start_time
+
+
+def get_percentile(sorted_values, percentile):
+    if not sorted_values:
+        return 0
+
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * percentile / 100))]
+
+
+class BatchScheduler:
+    """
+    Hands out project batches longest-first (LPT) and sizes batches of small projects from observed throughput
+    """
+
+    def __init__(self, projects, max_workers, target_task_seconds=2.0, initial_batch_bytes=1024 * 1024,
+                 max_batch_projects=64, max_batch_bytes=256 * 1024 * 1024):
+        # Largest projects first so they do not dominate the tail of the run
+        self.__projects = sorted(projects, key=lambda project: (-project[2], project[0]))
+        self.__next_index = 0
+        self.__remaining_bytes = sum(project[2] for project in projects)
+        self.__max_workers = max_workers
+        self.__target_task_seconds = target_task_seconds
+        self.__batch_bytes = initial_batch_bytes
+        self.__max_batch_projects = max_batch_projects
+        self.__max_batch_bytes = max_batch_bytes
+        self.__processed_bytes = 0
+        self.__busy_seconds = 0
+
+    @property
+    def batch_bytes(self):
+        return self.__batch_bytes
+
+    def has_next(self):
+        return self.__next_index < len(self.__projects)
+
+    def next_batch(self):
+        """
+        :return: Tuple (batch for process_project_batch, size of the batch in bytes)
+        """
+
+        batch = []
+        batch_size = 0
+
+        # Leave enough batches to spread the remaining work over all workers
+        batch_bytes = min(self.__batch_bytes, self.__remaining_bytes // self.__max_workers)
+
+        while self.has_next() and len(batch) < self.__max_batch_projects:
+            project_folder, log_files, project_size = self.__projects[self.__next_index]
+
+            if batch and batch_size + project_size > batch_bytes:
+                break
+
+            batch.append((project_folder, log_files))
+            batch_size += project_size
+            self.__next_index += 1
+
+        self.__remaining_bytes -= batch_size
+
+        return batch, batch_size
+
+    def observe(self, batch_size, duration):
+        """
+        Adapts the batch size so that a batch takes about target_task_seconds with the observed throughput
+        :param batch_size: Size of a finished batch in bytes
+        :param duration: Wall-clock duration of the batch in seconds
+        """
 
+        self.__processed_bytes += batch_size
+        self.__busy_seconds += duration
+
+        if self.__processed_bytes > 0 and self.__busy_seconds > 0:
+            throughput = self.__processed_bytes / self.__busy_seconds
+            self.__batch_bytes = min(self.__max_batch_bytes,
+                                     max(64 * 1024, int(throughput * self.__target_task_seconds)))
+
+
+def process_input_folder(input_folder, max_workers=None, prefetch=None, batch_bytes=None):
+    """
+    Processes all project folders of input_folder in batches on a pool of worker processes
+    :param input_folder: Input folder containing the project folders
+    :param max_workers: Number of worker processes, None to choose it with get_worker_settings
+    :param prefetch: Number of queued batches per worker, None to choose it with get_worker_settings
+    :param batch_bytes: Initial batch size in bytes, None to choose it with get_worker_settings
+    """
 
-def process_input_folder(input_folder):
     start_time = time.time()
+    start_usage = travis_resources.get_resource_usage()
 
     projects_processed = 0
     project_count_total = 0
@@ -114,18 +672,59 @@ def process_input_folder(input_folder):
     logs_overall = 0
 
     if os.path.isdir(input_folder):
-        folder_list = [item for item in glob.glob(input_folder + os.sep + "*") if os.path.isdir(item)]
+        folder_list = sorted(item for item in glob.glob(input_folder + os.sep + "*") if os.path.isdir(item))
         project_count_total = len(folder_list)
 
-        future_list = []
+        project_list = [discover_project_folder(folder) for folder in folder_list]
 
-        with ProcessPoolExecutor(max_workers=8) as executor:
-            for folder in folder_list:
-                future_list.append(executor.submit(process_project_folder,folder))
+        for project_folder, log_files, project_size, rejected in project_list:
+            if log_files is None:
+                logger.warning('Given project folder does not match project folder format (containing @): "'
+                               + project_folder + '"')
 
-        for f in future_list:
-            project, log_files_processed, log_files_total, processing_duration = f.result()
+        log_files_rejected = report_rejected_log_files(project_list)
+
+        if max_workers is None or prefetch is None or batch_bytes is None:
+            settings = get_worker_settings([log_file for project_folder, log_files, project_size, rejected
+                                            in project_list if log_files for log_file in log_files])
+            max_workers = max_workers or settings["workers"]
+            prefetch = prefetch or settings["prefetch"]
+            batch_bytes = batch_bytes or settings["batch_bytes"]
+
+        scheduler = BatchScheduler([(project_folder, log_files, project_size)
+                                    for project_folder, log_files, project_size, rejected in project_list
+                                    if log_files is not None], max_workers, initial_batch_bytes=batch_bytes)
+
+        results = []
+        task_durations = []
+        queue_drained_time = None
+        first_idle_time = None
+
+        with create_worker_pool(max_workers) as executor:
+            pending = {}
+
+            while scheduler.has_next() or pending:
+                # Keep every worker busy plus prefetch queued batches each
+                while scheduler.has_next() and len(pending) < (1 + prefetch) * max_workers:
+                    batch, batch_size = scheduler.next_batch()
+                    pending[executor.submit(process_project_batch, batch)] = batch_size
+
+                if not scheduler.has_next() and queue_drained_time is None:
+                    queue_drained_time = time.time()
 
+                done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+
+                for f in done:
+                    batch_results, task_duration = f.result()
+                    scheduler.observe(pending.pop(f), task_duration)
+                    results.extend(batch_results)
+                    task_durations.append(task_duration)
+
+                # Once nothing is queued, every finished task leaves a worker idle
+                if queue_drained_time is not None and first_idle_time is None and len(pending) < max_workers:
+                    first_idle_time = time.time()
+
+        for project, log_files_processed, log_files_total, processing_duration, worker, usage in results:
             logs_overall_processed += log_files_processed
             logs_overall += log_files_total
 
@@ -138,24 +737,528 @@ def process_input_folder(input_folder):
 
         end_time = time.time()
         folder_processing_duration = end_time - start_time
+        tail_duration = end_time - first_idle_time if first_idle_time is not None else 0
+
+        task_durations.sort()
 
         logger.info("Projects processed: " + str(projects_processed) + '/' + str(project_count_total))
         logger.info("Processing duration: " + str(folder_processing_duration) + " seconds")
-        logger.info("Logs processed/total: " + str(logs_overall_processed) + "/" + str(logs_overall))
+        logger.info("Logs processed/total: " + str(logs_overall_processed) + "/" + str(logs_overall)
+                    + ", rejected file names: " + str(log_files_rejected))
+        logger.info("Tasks: " + str(len(task_durations)) + ", task duration p50/p95/max: "
+                    + "{:.3f}/{:.3f}/{:.3f}".format(get_percentile(task_durations, 50),
+                                                    get_percentile(task_durations, 95),
+                                                    task_durations[-1] if task_durations else 0)
+                    + " seconds, final batch size: " + str(scheduler.batch_bytes) + " bytes")
+        logger.info("Tail latency (first idle worker until end): " + "{:.3f}".format(tail_duration) + " seconds")
+
+        write_resource_report(results, {os.path.basename(project_folder): project_size
+                                        for project_folder, log_files, project_size, rejected in project_list},
+                              travis_resources.get_usage_delta(start_usage, travis_resources.get_resource_usage()),
+                              max_workers)
+
+        write_corpus_summary([get_project_summary_file(project, shard) for project, log_files_processed,
+                              log_files_total, processing_duration, worker, usage in results if project],
+                             output_file + os.sep + get_shard_file_name(corpus_summary_file, shard))
 
     else:
         logger.warning('Given folder does not exist or is not a folder: "' + input_folder + '"')
 
 
+def write_resource_report(results, project_sizes, run_usage, max_workers):
+    """
+    Writes CPU, memory and I/O usage of a run per project, per worker and in total as JSON to resource_report_file
+    in the output folder. The usage of a worker is the sum over its projects, max_rss_bytes its peak RSS. The usage
+    values of the run are those of the parent process, the CPU time and peak RSS of the workers are reported as
+    workers_user_seconds, workers_system_seconds and workers_max_rss_bytes.
+    :param results: Results of process_project_folder
+    :param project_sizes: Dict of project folder name -> size of its log files in bytes
+    :param run_usage: Usage of the parent process during the run (see travis_resources.get_usage_delta)
+    :param max_workers: Number of worker processes
+    :return: Report as dict
+    """
+
+    projects = {}
+    workers = {}
+    worker_totals = {}
+
+    for project, log_files_processed, log_files_total, processing_duration, worker, usage in results:
+        if not project:
+            continue
+
+        project_bytes = project_sizes.get(project, 0)
+        projects[project] = dict(travis_resources.get_usage_entry(usage, log_files_total, project_bytes),
+                                 worker=worker, jobs=log_files_processed)
+
+        worker_total = worker_totals.setdefault(worker, {"projects": 0, "files": 0, "bytes": 0, "usage": {}})
+        worker_total["projects"] += 1
+        worker_total["files"] += log_files_total
+        worker_total["bytes"] += project_bytes
+        travis_resources.add_usage(worker_total["usage"], usage)
+
+    for worker, worker_total in sorted(worker_totals.items()):
+        workers[str(worker)] = dict(travis_resources.get_usage_entry(worker_total["usage"], worker_total["files"],
+                                                                     worker_total["bytes"]),
+                                    projects=worker_total["projects"])
+
+    # Terminated workers are included in the usage of the children of this process
+    children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    run_entry = travis_resources.get_usage_entry(run_usage, sum(entry["files"] for entry in projects.values()),
+                                                 sum(entry["bytes"] for entry in projects.values()))
+    run_entry.update({
+        "workers": max_workers,
+        "workers_user_seconds": children_usage.ru_utime,
+        "workers_system_seconds": children_usage.ru_stime,
+        "workers_max_rss_bytes": children_usage.ru_maxrss * 1024,
+        # Includes the waits of chunk scanning processes, which are not part of any project's usage
+        "workers_throttled_seconds": travis_io.io_throttle.total_throttled_seconds
+        if travis_io.io_throttle is not None else 0.0
+    })
+
+    cpu_seconds = run_usage["user_seconds"] + run_usage["system_seconds"] + children_usage.ru_utime \
+        + children_usage.ru_stime
+    run_entry["bytes_per_cpu_second"] = run_entry["bytes"] / cpu_seconds if cpu_seconds > 0 else None
+
+    report = {"run": run_entry, "workers": workers, "projects": projects}
+
+    with open(output_file + os.sep + get_shard_file_name(resource_report_file, shard), "w") as resource_file:
+        json.dump(report, resource_file, indent=2, sort_keys=True)
+
+    logger.info("Resources: workers user/system CPU " + "{:.3f}/{:.3f}".format(children_usage.ru_utime,
+                                                                             children_usage.ru_stime)
+                + " seconds, peak worker RSS " + str(run_entry["workers_max_rss_bytes"]) + " bytes, "
+                + "{:.1f}".format(run_entry["files_per_second"] or 0) + " files/second, "
+                + "{:.0f}".format(run_entry["bytes_per_second"] or 0) + " bytes/second, throttled "
+                + "{:.3f}".format(run_entry["workers_throttled_seconds"]) + " seconds")
+
+    return report
+
+
+def read_project_rollup(summary_file_name):
+    """
+    Restores the rollup of a project from its summary file
+    :param summary_file_name: Path of the project summary file
+    :return: (project name, travis_rollup.ProjectRollup object)
+    """
+
+    with open(summary_file_name, "r") as summary_file:
+        summary = json.load(summary_file)
+
+    return summary["project"], travis_rollup.ProjectRollup.from_dict(summary)
+
+
+def write_corpus_summary(summary_file_names, corpus_summary_file_name):
+    """
+    Merges the rollups of the given project summary files into one summary of the corpus
+    :param summary_file_names: Paths of the project summary files
+    :param corpus_summary_file_name: Path of the corpus summary file to write
+    :return: Corpus summary as dict
+    """
+
+    corpus_rollup = travis_rollup.ProjectRollup()
+    project_count = 0
+
+    for summary_file_name in sorted(summary_file_names):
+        try:
+            project_name, project_rollup = read_project_rollup(summary_file_name)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error("Reading project summary " + summary_file_name + " failed: " + str(e))
+            continue
+
+        corpus_rollup.merge(project_rollup)
+        project_count += 1
+
+    summary = {"projects": project_count}
+    summary.update(corpus_rollup.to_dict())
+
+    with open(corpus_summary_file_name, "w") as summary_file:
+        json.dump(summary, summary_file, indent=2)
+
+    logger.info("Corpus summary: " + str(summary["job_count"]) + " jobs in " + str(project_count) + " projects, "
+                + "{:.1f}".format(summary["build_minutes"]["total"]) + " build minutes, ~"
+                + str(summary["distinct_workers"]) + " distinct workers")
+
+    return summary
+
+
+def sample_project_folder(project_folder, log_files):
+    """
+    Parses a random sample of the logs of a project folder and summarizes the sampled jobs
+    :param project_folder: Project folder path
+    :param log_files: Dict of log file path -> job key of all log files of the project
+    :return: travis_sampling.StratumSample of the project
+    """
+
+    project_folder_name = os.path.basename(project_folder)
+
+    sample_list = travis_sampling.sample_log_files(log_files, project_folder_name, sampling["seed"],
+                                                   sampling.get("sample_rate"), sampling.get("sample_count"))
+
+    stratum = travis_sampling.StratumSample(project_folder_name, len(log_files), len(sample_list),
+                                            *travis_sampling.get_sample_fields(output_columns))
+
+    jobs, log_files_total = parse_project_jobs(project_folder, project_folder_name,
+                                               {log_file: log_files[log_file] for log_file in sample_list})
+
+    for job in jobs:
+        stratum.add_job(job)
+
+    return stratum
+
+
+def sample_input_folder(input_folder, max_workers=None):
+    """
+    Estimates the field distributions of all jobs in input_folder from a sample stratified by project
+    :param input_folder: Input folder containing the project folders
+    :param max_workers: Number of worker processes, None for get_worker_count
+    :return: Estimates as returned by travis_sampling.estimate
+    """
+
+    start_time = time.time()
+
+    folder_list = sorted(item for item in glob.glob(input_folder + os.sep + "*") if os.path.isdir(item))
+    project_list = [discover_project_folder(folder) for folder in folder_list]
+    report_rejected_log_files(project_list)
+
+    strata = []
+
+    with create_worker_pool(max_workers or get_worker_count()) as executor:
+        future_list = [executor.submit(sample_project_folder, project_folder, log_files)
+                       for project_folder, log_files, project_size, rejected in project_list if log_files]
+
+        for f in future_list:
+            strata.append(f.result())
+
+    estimates = travis_sampling.estimate(strata, sampling["seed"], sampling.get("sample_rate"),
+                                         sampling.get("sample_count"))
+
+    with open(output_file + os.sep + get_shard_file_name(sample_estimates_file, shard), "w") as estimates_file:
+        json.dump(estimates, estimates_file, indent=2, sort_keys=True)
+
+    logger.info("Sampled logs/total: " + str(estimates["sampled_logs"]) + "/" + str(estimates["population_logs"])
+                + " in " + str(estimates["strata"]) + " projects (" + str(time.time() - start_time) + " seconds)")
+
+    for field, interval in estimates["numeric"].items():
+        if interval is not None and interval["ci_low"] is None:
+            logger.info("Estimated mean " + field + ": " + "{:.3f} (no confidence interval, no project has two "
+                        "sampled values)".format(interval["estimate"]))
+        elif interval is not None:
+            logger.info("Estimated mean " + field + ": " + "{:.3f} [{:.3f}, {:.3f}]".format(
+                interval["estimate"], interval["ci_low"], interval["ci_high"]))
+
+    return estimates
+
+
+def update_index(project_output_file):
+    try:
+        travis_job_index.index_project_csv(index_file, project_output_file)
+    except Exception as e:
+        logger.error("Indexing " + project_output_file + " failed: " + str(e))
+
+
+def get_csv_sort_key(csv_header):
+    """
+    Creates a sort key for rows of a project CSV: (build_number, job_id) if both columns are output,
+    otherwise the row itself
+    :param csv_header: Header line of the CSV file
+    :return: Key function for CSV rows
+    """
+
+    columns = csv_header.rstrip("\n").split(",")
+
+    if "build_number" not in columns or "job_id" not in columns:
+        return None
+
+    build_number_column = columns.index("build_number")
+    job_id_column = columns.index("job_id")
+
+    def sort_key(csv_row):
+        values = next(csv.reader([csv_row]))
+        return int(values[build_number_column]), int(values[job_id_column])
+
+    return sort_key
+
+
+def merge_shard_outputs(output_folder):
+    """
+    Combines the per-shard project CSVs in output_folder into one CSV per project
+    :param output_folder: Folder containing the *.shard-i-of-N.csv files
+    :return: Number of merged projects
+    """
+
+    shard_files = {}
+
+    for shard_file in sorted(glob.glob(output_folder + os.sep + "*.shard-*-of-*.csv")):
+        project_folder_name, shard_spec = os.path.basename(shard_file)[:-len(".csv")].rsplit(".shard-", 1)
+        shard_index, shard_count = (int(item) for item in shard_spec.split("-of-"))
+        shard_files.setdefault(project_folder_name, {})[shard_index] = (shard_count, shard_file)
+
+    for project_folder_name, project_shards in sorted(shard_files.items()):
+        shard_counts = set(shard_count for shard_count, shard_file in project_shards.values())
+        if len(shard_counts) > 1 or len(project_shards) != max(shard_counts):
+            logger.warning("Incomplete shard outputs for " + project_folder_name + ": "
+                           + str(sorted(project_shards)) + " of " + str(sorted(shard_counts)))
+
+        shard_csv_files = [open(project_shards[shard_index][1], "r") for shard_index in sorted(project_shards)]
+        try:
+            headers = [shard_csv_file.readline() for shard_csv_file in shard_csv_files]
+            sort_key = get_csv_sort_key(headers[0])
+
+            # Shard outputs are sorted runs, a k-way merge keeps the merged file in (build_number, job_id) order
+            with open(output_folder + os.sep + project_folder_name + ".csv", "w") as csv_file:
+                csv_file.write(headers[0])
+                csv_file.writelines(heapq.merge(*shard_csv_files, key=sort_key))
+        finally:
+            for shard_csv_file in shard_csv_files:
+                shard_csv_file.close()
+
+        if index_file is not None and not project_folder_name.endswith(".folds"):
+            update_index(output_folder + os.sep + project_folder_name + ".csv")
+
+        logger.info("Merged " + str(len(project_shards)) + " shard(s) of " + project_folder_name)
+
+    summary_files = merge_shard_summaries(output_folder)
+
+    if summary_files:
+        write_corpus_summary(summary_files, output_folder + os.sep + corpus_summary_file)
+
+    return len(shard_files)
+
+
+def merge_shard_summaries(output_folder):
+    """
+    Combines the per-shard project summaries in output_folder into one summary per project
+    :param output_folder: Folder containing the *.shard-i-of-N.summary.json files
+    :return: Paths of the merged project summary files
+    """
+
+    shard_summaries = {}
+
+    for shard_file in sorted(glob.glob(output_folder + os.sep + "*.shard-*-of-*.summary.json")):
+        project_folder_name = os.path.basename(shard_file)[:-len(".summary.json")].rsplit(".shard-", 1)[0]
+        shard_summaries.setdefault(project_folder_name, []).append(shard_file)
+
+    summary_files = []
+
+    for project_folder_name, shard_files in sorted(shard_summaries.items()):
+        project_rollup = travis_rollup.ProjectRollup()
+
+        for shard_file in shard_files:
+            project_name, shard_rollup = read_project_rollup(shard_file)
+            project_rollup.merge(shard_rollup)
+
+        summary = {"project": project_name}
+        summary.update(project_rollup.to_dict())
+
+        summary_file_name = output_folder + os.sep + project_folder_name + ".summary.json"
+        with open(summary_file_name, "w") as summary_file:
+            json.dump(summary, summary_file, indent=2)
+
+        summary_files.append(summary_file_name)
+
+    return summary_files
+
+
+def get_project_name_from_path(log_file_path):
+    """
+    Derives the project name (org/name) from the folder containing a log file
+    :param log_file_path: Log file path
+    :return: Project name or an empty string if the folder does not match the project folder format
+    """
+
+    project_folder_name = os.path.basename(os.path.dirname(log_file_path))
+
+    if "@" in project_folder_name:
+        project = extract_project(project_folder_name)
+        return project.project_org + '/' + project.project_name
+
+    return ""
+
+
+def format_job(project_name, job, output_format, columns=None, log_file_path=None, diagnostics=None):
+    """
+    Formats a job as one output row
+    :param project_name: Project name (org/name)
+    :param job: TravisJob object, may be None for ndjson
+    :param output_format: csv or ndjson
+    :param columns: CSV column names to output, None for all columns
+    :param log_file_path: Log file path, only used for ndjson
+    :param diagnostics: Diagnostics of parse_job_log_file, only used for ndjson
+    :return: Row including the trailing newline
+    """
+
+    if output_format == "ndjson":
+        return json.dumps(travis_records.get_record(project_name, log_file_path, job, diagnostics or {},
+                                                    columns)) + "\n"
+    else:
+        return '"{}",{}\n'.format(project_name, job.get_as_csv(columns))
+
+
+def parse_stream_item(log_file_path, log_content, output_format):
+    """
+    Parses one log received in stream mode and formats the job as output row. In ndjson format logs that could not
+    be parsed are output as well, with NULL fields and the reason in their diagnostics.
+    :param log_file_path: Log file path or name
+    :param log_content: Log content for framed input, None to read log_file_path
+    :param output_format: csv or ndjson
+    :return: Tuple (log_file_path, row or None)
+    """
+
+    diagnostics = {}
+    job = travis_job_helper.parse_job_log_file(log_file_path, parsing_error_logger, log_content=log_content,
+                                               diagnostics=diagnostics, **parse_options)
+
+    if job is None and output_format != "ndjson":
+        return log_file_path, None
+
+    return log_file_path, format_job(get_project_name_from_path(log_file_path), job, output_format,
+                                     output_columns, log_file_path, diagnostics)
+
+
+def read_stream_paths(input_stream):
+    """
+    Reads log file paths from a binary stream, one per line
+    :param input_stream: Binary input stream
+    :return: Generator of tuples (log_file_path, None)
+    """
+
+    for raw_line in input_stream:
+        log_file_path = raw_line.decode("utf-8").strip()
+        if log_file_path:
+            yield log_file_path, None
+
+
+def read_stream_frames(input_stream):
+    """
+    Reads framed log contents from a binary stream. Each frame is a header line "<name>\\t<byte_count>"
+    followed by byte_count bytes of log content.
+    :param input_stream: Binary input stream
+    :return: Generator of tuples (log_file_name, log_content)
+    """
+
+    while True:
+        header = input_stream.readline()
+        if not header:
+            return
+
+        header = header.decode("utf-8").rstrip("\n")
+        if not header:
+            continue
+
+        log_file_name, byte_count = header.rsplit("\t", 1)
+        log_content = input_stream.read(int(byte_count))
+
+        if len(log_content) != int(byte_count):
+            raise EOFError("Truncated frame for " + log_file_name)
+
+        yield log_file_name, log_content
+
+
+def process_stream(input_stream, output_stream, input_mode="paths", output_format="csv", max_workers=None,
+                   max_in_flight=32, flush_every=1):
+    """
+    Parses logs named (or contained) in input_stream and writes one row per job to output_stream in completion order
+    :param input_stream: Binary input stream with log paths or framed log contents
+    :param output_stream: Text output stream
+    :param input_mode: paths or framed
+    :param output_format: csv or ndjson
+    :param max_workers: Number of worker processes, None for get_worker_count
+    :param max_in_flight: Maximum number of logs submitted but not yet written, bounds memory usage
+    :param flush_every: Flush output_stream after this many rows
+    :return: Tuple (rows written, logs received)
+    """
+
+    items = read_stream_frames(input_stream) if input_mode == "framed" else read_stream_paths(input_stream)
+
+    rows_written = 0
+    rows_unflushed = 0
+    logs_received = 0
+
+    if output_format == "csv":
+        output_stream.write(TravisProject.get_csv_header(output_columns))
+
+    def write_done(done):
+        nonlocal rows_written, rows_unflushed
+
+        for f in done:
+            log_file_path, row = f.result()
+
+            if row is None:
+                logger.warning("Result of parsing was None for: " + log_file_path)
+                continue
+
+            output_stream.write(row)
+            rows_written += 1
+            rows_unflushed += 1
+
+            if rows_unflushed >= flush_every:
+                output_stream.flush()
+                rows_unflushed = 0
+
+    with create_worker_pool(max_workers or get_worker_count()) as executor:
+        pending = set()
+
+        for log_file_path, log_content in items:
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                write_done(done)
+
+            pending.add(executor.submit(parse_stream_item, log_file_path, log_content, output_format))
+            logs_received += 1
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            write_done(done)
+
+    output_stream.flush()
+
+    logger.info("Stream rows written/logs received: " + str(rows_written) + "/" + str(logs_received))
+
+    return rows_written, logs_received
+
+
 def main(argv):
     tool_name = "travis_log_parser.py"
-    tool_params = " -i <input_folder> -o <output_folder>"
+    tool_params = " -i <input_folder> -o <output_folder> [-s <shard_index>/<shard_count>] [-e]" \
+                  " [-c <column>,<column>,...]" \
+                  " [--max-line-length <bytes>] [--max-rss-mb <mb>] [--max-file-mb <mb>] [-x <index_file>]" \
+                  " [--sample-rate <fraction> | --sample-count <n>] [--seed <n>] [--fold-index]" \
+                  " [-w <workers>] [--prefetch <batches>] [--batch-bytes <bytes>] [--records <ndjson|arrow>]" \
+                  " [--chunk-mb <mb>] [--io-limit-mb <mb_per_second>] [--io-limit-reads <reads_per_second>]" \
+                  "\n       " + tool_name + " -m -o <output_folder> [-x <index_file>]" \
+                  "\n       " + tool_name + " -i <input_folder> -t <table_file>" \
+                  "\n       " + tool_name + " -p <paths|framed> [-f <csv|ndjson>] [--max-in-flight <n>]" \
+                  " [--flush-every <n>] < input > output"
     usage_string = "Usage: " + tool_name + tool_params
 
     global output_file
+    global shard
+    global output_columns
+    global index_file
+    global sampling
+    global fold_index_enabled
+    global record_format
+
+    input_file = None
+    output_file = None
+    merge_shards = False
+    table_file = None
+    stream_mode = None
+    stream_format = "csv"
+    stream_max_in_flight = 32
+    stream_flush_every = 1
+    sample_options = {}
+    sample_seed = 0
+    io_limits = {}
 
     try:
-        opts, args = getopt.getopt(argv, "hi:o:", ["infile=","outfile="])
+        opts, args = getopt.getopt(argv, "hi:o:s:mt:ec:p:f:x:w:",
+                                   ["infile=", "outfile=", "shard=", "merge", "table=", "epoch-timestamps",
+                                    "columns=", "pipe=", "format=", "max-in-flight=", "flush-every=",
+                                    "max-line-length=", "max-rss-mb=", "max-file-mb=", "index=",
+                                    "sample-rate=", "sample-count=", "seed=", "fold-index",
+                                    "workers=", "prefetch=", "batch-bytes=", "records=",
+                                    "chunk-mb=", "io-limit-mb=", "io-limit-reads="])
     except getopt.GetoptError:
         print(usage_string)
         sys.exit(2)
@@ -167,14 +1270,125 @@ def main(argv):
             input_file = arg.rstrip('/')
         elif opt in ("-o", "--outfile"):
             output_file = arg.rstrip('/')
+        elif opt in ("-s", "--shard"):
+            try:
+                shard = parse_shard(arg)
+            except ValueError as e:
+                print(e)
+                print(usage_string)
+                sys.exit(2)
+        elif opt in ("-m", "--merge"):
+            merge_shards = True
+        elif opt in ("-t", "--table"):
+            table_file = arg
+        elif opt in ("-e", "--epoch-timestamps"):
+            parse_options["epoch_timestamps"] = True
+        elif opt in ("-c", "--columns"):
+            output_columns = [column.strip() for column in arg.split(',') if column.strip()]
+            try:
+                travis_job_helper.get_required_extractors(output_columns)
+            except ValueError as e:
+                print(e)
+                print(usage_string)
+                sys.exit(2)
+            parse_options["columns"] = output_columns
+        elif opt in ("-p", "--pipe"):
+            stream_mode = arg
+        elif opt in ("-f", "--format"):
+            stream_format = arg
+        elif opt == "--max-in-flight":
+            stream_max_in_flight = int(arg)
+        elif opt == "--flush-every":
+            stream_flush_every = int(arg)
+        elif opt == "--max-line-length":
+            parse_options["max_line_length"] = int(arg) if int(arg) > 0 else None
+        elif opt == "--max-rss-mb":
+            parse_options["max_rss_bytes"] = int(arg) * 1024 * 1024
+        elif opt == "--max-file-mb":
+            parse_options["max_file_bytes"] = int(arg) * 1024 * 1024
+        elif opt in ("-x", "--index"):
+            index_file = arg
+        elif opt == "--sample-rate":
+            sample_options["sample_rate"] = float(arg)
+            if not 0 < sample_options["sample_rate"] <= 1:
+                print(usage_string)
+                sys.exit(2)
+        elif opt == "--sample-count":
+            sample_options["sample_count"] = int(arg)
+            if sample_options["sample_count"] < 1:
+                print(usage_string)
+                sys.exit(2)
+        elif opt == "--seed":
+            sample_seed = int(arg)
+        elif opt == "--fold-index":
+            fold_index_enabled = True
+        elif opt in ("-w", "--workers"):
+            worker_settings["workers"] = int(arg)
+        elif opt == "--prefetch":
+            worker_settings["prefetch"] = int(arg)
+        elif opt == "--batch-bytes":
+            worker_settings["batch_bytes"] = int(arg)
+        elif opt == "--records":
+            if arg not in travis_records.RECORD_WRITERS:
+                print(usage_string)
+                sys.exit(2)
+            if arg == "arrow" and importlib.util.find_spec("pyarrow") is None:
+                print("pyarrow is not installed, Arrow records are not available")
+                sys.exit(2)
+            record_format = arg
+        elif opt == "--chunk-mb":
+            parse_options["chunk_bytes"] = int(arg) * 1024 * 1024
+        elif opt == "--io-limit-mb":
+            io_limits["bytes_per_second"] = float(arg) * 1024 * 1024
+        elif opt == "--io-limit-reads":
+            io_limits["reads_per_second"] = float(arg)
+
+    if sample_options:
+        sampling = dict(sample_options, seed=sample_seed)
+
+    if io_limits:
+        if min(io_limits.values()) <= 0:
+            print(usage_string)
+            sys.exit(2)
+
+        travis_io.set_io_throttle(travis_io.IoThrottle(**io_limits))
+
+    if stream_mode is not None:
+        if stream_mode not in ("paths", "framed") or stream_format not in ("csv", "ndjson"):
+            print(usage_string)
+            sys.exit(2)
 
-    if input_file is None or output_file is None:
+        process_stream(sys.stdin.buffer, sys.stdout, stream_mode, stream_format,
+                       max_in_flight=stream_max_in_flight, flush_every=stream_flush_every)
+        return
+
+    if table_file is not None and input_file is not None:
+        logger.info('Input file is "' + input_file + '"')
+        logger.info('Table file is "' + table_file + '"')
+
+        with open(table_file, "w") as csv_file:
+            csv_file.writelines(collect_input_folder(input_file).get_as_csv(columns=output_columns))
+        return
+
+    if output_file is None or (input_file is None and not merge_shards):
         print(usage_string)
         sys.exit()
 
-    logger.info('Input file is "' + input_file + '"')
     logger.info('Output file is "' + output_file + '"')
 
+    if merge_shards:
+        merge_shard_outputs(output_file)
+        return
+
+    logger.info('Input file is "' + input_file + '"')
+
+    if shard is not None:
+        logger.info('Processing shard ' + str(shard[0]) + '/' + str(shard[1]))
+
+    if sampling is not None:
+        sample_input_folder(input_file)
+        return
+
     process_input_folder(input_file)
 
 
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 from travis_job import TravisJob
+from travis_rollup import ProjectRollup
 
 
 class TravisProject:
@@ -12,6 +13,7 @@ class TravisProject:
         self.__project_org = project_org
         self.__project_name = project_name
         self.__jobs = None
+        self.__rollup = ProjectRollup()
         # print("{} initialized.".format(self.project_folder))
 
     @property
@@ -30,21 +32,46 @@ class TravisProject:
     def job_list(self):
         return self.__jobs
 
+    @property
+    def rollup(self):
+        return self.__rollup
+
     def assign_jobs(self, job_list):
-        self.__jobs = job_list
+        self.__jobs = []
+        self.__rollup = ProjectRollup()
+
+        for job in job_list:
+            self.add_job(job)
+
+    def add_job(self, job):
+        if self.__jobs is None:
+            self.__jobs = []
+
+        self.__jobs.append(job)
+        self.__rollup.add_job(job)
+
+    def get_summary(self):
+        """
+        :return: Rollups of the jobs of the project as dict (see ProjectRollup.to_dict)
+        """
+
+        summary = {"project": self.__project_org + '/' + self.__project_name}
+        summary.update(self.__rollup.to_dict())
+
+        return summary
 
-    def get_as_csv(self, with_header=True):
+    def get_as_csv(self, with_header=True, columns=None):
         project_csv_entries = []
         project = self.__project_org + '/' + self.__project_name
 
         if with_header:
-            project_csv_entries.append(TravisProject.get_csv_header())
+            project_csv_entries.append(TravisProject.get_csv_header(columns))
 
         for job_entry in self.__jobs:
-            project_csv_entries.append('"{}",{}\n'.format(project, job_entry.get_as_csv()))
+            project_csv_entries.append('"{}",{}\n'.format(project, job_entry.get_as_csv(columns)))
 
         return project_csv_entries
 
     @staticmethod
-    def get_csv_header():
-        return "{},{}".format("project", TravisJob.get_csv_header())
+    def get_csv_header(columns=None):
+        return "{},{}".format("project", TravisJob.get_csv_header(columns))
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+
+import json
+
+from travis_job import TravisJob
+
+# Diagnostics reported by parse_job_log_file, in output order
+DIAGNOSTIC_FIELDS = ("malformed_markers", "truncated_lines", "filename_error", "quarantined", "error")
+
+# Columns stored as integers resp. booleans in Arrow output, all other job columns are stored as strings
+INTEGER_COLUMNS = ("build_number", "job_id", "build_id", "startup_duration_seconds", "travis_fold_count",
+                   "duration_aggregated_milliseconds")
+BOOLEAN_COLUMNS = ("using_worker_header", "travis_fold_worker_info", "travis_fold_system_info")
+
+# Write buffer of the record files of a worker
+record_buffer_bytes = 1024 * 1024
+
+# Rows per Arrow record batch
+arrow_batch_rows = 4096
+
+
+def get_record(project_name, log_file, job, diagnostics, columns=None):
+    """
+    Builds the output record of one log: the job columns (NULL if the log could not be parsed) and the diagnostics
+    of parse_job_log_file
+    :param project_name: Project name (org/name)
+    :param log_file: Log file path
+    :param job: TravisJob object or None
+    :param diagnostics: Diagnostics dict filled by parse_job_log_file
+    :param columns: CSV column names to output, None for all columns
+    :return: Dict that can be written as JSON
+    """
+
+    record = {"project": project_name, "log_file": log_file, "parsed": job is not None}
+
+    for column in columns if columns is not None else TravisJob.CSV_COLUMNS:
+        value = None if job is None else getattr(job, TravisJob.CSV_COLUMNS[column])
+        record[column] = value if value is None or isinstance(value, (bool, int, float, str)) else str(value)
+
+    record["diagnostics"] = {field: diagnostics[field] for field in DIAGNOSTIC_FIELDS if field in diagnostics}
+
+    return record
+
+
+class NdjsonRecordWriter:
+    """Writes records as newline-delimited JSON through a large write buffer"""
+
+    extension = ".ndjson"
+
+    def __init__(self, record_file, columns=None):
+        self.record_file = record_file
+        self.records_written = 0
+        self.__file = open(record_file, "w", buffering=record_buffer_bytes)
+
+    def write(self, record):
+        self.__file.write(json.dumps(record) + "\n")
+        self.records_written += 1
+
+    def close(self):
+        self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ArrowRecordWriter:
+    """
+    Writes records as Arrow IPC file in record batches of arrow_batch_rows rows (requires pyarrow). The diagnostics
+    become columns of their own, malformed_markers a map of marker category to count.
+    """
+
+    extension = ".arrow"
+
+    def __init__(self, record_file, columns=None):
+        import pyarrow
+        import pyarrow.ipc
+
+        self.__pyarrow = pyarrow
+        self.record_file = record_file
+        self.records_written = 0
+
+        columns = list(columns if columns is not None else TravisJob.CSV_COLUMNS)
+        fields = [("project", pyarrow.string()), ("log_file", pyarrow.string()), ("parsed", pyarrow.bool_())]
+
+        for column in columns:
+            if column in INTEGER_COLUMNS:
+                fields.append((column, pyarrow.int64()))
+            elif column in BOOLEAN_COLUMNS:
+                fields.append((column, pyarrow.bool_()))
+            else:
+                fields.append((column, pyarrow.string()))
+
+        fields.extend([("malformed_markers", pyarrow.map_(pyarrow.string(), pyarrow.int64())),
+                       ("truncated_lines", pyarrow.int64()),
+                       ("filename_error", pyarrow.string()),
+                       ("quarantined", pyarrow.string()),
+                       ("error", pyarrow.string())])
+
+        self.__schema = pyarrow.schema(fields)
+        self.__string_columns = set(name for name, field_type in fields if field_type == pyarrow.string())
+        self.__rows = {name: [] for name, field_type in fields}
+        self.__sink = pyarrow.OSFile(record_file, "wb")
+        self.__writer = pyarrow.ipc.new_file(self.__sink, self.__schema)
+
+    def write(self, record):
+        diagnostics = record["diagnostics"]
+
+        for name, rows in self.__rows.items():
+            if name == "malformed_markers":
+                value = list(diagnostics.get(name, {}).items()) or None
+            elif name in DIAGNOSTIC_FIELDS:
+                value = diagnostics.get(name)
+            else:
+                value = record[name]
+
+            if value is not None and name in self.__string_columns:
+                value = str(value)
+
+            rows.append(value)
+
+        self.records_written += 1
+
+        if len(self.__rows["project"]) >= arrow_batch_rows:
+            self.__write_batch()
+
+    def __write_batch(self):
+        if self.__rows["project"]:
+            self.__writer.write_batch(self.__pyarrow.record_batch(
+                [self.__pyarrow.array(self.__rows[field.name], type=field.type) for field in self.__schema],
+                schema=self.__schema))
+
+            for rows in self.__rows.values():
+                rows.clear()
+
+    def close(self):
+        self.__write_batch()
+        self.__writer.close()
+        self.__sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+RECORD_WRITERS = {"ndjson": NdjsonRecordWriter, "arrow": ArrowRecordWriter}
+
+
+def open_record_writer(record_format, record_file_base, columns=None):
+    """
+    Opens a record writer
+    :param record_format: ndjson or arrow
+    :param record_file_base: Path of the record file without extension
+    :param columns: CSV column names to output, None for all columns
+    :return: Record writer, usable as context manager
+    """
+
+    writer_class = RECORD_WRITERS[record_format]
+
+    return writer_class(record_file_base + writer_class.extension, columns)
@@ -0,0 +1,467 @@
+#!/usr/bin/env python
+
+# Runs two parser engines over the same corpus, compares the extracted fields column by column and their
+# throughput. Exits with 1 if the outputs diverge or engine b is slower than allowed:
+#   python travis_regression_harness.py -a <engine> -b <engine> (-i <input_folder> | -g <projects>x<jobs>)
+# An engine is a folder containing travis_job_helper.py (e.g. . or reimpl) or git:<revision>:<folder> for the
+# version of a folder at a git revision.
+
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import getopt
+import glob
+import inspect
+import json
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+harness_folder = os.path.dirname(os.path.abspath(__file__))
+
+# Values meaning "no value" in the outputs of the different engines
+NULL_VALUES = ("", "NULL", "None")
+
+# Column -> tolerance: ("abs", maximum absolute difference), ("rel", maximum relative difference) or ("ignore",).
+# Columns without a policy have to match exactly after NULL normalization, numbers are compared numerically.
+DEFAULT_TOLERANCES = {
+    "duration_aggregated_milliseconds": ("abs", 1.0),
+    "duration_diff_seconds": ("abs", 1e-6)
+}
+
+# Number of example mismatches kept per column
+max_examples = 5
+
+
+def parse_tolerance(tolerance_string):
+    """
+    Parses a tolerance specification
+    :param tolerance_string: <column>=abs:<value>, <column>=rel:<value> or <column>=ignore
+    :return: Tuple (column, tolerance)
+    """
+
+    column, _, policy = tolerance_string.partition("=")
+    kind, _, value = policy.partition(":")
+
+    if not column or kind not in ("abs", "rel", "ignore") or (kind != "ignore" and not value):
+        raise ValueError("Invalid tolerance {}, expected <column>=abs:<value>, <column>=rel:<value> or "
+                         "<column>=ignore".format(tolerance_string))
+
+    return column, (kind,) if kind == "ignore" else (kind, float(value))
+
+
+def generate_corpus(corpus_folder, project_count=3, jobs_per_project=20, seed=0):
+    """
+    Writes a synthetic corpus in the input folder layout (<org>@<name>/<build>_<commit>_<job>.log). Logs contain
+    the worker header, worker and system information sections, folds with travis_time markers and some of the
+    irregularities of real logs (colors, \\r progress output, malformed markers, missing sections, long lines).
+    :param corpus_folder: Folder to write the corpus to
+    :param project_count: Number of projects
+    :param jobs_per_project: Number of job logs per project
+    :param seed: Seed of the generator
+    :return: Number of written logs
+    """
+
+    rng = random.Random(seed)
+    log_count = 0
+
+    for project_index in range(project_count):
+        project_folder = os.path.join(corpus_folder, "org{}@project{}".format(project_index, project_index))
+        os.makedirs(project_folder, exist_ok=True)
+
+        for job_index in range(jobs_per_project):
+            build_number = job_index // 2 + 1
+            job_id = (project_index + 1) * 100000 + job_index
+            commit_hash = "{:040x}".format(rng.getrandbits(160))
+            timestamp = 1450000000000000000 + rng.randrange(10 ** 15)
+
+            lines = []
+
+            if rng.random() < 0.9:
+                lines.append("Using worker: worker-linux-docker-{}.prod.travis-ci.org:travis-linux-{}\r\n"
+                             .format(rng.randrange(20), rng.randrange(10)))
+
+            if rng.random() < 0.9:
+                lines += ["\x1b[0Ktravis_fold:start:worker_info\r\x1b[0K\x1b[33;1mWorker information\x1b[0m\r\n",
+                          "hostname: ip-10-0-{}-{}:{}\r\n".format(rng.randrange(256), rng.randrange(256),
+                                                                 rng.getrandbits(32)),
+                          "version: v2.{}.0 https://github.com/travis-ci/worker/tree/abc\r\n".format(rng.randrange(9)),
+                          "instance: {:x}:travis:{}\r\n".format(rng.getrandbits(24),
+                                                               rng.choice(["ruby", "python", "java"])),
+                          "startup: {}m{}.{}s\r\n".format(rng.randrange(3), rng.randrange(60), rng.randrange(999)),
+                          "\x1b[0Ktravis_fold:end:worker_info\r\x1b[0K\r\n"]
+
+            if rng.random() < 0.9:
+                lines += ["travis_fold:start:system_info\r\n",
+                          "\x1b[33;1mBuild system information\x1b[0m\r\n",
+                          "Build language: {}\r\n".format(rng.choice(["ruby", "python", "java", "node_js"])),
+                          "Build id: {}\r\n".format(rng.randrange(10 ** 8)),
+                          "\x1b[34m\x1b[1mOperating System Details\x1b[0m\r\n",
+                          "Distributor ID:\tUbuntu\r\n",
+                          "Description:\tUbuntu {}\r\n".format(rng.choice(["12.04.5 LTS", "14.04.5 LTS"])),
+                          "Release:\t{}\r\n".format(rng.choice(["12.04", "14.04"])),
+                          "travis_fold:end:system_info\r\n"]
+
+            for step in range(rng.randrange(1, 40)):
+                duration = rng.randrange(10 ** 6, 10 ** 11)
+                lines.append("travis_fold:start:step.{}\r\n".format(step))
+                lines.append("travis_time:start:{:x}\r\n".format(step))
+                lines.append("$ run step {} \x1b[32m✓\x1b[0m\r\n".format(step))
+
+                if rng.random() < 0.1:
+                    lines.append("progress 10%\rprogress 50%\rprogress 100%\r\n")
+                if rng.random() < 0.02:
+                    lines.append("x" * rng.randrange(10000, 100000) + "\r\n")
+
+                if rng.random() < 0.03:
+                    lines.append("travis_time:end:{:x}:start={},finish=\r\n".format(step, timestamp))
+                else:
+                    lines.append("travis_time:end:{:x}:start={},finish={},duration={}\r\n"
+                                 .format(step, timestamp, timestamp + duration, duration))
+
+                lines.append("travis_fold:end:step.{}\r\n".format(step))
+                timestamp += duration + rng.randrange(10 ** 9)
+
+            log_file = os.path.join(project_folder, "{}_{}_{}.log".format(build_number, commit_hash, job_id))
+            with open(log_file, "w", encoding="utf-8") as log:
+                log.writelines(lines)
+
+            log_count += 1
+
+    return log_count
+
+
+def prepare_engine(engine, work_folder):
+    """
+    Resolves an engine specification to a folder containing travis_job_helper.py
+    :param engine: Folder or git:<revision>:<folder>
+    :param work_folder: Folder in which git revisions are checked out
+    :return: Absolute engine folder
+    """
+
+    if engine.startswith("git:"):
+        revision, _, folder = engine[len("git:"):].partition(":")
+        folder = folder.strip("/") or "."
+
+        repository = subprocess.check_output(["git", "rev-parse", "--show-toplevel"], cwd=harness_folder,
+                                             universal_newlines=True).strip()
+        checkout_folder = tempfile.mkdtemp(prefix="engine-", dir=work_folder)
+
+        archive = subprocess.check_output(["git", "archive", revision, folder], cwd=repository)
+        subprocess.run(["tar", "-x", "-C", checkout_folder], input=archive, check=True)
+
+        engine_folder = os.path.join(checkout_folder, folder)
+    else:
+        engine_folder = os.path.abspath(engine)
+
+    if not os.path.isfile(os.path.join(engine_folder, "travis_job_helper.py")):
+        raise ValueError("No travis_job_helper.py in engine {}".format(engine))
+
+    return engine_folder
+
+
+def run_engine(engine_folder, log_files, work_folder, repetitions=1):
+    """
+    Parses the logs with one engine. Runs in a spawned process with only the engine folder on the import path, so
+    that engines with the same module names do not mix.
+    :param engine_folder: Folder containing travis_job_helper.py
+    :param log_files: Absolute paths of the logs
+    :param work_folder: Working directory for log files written by the engine
+    :param repetitions: Number of timed passes, the fastest one is reported
+    :return: Tuple (dict log file -> dict column -> value or error string, best duration in seconds)
+    """
+
+    sys.path = [engine_folder] + [item for item in sys.path
+                                  if os.path.abspath(item or ".") not in (harness_folder, engine_folder)]
+    os.chdir(work_folder)
+
+    import travis_job_helper
+
+    parse_job_log_file = travis_job_helper.parse_job_log_file
+    takes_logger = "parser_error_logger" in inspect.signature(parse_job_log_file).parameters
+    error_logger = logging.getLogger("regression_harness")
+    error_logger.addHandler(logging.NullHandler())
+    error_logger.propagate = False
+
+    results = {}
+    best_duration = None
+
+    for repetition in range(repetitions):
+        results = {}
+        start_time = time.perf_counter()
+
+        for log_file in log_files:
+            try:
+                if takes_logger:
+                    results[log_file] = parse_job_log_file(log_file, error_logger)
+                else:
+                    results[log_file] = parse_job_log_file(log_file)
+            except Exception as e:
+                results[log_file] = "{}: {}".format(type(e).__name__, e)
+
+        duration = time.perf_counter() - start_time
+        best_duration = duration if best_duration is None else min(best_duration, duration)
+
+    rows = {}
+
+    for log_file, job in results.items():
+        if job is None or isinstance(job, str):
+            rows[log_file] = job or "no job"
+        else:
+            header = next(csv.reader([job.get_csv_header().rstrip("\n")]))
+            values = next(csv.reader([job.get_as_csv().rstrip("\n")]))
+            rows[log_file] = dict(zip(header, values))
+
+    return rows, best_duration
+
+
+def normalize_value(value):
+    return None if value in NULL_VALUES else value
+
+
+def values_match(value_a, value_b, tolerance=None):
+    """
+    Compares two output values under a tolerance policy
+    :return: True if the values are considered equal
+    """
+
+    value_a = normalize_value(value_a)
+    value_b = normalize_value(value_b)
+
+    if tolerance is not None and tolerance[0] == "ignore":
+        return True
+
+    if value_a == value_b:
+        return True
+
+    if value_a is None or value_b is None:
+        return False
+
+    try:
+        number_a = float(value_a)
+        number_b = float(value_b)
+    except ValueError:
+        return False
+
+    if tolerance is None:
+        return number_a == number_b
+    elif tolerance[0] == "abs":
+        return abs(number_a - number_b) <= tolerance[1]
+    else:
+        return abs(number_a - number_b) <= tolerance[1] * max(abs(number_a), abs(number_b))
+
+
+def compare_rows(rows_a, rows_b, tolerances):
+    """
+    Compares the outputs of two engines column by column
+    :param rows_a: Output of engine a as returned by run_engine
+    :param rows_b: Output of engine b as returned by run_engine
+    :param tolerances: Dict column -> tolerance
+    :return: Dict with compared and uncompared columns, mismatch counts and examples per column and logs that only
+             one engine parsed
+    """
+
+    columns_a = set(column for row in rows_a.values() if isinstance(row, dict) for column in row)
+    columns_b = set(column for row in rows_b.values() if isinstance(row, dict) for column in row)
+    compared_columns = sorted(columns_a & columns_b)
+
+    mismatches = {}
+    only_a = {}
+    only_b = {}
+
+    for log_file in sorted(set(rows_a) | set(rows_b)):
+        row_a = rows_a.get(log_file)
+        row_b = rows_b.get(log_file)
+
+        if not isinstance(row_a, dict) or not isinstance(row_b, dict):
+            if isinstance(row_a, dict):
+                only_a[log_file] = row_b
+            elif isinstance(row_b, dict):
+                only_b[log_file] = row_a
+            continue
+
+        for column in compared_columns:
+            if not values_match(row_a.get(column), row_b.get(column), tolerances.get(column)):
+                column_mismatches = mismatches.setdefault(column, {"count": 0, "examples": []})
+                column_mismatches["count"] += 1
+
+                if len(column_mismatches["examples"]) < max_examples:
+                    column_mismatches["examples"].append({"log_file": log_file, "a": row_a.get(column),
+                                                          "b": row_b.get(column)})
+
+    return {
+        "compared_columns": compared_columns,
+        "only_in_a_columns": sorted(columns_a - columns_b),
+        "only_in_b_columns": sorted(columns_b - columns_a),
+        "mismatches": mismatches,
+        "parsed_only_by_a": only_a,
+        "parsed_only_by_b": only_b
+    }
+
+
+def run_harness(engine_a, engine_b, input_folder, tolerances=None, max_slowdown=0.1, repetitions=1):
+    """
+    Runs both engines one after the other over all logs of input_folder and compares them
+    :param engine_a: Reference engine specification
+    :param engine_b: Candidate engine specification
+    :param input_folder: Folder with project folders containing the logs
+    :param tolerances: Dict column -> tolerance, None for DEFAULT_TOLERANCES
+    :param max_slowdown: Allowed throughput loss of engine b relative to engine a (0.1 = 10%)
+    :param repetitions: Number of timed passes per engine
+    :return: Report dict with the key passed
+    """
+
+    if tolerances is None:
+        tolerances = DEFAULT_TOLERANCES
+
+    log_files = sorted(os.path.abspath(item) for item in glob.glob(os.path.join(input_folder, "*", "*.log")))
+    corpus_bytes = sum(os.path.getsize(item) for item in log_files)
+
+    work_folder = tempfile.mkdtemp(prefix="regression-harness-")
+    try:
+        engine_results = []
+
+        for engine in (engine_a, engine_b):
+            engine_folder = prepare_engine(engine, work_folder)
+
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                rows, duration = executor.submit(run_engine, engine_folder, log_files, work_folder,
+                                                 repetitions).result()
+
+            engine_results.append((engine, rows, duration))
+    finally:
+        shutil.rmtree(work_folder, ignore_errors=True)
+
+    comparison = compare_rows(engine_results[0][1], engine_results[1][1], tolerances)
+
+    throughput = {}
+    for engine_name, (engine, rows, duration) in zip(("a", "b"), engine_results):
+        throughput[engine_name] = {
+            "engine": engine,
+            "seconds": duration,
+            "logs_per_second": len(log_files) / duration if duration > 0 else None,
+            "megabytes_per_second": corpus_bytes / 1024 / 1024 / duration if duration > 0 else None
+        }
+
+    duration_a = engine_results[0][2]
+    duration_b = engine_results[1][2]
+    speedup = duration_a / duration_b if duration_b > 0 else None
+
+    diverged = bool(comparison["mismatches"] or comparison["parsed_only_by_a"] or comparison["parsed_only_by_b"])
+    regressed = speedup is not None and speedup < 1 - max_slowdown
+
+    return dict(comparison,
+                logs=len(log_files),
+                corpus_bytes=corpus_bytes,
+                throughput=throughput,
+                speedup=speedup,
+                max_slowdown=max_slowdown,
+                tolerances={column: list(tolerance) for column, tolerance in tolerances.items()},
+                diverged=diverged,
+                regressed=regressed,
+                passed=not diverged and not regressed)
+
+
+def main(argv):
+    tool_name = "travis_regression_harness.py"
+    tool_params = " -a <engine> -b <engine> (-i <input_folder> | -g <projects>x<jobs>) [-s <seed>]" \
+                  " [-t <max_slowdown>] [-r <repetitions>] [--tolerance <column>=abs:<v>|rel:<v>|ignore ...]" \
+                  " [-o <report_file>]"
+    usage_string = "Usage: " + tool_name + tool_params
+
+    engine_a = None
+    engine_b = None
+    input_folder = None
+    generate = None
+    seed = 0
+    max_slowdown = 0.1
+    repetitions = 1
+    tolerances = dict(DEFAULT_TOLERANCES)
+    report_file = None
+
+    try:
+        opts, args = getopt.getopt(argv, "ha:b:i:g:s:t:r:o:",
+                                   ["engine-a=", "engine-b=", "infile=", "generate=", "seed=", "max-slowdown=",
+                                    "repetitions=", "tolerance=", "report="])
+    except getopt.GetoptError:
+        print(usage_string)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == '-h':
+            print(usage_string)
+            sys.exit()
+        elif opt in ("-a", "--engine-a"):
+            engine_a = arg
+        elif opt in ("-b", "--engine-b"):
+            engine_b = arg
+        elif opt in ("-i", "--infile"):
+            input_folder = arg.rstrip('/')
+        elif opt in ("-g", "--generate"):
+            generate = tuple(int(item) for item in arg.split("x"))
+        elif opt in ("-s", "--seed"):
+            seed = int(arg)
+        elif opt in ("-t", "--max-slowdown"):
+            max_slowdown = float(arg)
+        elif opt in ("-r", "--repetitions"):
+            repetitions = int(arg)
+        elif opt == "--tolerance":
+            try:
+                column, tolerance = parse_tolerance(arg)
+            except ValueError as e:
+                print(e)
+                print(usage_string)
+                sys.exit(2)
+            tolerances[column] = tolerance
+        elif opt in ("-o", "--report"):
+            report_file = arg
+
+    if engine_a is None or engine_b is None or (input_folder is None) == (generate is None):
+        print(usage_string)
+        sys.exit(2)
+
+    corpus_folder = None
+    if generate is not None:
+        corpus_folder = tempfile.mkdtemp(prefix="regression-corpus-")
+        generate_corpus(corpus_folder, *generate, seed=seed)
+        input_folder = corpus_folder
+
+    try:
+        report = run_harness(engine_a, engine_b, input_folder, tolerances, max_slowdown, repetitions)
+    finally:
+        if corpus_folder is not None:
+            shutil.rmtree(corpus_folder, ignore_errors=True)
+
+    if report_file is not None:
+        with open(report_file, "w") as report_output:
+            json.dump(report, report_output, indent=2, sort_keys=True)
+
+    print("Logs: {} ({} bytes)".format(report["logs"], report["corpus_bytes"]))
+    for engine_name in ("a", "b"):
+        engine_throughput = report["throughput"][engine_name]
+        print("Engine {} ({}): {:.3f} s, {:.1f} logs/s, {:.2f} MB/s".format(
+            engine_name, engine_throughput["engine"], engine_throughput["seconds"],
+            engine_throughput["logs_per_second"] or 0, engine_throughput["megabytes_per_second"] or 0))
+    print("Speedup of b: {:.2f}x (allowed slowdown {:.0%})".format(report["speedup"] or 0, max_slowdown))
+
+    if report["only_in_a_columns"] or report["only_in_b_columns"]:
+        print("Not compared: a only " + str(report["only_in_a_columns"]) + ", b only "
+              + str(report["only_in_b_columns"]))
+    for column, column_mismatches in sorted(report["mismatches"].items()):
+        print("Mismatch {}: {} row(s), e.g. {}".format(column, column_mismatches["count"],
+                                                        column_mismatches["examples"][0]))
+    if report["parsed_only_by_a"] or report["parsed_only_by_b"]:
+        print("Parsed only by a: {}, only by b: {}".format(len(report["parsed_only_by_a"]),
+                                                           len(report["parsed_only_by_b"])))
+
+    print("PASSED" if report["passed"] else "FAILED")
+
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+
+import math
+import os
+import random
+import resource
+import time
+
+import travis_io
+
+# cgroup v2 and v1 files with the CPU quota and memory limit of the process
+cgroup_cpu_max_file = "/sys/fs/cgroup/cpu.max"
+cgroup_v1_cpu_quota_file = "/sys/fs/cgroup/cpu/cpu.cfs_quota_us"
+cgroup_v1_cpu_period_file = "/sys/fs/cgroup/cpu/cpu.cfs_period_us"
+cgroup_memory_max_file = "/sys/fs/cgroup/memory.max"
+cgroup_v1_memory_limit_file = "/sys/fs/cgroup/memory/memory.limit_in_bytes"
+
+# Share of the memory limit the workers may use together
+memory_headroom = 0.8
+
+# Upper bounds of the tuned settings
+max_workers_per_cpu = 4
+max_prefetch = 8
+
+
+def __read_first_line(file_name):
+    try:
+        with open(file_name, "r") as limit_file:
+            return limit_file.readline().strip()
+    except OSError:
+        return None
+
+
+def get_cpu_limit():
+    """
+    Determines the number of CPUs this process may use: the CPUs in its affinity mask, further limited by a cgroup
+    CPU quota (rounded up)
+    :return: Number of CPUs
+    """
+
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    quota = None
+    cpu_max = __read_first_line(cgroup_cpu_max_file)
+
+    if cpu_max is not None:
+        quota_string, _, period_string = cpu_max.partition(" ")
+        if quota_string != "max" and period_string:
+            quota = int(quota_string) / int(period_string)
+    else:
+        quota_string = __read_first_line(cgroup_v1_cpu_quota_file)
+        period_string = __read_first_line(cgroup_v1_cpu_period_file)
+        if quota_string is not None and period_string is not None and int(quota_string) > 0:
+            quota = int(quota_string) / int(period_string)
+
+    if quota is not None:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+
+    return cpus
+
+
+def get_memory_limit():
+    """
+    Determines the memory available to this process: the cgroup memory limit or the physical memory
+    :return: Memory in bytes, None if unknown
+    """
+
+    memory_max = __read_first_line(cgroup_memory_max_file)
+    if memory_max is None:
+        memory_max = __read_first_line(cgroup_v1_memory_limit_file)
+
+    try:
+        physical_memory = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError):
+        physical_memory = None
+
+    # cgroup v1 reports "no limit" as a huge number
+    if memory_max is not None and memory_max.isdigit() \
+            and (physical_memory is None or int(memory_max) < physical_memory):
+        return int(memory_max)
+
+    return physical_memory
+
+
+def __read_rss_status():
+    """
+    :return: Tuple (current RSS, peak RSS) of this process in bytes from /proc/self/status, None where not available
+    """
+
+    values = {}
+
+    try:
+        with open("/proc/self/status", "r") as status:
+            for line in status:
+                name, _, value = line.partition(":")
+                if name in ("VmRSS", "VmHWM"):
+                    values[name] = int(value.split()[0]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+
+    return values.get("VmRSS"), values.get("VmHWM")
+
+
+def __reset_peak_rss():
+    """
+    Resets the peak RSS of this process to its current RSS (Linux 4.0 and later)
+    :return: True if the peak was reset
+    """
+
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        return False
+
+    return True
+
+
+def calibrate(log_files, parse_log, sample_size=16, seed=0, max_file_bytes=None, max_sample_bytes=64 * 1024 * 1024):
+    """
+    Measures read latency, parse CPU time and memory on a sample of logs. Each log is parsed by parse_log the way the
+    workers parse it (block-wise, through the I/O throttle), so the calibration holds no more of a log in memory than
+    a worker. The time the parse waits, i.e. wall-clock time not spent on the CPU, is counted as read time. The logs
+    are parsed serially by the calling process, so the sample is limited to max_sample_bytes.
+    :param log_files: Log file paths to sample from
+    :param parse_log: Function (log_file_path) parsing one log from disk
+    :param sample_size: Maximum number of logs to measure
+    :param seed: Seed of the sample
+    :param max_file_bytes: Larger logs are not sampled, as the workers quarantine them without parsing; None for no
+                           limit
+    :param max_sample_bytes: Maximum total size of the sampled logs, larger logs are not sampled
+    :return: Dict with files, bytes, read_seconds, parse_cpu_seconds and worker_rss_bytes (the increase of the peak
+             RSS of the calling process while parsing the sample as estimate of the memory a worker needs in addition
+             to what it shares with the parent process; None if it cannot be measured)
+    """
+
+    log_file_sizes = {log_file: os.path.getsize(log_file) for log_file in log_files}
+
+    if max_file_bytes is not None:
+        log_file_sizes = {log_file: size for log_file, size in log_file_sizes.items() if size <= max_file_bytes}
+
+    sample = []
+    sample_bytes = 0
+
+    for log_file in random.Random(seed).sample(sorted(log_file_sizes), len(log_file_sizes)):
+        if len(sample) == sample_size:
+            break
+
+        if sample_bytes + log_file_sizes[log_file] <= max_sample_bytes:
+            sample.append(log_file)
+            sample_bytes += log_file_sizes[log_file]
+
+    read_seconds = 0.0
+    parse_cpu_seconds = 0.0
+
+    # The RSS of the calling process includes data unrelated to parsing (e.g. the discovered log lists), only the
+    # increase while parsing the sample is attributed to it
+    start_rss_bytes, _ = __read_rss_status()
+    peak_reset = __reset_peak_rss()
+
+    for log_file in sample:
+        start_time = time.perf_counter()
+        start_cpu_time = time.process_time()
+        parse_log(log_file)
+        cpu_seconds = time.process_time() - start_cpu_time
+
+        parse_cpu_seconds += cpu_seconds
+        read_seconds += max(0.0, time.perf_counter() - start_time - cpu_seconds)
+
+    end_rss_bytes, end_peak_rss_bytes = __read_rss_status()
+
+    if start_rss_bytes is None or end_rss_bytes is None:
+        worker_rss_bytes = None
+    elif peak_reset and end_peak_rss_bytes is not None:
+        worker_rss_bytes = max(0, end_peak_rss_bytes - start_rss_bytes)
+    else:
+        # Memory freed before the end of the sample is missed
+        worker_rss_bytes = max(0, end_rss_bytes - start_rss_bytes)
+
+    return {
+        "files": len(sample),
+        "bytes": sample_bytes,
+        "read_seconds": read_seconds,
+        "parse_cpu_seconds": parse_cpu_seconds,
+        "worker_rss_bytes": worker_rss_bytes
+    }
+
+
+def choose_settings(calibration, cpus=None, memory_limit=None, target_task_seconds=2.0):
+    """
+    Derives worker count, prefetch depth and initial batch size from a calibration. While a worker waits for
+    reads its CPU is idle, so workers = cpus * (1 + read time / parse CPU time), bounded by max_workers_per_cpu
+    and by the number of workers fitting into the memory limit. Each worker gets enough queued tasks to cover its
+    read latency, and a batch is sized to take about target_task_seconds.
+    :param calibration: Result of calibrate
+    :param cpus: Number of usable CPUs, None to determine it with get_cpu_limit
+    :param memory_limit: Usable memory in bytes, None to determine it with get_memory_limit
+    :param target_task_seconds: Desired duration of a batch
+    :return: Dict with workers, prefetch and batch_bytes
+    """
+
+    if cpus is None:
+        cpus = get_cpu_limit()
+    if memory_limit is None:
+        memory_limit = get_memory_limit()
+
+    read_seconds = calibration["read_seconds"]
+    parse_cpu_seconds = max(calibration["parse_cpu_seconds"], 1e-6)
+    io_ratio = read_seconds / parse_cpu_seconds
+
+    workers = max(1, min(cpus * max_workers_per_cpu, int(round(cpus * (1 + io_ratio)))))
+
+    if memory_limit is not None and calibration.get("worker_rss_bytes"):
+        workers = max(1, min(workers, int(memory_limit * memory_headroom // calibration["worker_rss_bytes"])))
+
+    prefetch = max(1, min(max_prefetch, 1 + int(round(io_ratio))))
+
+    seconds_per_byte = (read_seconds + parse_cpu_seconds) / max(calibration["bytes"], 1)
+    batch_bytes = max(64 * 1024, int(target_task_seconds / seconds_per_byte))
+
+    return {"workers": workers, "prefetch": prefetch, "batch_bytes": batch_bytes}
+
+
+# Counters of /proc/self/io reported as resource usage, by report name
+proc_io_fields = {"read_chars": "rchar", "read_calls": "syscr", "storage_read_bytes": "read_bytes",
+                  "write_chars": "wchar", "storage_write_bytes": "write_bytes"}
+
+# Usage values that are peaks instead of counters
+USAGE_PEAKS = ("max_rss_bytes",)
+
+
+def __read_proc_io():
+    try:
+        with open("/proc/self/io", "r") as io_file:
+            counters = dict(line.split(":", 1) for line in io_file if ":" in line)
+    except OSError:
+        return {}
+
+    return {name: int(counters[field]) for name, field in proc_io_fields.items() if field in counters}
+
+
+def get_resource_usage():
+    """
+    Takes a snapshot of the resource usage of this process from getrusage and /proc/self/io, and the time spent
+    waiting for the I/O throttle. The I/O counters are None where /proc/self/io is not available.
+    :return: Dict of usage name -> value
+    """
+
+    rusage = resource.getrusage(resource.RUSAGE_SELF)
+    proc_io = __read_proc_io()
+
+    usage = {
+        "wall_seconds": time.perf_counter(),
+        "user_seconds": rusage.ru_utime,
+        "system_seconds": rusage.ru_stime,
+        "max_rss_bytes": rusage.ru_maxrss * 1024,
+        "voluntary_context_switches": rusage.ru_nvcsw,
+        "involuntary_context_switches": rusage.ru_nivcsw,
+        "throttled_seconds": travis_io.get_throttled_seconds()
+    }
+
+    for name in proc_io_fields:
+        usage[name] = proc_io.get(name)
+
+    return usage
+
+
+def get_usage_delta(start_usage, end_usage):
+    """
+    Computes the resource usage between two snapshots of get_resource_usage
+    :param start_usage: Earlier snapshot
+    :param end_usage: Later snapshot
+    :return: Dict of usage name -> value, peaks are those of end_usage
+    """
+
+    return {name: value if name in USAGE_PEAKS or value is None or start_usage[name] is None
+            else value - start_usage[name]
+            for name, value in end_usage.items()}
+
+
+def add_usage(total_usage, usage):
+    """
+    Adds resource usage to a total in place, peaks are combined with max
+    :param total_usage: Dict to add to, may be empty
+    :param usage: Usage as returned by get_usage_delta
+    :return: total_usage
+    """
+
+    for name, value in usage.items():
+        if value is None:
+            total_usage.setdefault(name, None)
+        elif total_usage.get(name) is None:
+            total_usage[name] = value
+        elif name in USAGE_PEAKS:
+            total_usage[name] = max(total_usage[name], value)
+        else:
+            total_usage[name] += value
+
+    return total_usage
+
+
+def get_usage_entry(usage, files, total_bytes):
+    """
+    Builds a report entry from resource usage and the amount of processed logs
+    :param usage: Usage as returned by get_usage_delta or add_usage
+    :param files: Number of processed log files
+    :param total_bytes: Size of the processed log files in bytes
+    :return: Dict with files, bytes, files_per_second, bytes_per_second (per wall-clock second), bytes_per_cpu_second
+             and the usage values
+    """
+
+    wall_seconds = usage.get("wall_seconds") or 0
+    cpu_seconds = (usage.get("user_seconds") or 0) + (usage.get("system_seconds") or 0)
+
+    entry = {
+        "files": files,
+        "bytes": total_bytes,
+        "files_per_second": files / wall_seconds if wall_seconds > 0 else None,
+        "bytes_per_second": total_bytes / wall_seconds if wall_seconds > 0 else None,
+        "bytes_per_cpu_second": total_bytes / cpu_seconds if cpu_seconds > 0 else None
+    }
+    entry.update(usage)
+
+    return entry
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+
+import base64
+import datetime
+import hashlib
+import math
+import zlib
+
+# Upper bounds (exclusive) of the startup duration histogram buckets in seconds, the last bucket is open
+startup_histogram_bounds = (10, 30, 60, 120, 300, 600)
+
+# Quantiles reported for the sketched values
+summary_quantiles = (0.5, 0.9, 0.99)
+
+
+class QuantileSketch:
+    """
+    Streaming quantile sketch with relative error guarantees (DDSketch): values are counted in logarithmically
+    sized bins, so every quantile is returned within relative_accuracy of the true value. The number of bins is
+    bounded by max_bins, beyond that the lowest bins are collapsed.
+    """
+
+    def __init__(self, relative_accuracy=0.01, max_bins=2048):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.__gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.__log_gamma = math.log(self.__gamma)
+        self.count = 0
+        self.zero_count = 0
+        # Bin key -> count, for positive values and for the magnitudes of negative values
+        self.bins = {}
+        self.negative_bins = {}
+
+    def __get_key(self, value):
+        return int(math.ceil(math.log(value) / self.__log_gamma))
+
+    def __get_value(self, key):
+        return 2 * self.__gamma ** key / (self.__gamma + 1)
+
+    def __collapse(self, bins):
+        # Merge the lowest bins into one, the error of small values grows instead of the memory
+        while len(bins) > self.max_bins:
+            lowest_keys = sorted(bins)[:len(bins) - self.max_bins + 1]
+            bins[lowest_keys[-1]] += sum(bins.pop(key) for key in lowest_keys[:-1])
+
+    def add(self, value):
+        self.count += 1
+
+        if value > 0:
+            key = self.__get_key(value)
+            self.bins[key] = self.bins.get(key, 0) + 1
+            if len(self.bins) > self.max_bins:
+                self.__collapse(self.bins)
+        elif value < 0:
+            key = self.__get_key(-value)
+            self.negative_bins[key] = self.negative_bins.get(key, 0) + 1
+            if len(self.negative_bins) > self.max_bins:
+                self.__collapse(self.negative_bins)
+        else:
+            self.zero_count += 1
+
+    def merge(self, other):
+        """
+        Adds the values of another sketch with the same relative accuracy
+        :param other: QuantileSketch object
+        """
+
+        self.count += other.count
+        self.zero_count += other.zero_count
+
+        for bins, other_bins in ((self.bins, other.bins), (self.negative_bins, other.negative_bins)):
+            for key, count in other_bins.items():
+                bins[key] = bins.get(key, 0) + count
+            self.__collapse(bins)
+
+    def get_quantile(self, quantile):
+        """
+        :param quantile: Quantile between 0 and 1
+        :return: Approximate value at the quantile, None if the sketch is empty
+        """
+
+        if self.count == 0:
+            return None
+
+        rank = quantile * (self.count - 1)
+        seen = 0
+
+        for key in sorted(self.negative_bins, reverse=True):
+            seen += self.negative_bins[key]
+            if seen > rank:
+                return -self.__get_value(key)
+
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                return self.__get_value(key)
+
+        return self.__get_value(max(self.bins))
+
+    def to_dict(self):
+        return {"relative_accuracy": self.relative_accuracy, "count": self.count, "zero_count": self.zero_count,
+                "bins": dict(sorted(self.bins.items())),
+                "negative_bins": dict(sorted(self.negative_bins.items()))}
+
+    @staticmethod
+    def from_dict(state):
+        sketch = QuantileSketch(state["relative_accuracy"])
+        sketch.count = state["count"]
+        sketch.zero_count = state["zero_count"]
+        # JSON object keys are strings
+        sketch.bins = {int(key): count for key, count in state["bins"].items()}
+        sketch.negative_bins = {int(key): count for key, count in state["negative_bins"].items()}
+        return sketch
+
+
+class DistinctCounter:
+    """HyperLogLog estimate of the number of distinct strings, 2^precision one-byte registers"""
+
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value):
+        # Stable hash, hash() is salted per interpreter
+        value_hash = int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+        register = value_hash >> (64 - self.precision)
+        remaining_bits = value_hash & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remaining_bits.bit_length() + 1
+
+        if rank > self.registers[register]:
+            self.registers[register] = rank
+
+    def merge(self, other):
+        for register, rank in enumerate(other.registers):
+            if rank > self.registers[register]:
+                self.registers[register] = rank
+
+    def get_estimate(self):
+        register_count = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / register_count)
+        estimate = alpha * register_count * register_count / sum(2.0 ** -rank for rank in self.registers)
+        empty_registers = self.registers.count(0)
+
+        # Linear counting is more accurate for small cardinalities
+        if estimate <= 2.5 * register_count and empty_registers > 0:
+            estimate = register_count * math.log(register_count / empty_registers)
+
+        return int(round(estimate))
+
+    def to_dict(self):
+        return {"precision": self.precision,
+                "registers": base64.b64encode(zlib.compress(bytes(self.registers))).decode("ascii")}
+
+    @staticmethod
+    def from_dict(state):
+        counter = DistinctCounter(state["precision"])
+        counter.registers = bytearray(zlib.decompress(base64.b64decode(state["registers"])))
+        return counter
+
+
+def _format_timestamp(timestamp):
+    # Same format as the CSV output, epoch timestamps stay numbers
+    if isinstance(timestamp, datetime.datetime):
+        return timestamp.strftime("%Y-%m-%d %H:%M:%S")
+
+    return timestamp
+
+
+class ProjectRollup:
+    """
+    Totals of the jobs of a project (or of several projects) that are updated as jobs are added, in constant memory:
+    job count, build minutes, startup duration histogram, distinct workers, date range and quantile sketches of
+    startup and build durations. Rollups of shards or projects can be merged.
+    """
+
+    def __init__(self):
+        self.job_count = 0
+        self.build_minutes = 0.0
+        self.build_minutes_sketch = QuantileSketch()
+        self.startup_histogram = [0] * (len(startup_histogram_bounds) + 1)
+        self.startup_sketch = QuantileSketch()
+        self.workers = DistinctCounter()
+        self.first_start = None
+        self.last_end = None
+
+    def add_job(self, job):
+        """
+        Adds a parsed job
+        :param job: TravisJob object
+        """
+
+        self.job_count += 1
+
+        if job.duration_aggregated_timestamp is not None:
+            build_minutes = job.duration_aggregated_timestamp / 60000
+            self.build_minutes += build_minutes
+            self.build_minutes_sketch.add(build_minutes)
+
+        if job.startup_duration is not None:
+            bucket = 0
+            while bucket < len(startup_histogram_bounds) and job.startup_duration >= startup_histogram_bounds[bucket]:
+                bucket += 1
+            self.startup_histogram[bucket] += 1
+            self.startup_sketch.add(job.startup_duration)
+
+        if job.worker_hostname is not None:
+            self.workers.add(job.worker_hostname)
+
+        self.__update_date_range(_format_timestamp(job.step_first_start), _format_timestamp(job.step_last_end))
+
+    def __update_date_range(self, first_start, last_end):
+        if first_start is not None and (self.first_start is None or first_start < self.first_start):
+            self.first_start = first_start
+
+        if last_end is not None and (self.last_end is None or last_end > self.last_end):
+            self.last_end = last_end
+
+    def merge(self, other):
+        """
+        Adds the totals of another rollup
+        :param other: ProjectRollup object
+        """
+
+        self.job_count += other.job_count
+        self.build_minutes += other.build_minutes
+        self.build_minutes_sketch.merge(other.build_minutes_sketch)
+        self.startup_histogram = [count + other_count for count, other_count
+                                  in zip(self.startup_histogram, other.startup_histogram)]
+        self.startup_sketch.merge(other.startup_sketch)
+        self.workers.merge(other.workers)
+        self.__update_date_range(other.first_start, other.last_end)
+
+    def to_dict(self):
+        """
+        :return: Summary that can be written as JSON, including the sketches needed to merge it
+        """
+
+        histogram_labels = ["{}-{}".format(lower, upper) for lower, upper
+                            in zip((0,) + startup_histogram_bounds, startup_histogram_bounds)]
+        histogram_labels.append("{}+".format(startup_histogram_bounds[-1]))
+
+        return {
+            "job_count": self.job_count,
+            "build_minutes": {
+                "total": self.build_minutes,
+                "jobs": self.build_minutes_sketch.count,
+                "quantiles": {"p{:g}".format(quantile * 100): self.build_minutes_sketch.get_quantile(quantile)
+                              for quantile in summary_quantiles}
+            },
+            "startup_seconds": {
+                "histogram": dict(zip(histogram_labels, self.startup_histogram)),
+                "jobs": self.startup_sketch.count,
+                "quantiles": {"p{:g}".format(quantile * 100): self.startup_sketch.get_quantile(quantile)
+                              for quantile in summary_quantiles}
+            },
+            "distinct_workers": self.workers.get_estimate(),
+            "date_range": {"first_start": self.first_start, "last_end": self.last_end},
+            "sketches": {
+                "build_minutes": self.build_minutes_sketch.to_dict(),
+                "startup_seconds": self.startup_sketch.to_dict(),
+                "workers": self.workers.to_dict()
+            }
+        }
+
+    @staticmethod
+    def from_dict(summary):
+        """
+        Restores a rollup from a summary written by to_dict
+        :param summary: Dict as returned by to_dict
+        :return: ProjectRollup object
+        """
+
+        rollup = ProjectRollup()
+        rollup.job_count = summary["job_count"]
+        rollup.build_minutes = summary["build_minutes"]["total"]
+        rollup.build_minutes_sketch = QuantileSketch.from_dict(summary["sketches"]["build_minutes"])
+        rollup.startup_histogram = list(summary["startup_seconds"]["histogram"].values())
+        rollup.startup_sketch = QuantileSketch.from_dict(summary["sketches"]["startup_seconds"])
+        rollup.workers = DistinctCounter.from_dict(summary["sketches"]["workers"])
+        rollup.first_start = summary["date_range"]["first_start"]
+        rollup.last_end = summary["date_range"]["last_end"]
+        return rollup
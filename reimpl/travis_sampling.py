@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+
+import math
+import random
+
+from travis_job import TravisJob
+
+# Two-sided 95% normal quantile used for all confidence intervals
+z_95 = 1.959963984540054
+
+CATEGORICAL_FIELDS = ("worker_hostname", "worker_version", "os_dist_id", "os_dist_release", "os_description",
+                      "build_language", "using_worker_header", "travis_fold_worker_info", "travis_fold_system_info")
+
+NUMERIC_FIELDS = ("startup_duration", "travis_fold_count", "duration_aggregated_timestamp",
+                  "duration_diff_timestamp")
+
+
+def get_sample_size(population_size, sample_rate=None, sample_count=None):
+    """
+    Determines the number of logs to sample from a project
+    :param population_size: Number of logs of the project
+    :param sample_rate: Fraction of logs to sample
+    :param sample_count: Fixed number of logs to sample, takes precedence over sample_rate
+    :return: Sample size, at least 1 for non-empty projects
+    """
+
+    if population_size == 0:
+        return 0
+
+    if sample_count is not None:
+        return min(population_size, sample_count)
+
+    return min(population_size, max(1, int(round(population_size * sample_rate))))
+
+
+def sample_log_files(log_file_list, stratum, seed=0, sample_rate=None, sample_count=None):
+    """
+    Draws a simple random sample without replacement from the logs of one stratum (project). The generator is
+    seeded with the seed and the stratum name, so samples do not depend on the order in which projects are
+    processed.
+    :param log_file_list: Log file paths of the stratum
+    :param stratum: Name of the stratum, e.g. the project folder name
+    :param seed: Seed of the sample
+    :param sample_rate: Fraction of logs to sample
+    :param sample_count: Fixed number of logs to sample per stratum
+    :return: Sorted list of sampled log file paths
+    """
+
+    sample_size = get_sample_size(len(log_file_list), sample_rate, sample_count)
+
+    return sorted(random.Random("{}:{}".format(seed, stratum)).sample(sorted(log_file_list), sample_size))
+
+
+def get_sample_fields(columns=None):
+    """
+    Determines the fields to estimate, restricted to those filled for the given output columns
+    :param columns: List of CSV column names, None for all columns
+    :return: Tuple (categorical field names, numeric field names)
+    """
+
+    if columns is None:
+        return CATEGORICAL_FIELDS, NUMERIC_FIELDS
+
+    fields = set(TravisJob.CSV_COLUMNS[column] for column in columns)
+
+    return (tuple(field for field in CATEGORICAL_FIELDS if field in fields),
+            tuple(field for field in NUMERIC_FIELDS if field in fields))
+
+
+class StratumSample:
+    """Sufficient statistics of the jobs sampled from one stratum, small enough to be returned by workers"""
+
+    def __init__(self, stratum, population_size, sample_size, categorical_fields, numeric_fields):
+        self.stratum = stratum
+        self.population_size = population_size
+        self.sample_size = sample_size
+        self.job_count = 0
+        # field -> {value: count}
+        self.value_counts = {field: {} for field in categorical_fields}
+        # field -> [count, sum, sum of squares] of the non-NULL values
+        self.moments = {field: [0, 0.0, 0.0] for field in numeric_fields}
+
+    def add_job(self, job):
+        self.job_count += 1
+
+        for field, counts in self.value_counts.items():
+            value = getattr(job, field)
+            value = "NULL" if value is None else str(value)
+            counts[value] = counts.get(value, 0) + 1
+
+        for field, moments in self.moments.items():
+            value = getattr(job, field)
+            if value is not None:
+                value = float(value)
+                moments[0] += 1
+                moments[1] += value
+                moments[2] += value * value
+
+
+def __get_interval(estimate, variance):
+    # Without a variance estimate the interval is unavailable rather than of zero width
+    if variance is None:
+        return {"estimate": estimate, "ci_low": None, "ci_high": None}
+
+    half_width = z_95 * math.sqrt(max(variance, 0.0))
+
+    return {"estimate": estimate, "ci_low": estimate - half_width, "ci_high": estimate + half_width}
+
+
+def __get_pooled_variance(stratum_statistics):
+    # Within-stratum variance pooled over the strata with at least two observations, None if there are none
+    degrees_of_freedom = sum(count - 1 for stratum, estimate, sample_variance, count in stratum_statistics
+                             if count >= 2)
+
+    if degrees_of_freedom == 0:
+        return None
+
+    return sum((count - 1) * sample_variance for stratum, estimate, sample_variance, count in stratum_statistics
+               if count >= 2) / degrees_of_freedom
+
+
+def __get_variance(stratum_statistics, weight_total):
+    """
+    Computes the variance of a stratified estimate, without replacement with the finite population correction of
+    the sampled logs. A stratum with a single observation gives no variance estimate of its own, the pooled
+    variance of the other strata is used for it.
+    :param stratum_statistics: Tuples (stratum, estimate, sample variance, observation count)
+    :param weight_total: Number of logs of the strata the estimate is weighted over
+    :return: Variance, None if a stratum needs an imputed variance but no stratum has two observations
+    """
+
+    pooled_variance = __get_pooled_variance(stratum_statistics)
+    variance = 0.0
+
+    for stratum, estimate, sample_variance, count in stratum_statistics:
+        correction = 1 - stratum.sample_size / stratum.population_size
+
+        # Fully enumerated strata do not contribute
+        if correction <= 0:
+            continue
+
+        if count < 2:
+            if pooled_variance is None:
+                return None
+            sample_variance = pooled_variance
+
+        weight = stratum.population_size / weight_total
+        variance += weight * weight * correction * sample_variance / count
+
+    return variance
+
+
+def estimate(strata, seed=None, sample_rate=None, sample_count=None):
+    """
+    Computes stratified estimates with 95% confidence intervals from per-project samples. Strata are weighted by
+    their number of logs. Proportions of categorical values are estimated over all jobs (NULL is a value of its
+    own), means of numeric fields over the jobs with a value. Strata with a single observation get the pooled
+    variance of the other strata, the interval is null if no stratum has two observations.
+    :param strata: List of StratumSample objects
+    :return: Dict that can be written as JSON
+    """
+
+    strata = [stratum for stratum in strata if stratum.job_count > 0]
+    population_size = sum(stratum.population_size for stratum in strata)
+
+    categorical = {}
+    numeric = {}
+
+    if strata:
+        for field in strata[0].value_counts:
+            values = sorted(set(value for stratum in strata for value in stratum.value_counts[field]))
+            categorical[field] = {}
+
+            for value in values:
+                stratum_statistics = []
+
+                for stratum in strata:
+                    stratum_proportion = stratum.value_counts[field].get(value, 0) / stratum.job_count
+                    sample_variance = stratum_proportion * (1 - stratum_proportion) * stratum.job_count \
+                        / max(1, stratum.job_count - 1)
+                    stratum_statistics.append((stratum, stratum_proportion, sample_variance, stratum.job_count))
+
+                proportion = sum(stratum.population_size / population_size * stratum_proportion
+                                 for stratum, stratum_proportion, sample_variance, count in stratum_statistics)
+
+                categorical[field][value] = __get_interval(proportion,
+                                                           __get_variance(stratum_statistics, population_size))
+
+        for field in strata[0].moments:
+            valued_strata = [stratum for stratum in strata if stratum.moments[field][0] > 0]
+            valued_population_size = sum(stratum.population_size for stratum in valued_strata)
+
+            if not valued_strata:
+                numeric[field] = None
+                continue
+
+            stratum_statistics = []
+
+            for stratum in valued_strata:
+                count, value_sum, square_sum = stratum.moments[field]
+                stratum_mean = value_sum / count
+                sample_variance = (square_sum - count * stratum_mean * stratum_mean) / max(1, count - 1)
+                stratum_statistics.append((stratum, stratum_mean, sample_variance, count))
+
+            mean = sum(stratum.population_size / valued_population_size * stratum_mean
+                       for stratum, stratum_mean, sample_variance, count in stratum_statistics)
+
+            numeric[field] = __get_interval(mean, __get_variance(stratum_statistics, valued_population_size))
+
+    return {
+        "seed": seed,
+        "sample_rate": sample_rate,
+        "sample_count": sample_count,
+        "confidence": 0.95,
+        "strata": len(strata),
+        "population_logs": population_size,
+        "sampled_logs": sum(stratum.sample_size for stratum in strata),
+        "parsed_jobs": sum(stratum.job_count for stratum in strata),
+        # Strata whose variance is imputed (or unavailable), see __get_variance
+        "strata_without_variance": sum(1 for stratum in strata
+                                       if stratum.job_count < 2 and stratum.sample_size < stratum.population_size),
+        "categorical": categorical,
+        "numeric": numeric
+    }
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+# Checks the block-wise normalization of the repo/build log data files of travis_parser_x: timestamp columns are
+# detected over all blocks, and the Parquet copy holds the same rows as the normalized CSV file
+
+from datetime import datetime, timezone
+import csv
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+
+import travis_parser_x
+
+header = ["tr_build_id", "tr_job_id", "tr_build_number", "gh_build_started_at", "note"]
+
+# The timestamps only start in the third block of two rows
+rows = [["101", "1010", "1", "", "a, UTC, b"],
+        ["101", "1011", "1", "NULL", "b"],
+        ["102", "1020", "2", "", "2015-01-01 10:00:00 UTC"],
+        ["102", "1021", "2", "", "c"],
+        ["103", "1030", "3", "2015-01-03 10:00:00 UTC", ""],
+        ["103", "1031", "3", "2015-01-03 10:00:01 UTC", "d"]]
+
+
+class NormalizeCsvFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.block_rows = travis_parser_x.normalization_block_rows
+        self.columnar_output = travis_parser_x.columnar_output
+        travis_parser_x.normalization_block_rows = 2
+
+        self.source_file = os.path.join(self.folder, "source.csv")
+        self.out_file = os.path.join(self.folder, "buildlog-data-travis.csv")
+
+        with open(self.source_file, "w", newline='') as source:
+            csv.writer(source, lineterminator='\n').writerows([header] + rows)
+
+    def tearDown(self):
+        travis_parser_x.normalization_block_rows = self.block_rows
+        travis_parser_x.columnar_output = self.columnar_output
+        shutil.rmtree(self.folder)
+
+    def read_out_file(self):
+        with open(self.out_file, "r", newline='') as out:
+            return list(csv.reader(out))
+
+    def test_timestamp_column_detected_after_first_block(self):
+        blocks = []
+        out_header, timestamp_columns = travis_parser_x.normalize_csv_file(
+            self.source_file, self.out_file, lambda block_header, block: blocks.append(len(block)))
+
+        self.assertEqual(header, out_header)
+        self.assertEqual([3], timestamp_columns)
+        self.assertEqual([2, 2, 2], blocks)
+
+        out_rows = self.read_out_file()
+        self.assertEqual(["2015-01-03 10:00:00", "2015-01-03 10:00:01"], [row[3] for row in out_rows[5:]])
+        # Timestamp values are normalized in any column, other values are left intact
+        self.assertEqual(["a, UTC, b", "b", "2015-01-01 10:00:00", "c", "", "d"], [row[4] for row in out_rows[1:]])
+
+    def test_parquet_round_trip(self):
+        if importlib.util.find_spec("pyarrow") is None:
+            self.skipTest("pyarrow is not installed")
+
+        import pyarrow.parquet
+
+        travis_parser_x.columnar_output = True
+        travis_parser_x.normalize_csv_file(self.source_file, self.out_file)
+
+        parquet_file = pyarrow.parquet.ParquetFile(os.path.join(self.folder, "buildlog-data-travis.parquet"))
+        table = parquet_file.read()
+
+        self.assertEqual(3, parquet_file.num_row_groups)
+        self.assertEqual(header, table.schema.names)
+        # Parquet stores second timestamps as milliseconds
+        self.assertTrue(pyarrow.types.is_timestamp(table.schema.field("gh_build_started_at").type))
+        self.assertEqual("UTC", table.schema.field("gh_build_started_at").type.tz)
+        self.assertTrue(pyarrow.types.is_string(table.schema.field("note").type))
+
+        csv_rows = self.read_out_file()[1:]
+        for column, name in enumerate(header):
+            values = table.column(name).to_pylist()
+            if name == "gh_build_started_at":
+                expected = [datetime.strptime(row[column], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+                            if row[column] not in ('', 'NULL') else None for row in csv_rows]
+            else:
+                expected = [row[column] for row in csv_rows]
+            self.assertEqual(expected, values, name)
+
+
+if __name__ == "__main__":
+    unittest.main()
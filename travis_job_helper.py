@@ -2,6 +2,8 @@
 
 from curses.ascii import isprint
 from datetime import timedelta, datetime
+import importlib.machinery
+import importlib.util
 import re
 import os
 
@@ -13,7 +15,7 @@ startup_duration_regex = \
     re.compile(r'((?P<hours>\d+?)h)?((?P<minutes>\d+?)m)?((?P<seconds>\d+?)?)(.\d+)?s')
 
 
-def __strip_meta_characters(log_string):
+def __strip_meta_characters_python(log_string):
     """
     Removes color codes and other irrelevant meta-characters
     :param log_string: Log string
@@ -28,6 +30,30 @@ def __strip_meta_characters(log_string):
     return out
 
 
+def _load_compiled_sanitizer(extension_folder):
+    """
+    Loads the compiled sanitizer from the folder it was built in, independent of sys.path
+    :param extension_folder: Folder containing the built _sanitize extension (see setup_sanitize.py)
+    :return: strip_meta_characters of the extension, None if it has not been built
+    """
+
+    for suffix in importlib.machinery.EXTENSION_SUFFIXES:
+        extension_file = os.path.join(extension_folder, "_sanitize" + suffix)
+
+        if os.path.isfile(extension_file):
+            spec = importlib.util.spec_from_file_location("_sanitize", extension_file)
+            extension = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(extension)
+            return extension.strip_meta_characters
+
+    return None
+
+
+# Use the compiled sanitizer if it has been built in reimpl/ (see reimpl/setup_sanitize.py)
+__strip_meta_characters = _load_compiled_sanitizer(os.path.join(os.path.dirname(os.path.abspath(__file__)), "reimpl")) \
+    or __strip_meta_characters_python
+
+
 def __extract_startup_duration(duration_string):
     """
     Extracts total duration in seconds from duration string.
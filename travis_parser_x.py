@@ -1,35 +1,73 @@
 #!/usr/bin/env python
 
 from concurrent.futures import ProcessPoolExecutor, as_completed
+import csv
+from datetime import datetime
 import glob
+import heapq
+import io
+from itertools import islice
 import os
+import re
+import sys
+import tempfile
 import time
-from shutil import copyfileobj
+from shutil import copyfileobj, rmtree
 
 
 from travis_project import TravisProject
 import travis_job_helper
 
+# The CPU limit is determined like in the reimplementation, whose folder is searched after this one
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "reimpl"))
+import travis_resources
+
 input_folder = "input/"
 output_folder = "output/"
 
 repo_data_file = "repo-data-travis.csv"
 build_log_file = "buildlog-data-travis.csv"
 extracted_data_file = "extracted.csv"
+enriched_data_file = "enriched.csv"
+join_report_file = "join-unmatched.csv"
+
+# Join keys of the build log data file
+build_log_build_number_column = "tr_build_number"
+build_log_job_id_column = "tr_job_id"
 
 parallel_enabled = True
-parallel_workers = 8
+# Number of worker processes, None uses the CPUs available to the process (see get_parallel_workers)
+parallel_workers = None
+
+# Rows normalized per block in normalize_csv_file, also the rows per sorted run of the build log join
+normalization_block_rows = 100000
+# Additionally write the normalized files as Parquet with typed timestamp columns (requires pyarrow)
+columnar_output = False
+
+timestamp_regex = re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}( UTC)?$')
+
+
+def get_parallel_workers():
+    """
+    Determines the number of worker processes: parallel_workers if set, otherwise the CPUs available to the process
+    (see travis_resources.get_cpu_limit)
+    :return: Number of worker processes
+    """
+
+    if parallel_workers is not None:
+        return parallel_workers
+
+    return travis_resources.get_cpu_limit()
 
 
 def process_project(project_folder):
     project = create_project(project_folder)
 
     job_list = process_jobs(project_folder)
+    # Deterministic row order independent of the file system's listing order
+    job_list.sort(key=lambda job: (job.build_number, job.job_id))
     project.assign_jobs(job_list)
 
-    copy_repo_data_file(project_folder)
-    copy_build_log_file(project_folder)
-
     write_to_csv(project)
 
     return project
@@ -51,14 +89,42 @@ def process_jobs(project_folder):
     log_listing = glob.glob(project_folder + os.sep + "*.log")
     for log_file in log_listing:
         job = travis_job_helper.parse_job_log_file(log_file)
-        job_list.append(job)
+        if job is not None:
+            job_list.append(job)
 
     return job_list
 
 
 def create_dir_if_not_exists(path):
-    if not os.path.exists(path):
-        os.makedirs(path)
+    # Normalization and log parsing of a project run as separate tasks and both create its output folder
+    os.makedirs(path, exist_ok=True)
+
+
+def normalize_project_files(project_folder):
+    """
+    Normalizes the repo data and build log data files of a project, runs independently of the log parsing. The
+    normalization pass of the build log data file also writes the sorted runs of the join (see join_build_log_file).
+    :param project_folder: Project folder
+    :return: BuildLogRuns, None if the project has no build log data file
+    """
+
+    copy_repo_data_file(project_folder)
+
+    build_log_source_file = project_folder + os.sep + build_log_file
+
+    if not os.path.isfile(build_log_source_file):
+        return None
+
+    project = create_project(project_folder)
+    build_log_runs = BuildLogRuns(build_log_source_file, project.project_org + '/' + project.project_name)
+
+    try:
+        build_log_runs.header = copy_build_log_file(project_folder, build_log_runs.add_block)[0]
+    except Exception:
+        build_log_runs.remove()
+        raise
+
+    return build_log_runs
 
 
 def copy_repo_data_file(project_folder):
@@ -71,7 +137,7 @@ def copy_repo_data_file(project_folder):
         remove_tz_label(repo_log_source_file, repo_log_destination_file)
 
 
-def copy_build_log_file(project_folder):
+def copy_build_log_file(project_folder, block_handler=None):
     build_log_source_file = project_folder + os.sep + build_log_file
     build_log_destination_file = output_folder + os.sep + os.path.basename(project_folder) + os.sep + build_log_file
 
@@ -79,7 +145,9 @@ def copy_build_log_file(project_folder):
 
     if os.path.isfile(build_log_source_file):
         # copy2(build_log_source_file, build_log_destination_file)
-        remove_tz_label(build_log_source_file, build_log_destination_file)
+        return remove_tz_label(build_log_source_file, build_log_destination_file, block_handler)
+
+    return None
 
 
 def merge_log_files(folder_list, file_name):
@@ -87,7 +155,9 @@ def merge_log_files(folder_list, file_name):
     header_added = False
     with open(output_folder + os.sep + file_name, "wb") as out_file:
         for project_folder in folder_list:
-            if os.path.isdir(project_folder):
+            if not os.path.isfile(output_folder + os.sep + os.path.basename(project_folder) + os.sep + file_name):
+                print("No", file_name, "for", project_folder)
+            elif os.path.isdir(project_folder):
                 with open(output_folder + os.sep + os.path.basename(project_folder) + os.sep + file_name, "rb") as in_file:
                     if header_added:
                         in_file.__next__()
@@ -98,27 +168,372 @@ def merge_log_files(folder_list, file_name):
                 print(project_folder)
 
 
-def remove_tz_label(source_file, out_file):
+def remove_tz_label(source_file, out_file, block_handler=None):
+    """
+    Copy content from source_file to out_file while removing the timezone label from timestamp fields.
+    :param source_file: Source file
+    :param out_file: destination file
+    :param block_handler: See normalize_csv_file
+    :return: Tuple (header, list of timestamp column indices)
+    """
+
+    return normalize_csv_file(source_file, out_file, block_handler)
+
+
+def normalize_csv_file(source_file, out_file, block_handler=None):
     """
-    Copy content from source_file to out_file while removing the timezone label.
+    Copies a CSV file block-wise with proper CSV parsing, removing the " UTC" label from timestamp values. Quoted
+    fields are left intact. Timestamp columns, those in which all non-empty values of the file are timestamps, are
+    detected over all blocks; the Parquet copy (see columnar_output) is written from the normalized file once they
+    are known.
     :param source_file: Source file
     :param out_file: destination file
-    :return: No return value
+    :param block_handler: Function (header, block) called with every normalized block of rows, None for none
+    :return: Tuple (header, list of timestamp column indices)
+    """
+
+    with open(source_file, "r", newline='') as infile:
+        with open(out_file, "w", newline='') as outfile:
+            reader = csv.reader(infile)
+            writer = csv.writer(outfile, lineterminator='\n')
+
+            header = next(reader, None)
+            if header is None:
+                return [], []
+            writer.writerow(header)
+
+            timestamp_tracker = TimestampColumns(len(header))
+
+            block = list(islice(reader, normalization_block_rows))
+            while block:
+                timestamp_tracker.normalize_block(block)
+                writer.writerows(block)
+
+                if block_handler is not None:
+                    block_handler(header, block)
+
+                block = list(islice(reader, normalization_block_rows))
+
+    timestamp_columns = timestamp_tracker.get_columns()
+
+    if columnar_output:
+        write_columnar_file(out_file, header, timestamp_columns)
+
+    return header, timestamp_columns
+
+
+class TimestampColumns:
     """
-    first_line = True
+    Removes the " UTC" label from the timestamp values of blocks of rows and keeps track of the columns in which all
+    non-empty values are timestamps
+    """
+
+    def __init__(self, column_count):
+        self.__column_count = column_count
+        # Columns without a non-empty value that is not a timestamp, and columns with at least one timestamp
+        self.__candidate_columns = set(range(column_count))
+        self.__timestamp_value_columns = set()
+
+    def normalize_block(self, block):
+        candidate_columns = self.__candidate_columns
+
+        for row in block:
+            for column, value in enumerate(row):
+                # Values of excluded columns only need the check if they carry the label
+                if value.endswith(' UTC') or column in candidate_columns:
+                    if value in ('', 'NULL', 'NA'):
+                        continue
+
+                    if timestamp_regex.match(value):
+                        if value.endswith(' UTC'):
+                            row[column] = value[:-4]
+                        if column < self.__column_count:
+                            self.__timestamp_value_columns.add(column)
+                    else:
+                        candidate_columns.discard(column)
+
+    def get_columns(self):
+        """
+        :return: Sorted list of the indices of the columns in which all non-empty values seen are timestamps
+        """
+
+        return sorted(self.__candidate_columns & self.__timestamp_value_columns)
+
+
+class ColumnarFile:
+    """
+    Parquet copy of a normalized CSV file with the timestamp columns typed as timestamps (requires pyarrow). Every
+    normalization block becomes a row group, so only one block is held in memory.
+    """
+
+    def __init__(self, parquet_file, header, timestamp_columns):
+        import pyarrow
+        import pyarrow.parquet
+
+        self.__pyarrow = pyarrow
+        self.__header = header
+        self.__timestamp_columns = timestamp_columns
+        self.__schema = pyarrow.schema([(name, pyarrow.timestamp('s', tz='UTC') if column in timestamp_columns
+                                         else pyarrow.string()) for column, name in enumerate(header)])
+        self.__writer = pyarrow.parquet.ParquetWriter(parquet_file, self.__schema)
+
+    def write_block(self, block):
+        columns = []
+
+        for column in range(len(self.__header)):
+            values = [row[column] if column < len(row) else None for row in block]
+            if column in self.__timestamp_columns:
+                values = [datetime.strptime(value, "%Y-%m-%d %H:%M:%S") if value not in (None, '', 'NULL', 'NA')
+                          else None for value in values]
+            columns.append(self.__pyarrow.array(values, type=self.__schema[column].type))
+
+        self.__writer.write_table(self.__pyarrow.Table.from_arrays(columns, schema=self.__schema),
+                                  row_group_size=len(block))
+
+    def close(self):
+        self.__writer.close()
 
-    with open(source_file, "r") as infile:
-        with open(out_file, "w") as outfile:
-            for line_in in infile:
-                if first_line:
-                    outfile.write(line_in)
-                    first_line = False
+
+def open_columnar_file(csv_file, header, timestamp_columns):
+    """
+    Opens the Parquet copy of a normalized CSV file next to it
+    :param csv_file: Normalized CSV file
+    :param header: Header row
+    :param timestamp_columns: Indices of the timestamp columns
+    :return: ColumnarFile, None if pyarrow is not installed
+    """
+
+    try:
+        return ColumnarFile(os.path.splitext(csv_file)[0] + ".parquet", header, timestamp_columns)
+    except ImportError:
+        print("pyarrow is not installed, skipping columnar output for", csv_file)
+        return None
+
+
+def write_columnar_file(csv_file, header, timestamp_columns):
+    """
+    Writes the Parquet copy of a normalized CSV file block by block
+    :param csv_file: Normalized CSV file
+    :param header: Header row
+    :param timestamp_columns: Indices of the timestamp columns
+    """
+
+    columnar_file = open_columnar_file(csv_file, header, timestamp_columns)
+
+    if columnar_file is None:
+        return
+
+    try:
+        with open(csv_file, "r", newline='') as infile:
+            reader = csv.reader(infile)
+            next(reader, None)
+
+            block = list(islice(reader, normalization_block_rows))
+            while block:
+                columnar_file.write_block(block)
+                block = list(islice(reader, normalization_block_rows))
+    finally:
+        columnar_file.close()
+
+
+def _parse_join_key(build_number, job_id):
+    if build_number.isdigit() and job_id.isdigit():
+        return int(build_number), int(job_id)
+
+    return None
+
+
+def _write_join_report_row(report_file, project_name, side, build_number, job_id):
+    report_file.write('"{}",{},{},{}\n'.format(project_name, side, build_number, job_id))
+
+
+def _quote_raw_key(value):
+    # Keys that are not numbers are reported as found in the build log data file
+    return 'NULL' if value is None else '"' + value.replace('"', '""') + '"'
+
+
+class BuildLogRuns:
+    """
+    Sorted runs of a build log data file for the merge join of join_build_log_file. The runs are written from the
+    blocks of the normalization pass (see normalize_csv_file), so the file is read only once: each block is sorted
+    by (build number, job id) into a file of a temporary folder, and the runs are combined with a k-way merge, so
+    memory use is bounded by the block size. Rows with invalid join keys are written to a partial join report as
+    they are found. Only file names are held, so the runs can be passed from the normalization task to the join task.
+    """
+
+    def __init__(self, source_file, project_name):
+        self.source_file = source_file
+        self.header = None
+        self.invalid_count = 0
+        self.__project_name = project_name
+        self.__run_folder = tempfile.mkdtemp(prefix="build-log-runs-")
+        self.__run_files = []
+        self.__key_columns = None
+
+    @property
+    def has_key_columns(self):
+        return self.__key_columns is not None
+
+    @property
+    def invalid_report_file(self):
+        """Join report rows of the build log rows with invalid keys, without header"""
+        return os.path.join(self.__run_folder, "invalid.csv")
+
+    def add_block(self, header, block):
+        if self.__key_columns is None:
+            if build_log_build_number_column not in header or build_log_job_id_column not in header:
+                return
+            self.__key_columns = (header.index(build_log_build_number_column), header.index(build_log_job_id_column))
+
+        build_number_column, job_id_column = self.__key_columns
+        keyed_block = []
+
+        with open(self.invalid_report_file, "a") as report_file:
+            for row in block:
+                build_number = row[build_number_column] if build_number_column < len(row) else None
+                job_id = row[job_id_column] if job_id_column < len(row) else None
+
+                key = _parse_join_key(build_number, job_id) if build_number is not None and job_id is not None \
+                    else None
+
+                if key is None:
+                    _write_join_report_row(report_file, self.__project_name, "buildlog",
+                                           _quote_raw_key(build_number), _quote_raw_key(job_id))
+                    self.invalid_count += 1
                 else:
-                    outfile.write(line_in.replace(' UTC,', ','))
+                    keyed_block.append((key, row))
+
+        keyed_block.sort(key=lambda item: item[0])
+
+        run_file_name = os.path.join(self.__run_folder, "run-{}.csv".format(len(self.__run_files)))
+        with open(run_file_name, "w", newline='') as run_file:
+            csv.writer(run_file, lineterminator='\n').writerows(row for key, row in keyed_block)
+        self.__run_files.append(run_file_name)
+
+    def sorted_rows(self):
+        """
+        :return: Generator of (key, row) of all rows with valid keys in key order
+        """
+
+        if self.__key_columns is None:
+            return iter(())
+
+        build_number_column, job_id_column = self.__key_columns
+
+        def read_run(run_file_name):
+            with open(run_file_name, "r", newline='') as run_file:
+                for row in csv.reader(run_file):
+                    yield _parse_join_key(row[build_number_column], row[job_id_column]), row
+
+        return heapq.merge(*[read_run(run_file_name) for run_file_name in self.__run_files],
+                           key=lambda item: item[0])
+
+    def remove(self):
+        """Deletes the temporary folder of the runs"""
+        rmtree(self.__run_folder, ignore_errors=True)
+
+
+def join_build_log_file(project, build_log_runs):
+    """
+    Joins the extracted jobs of a project with its build log data on (build number, job id) using a streaming merge
+    join over the sorted runs written by normalize_project_files. Writes the enriched rows and a report of the jobs
+    and build log rows without a match, which is written as they are found. The runs are removed afterwards.
+    :param project: TravisProject with assigned jobs
+    :param build_log_runs: BuildLogRuns returned by normalize_project_files, None if there is no build log data file
+    :return: Tuple (matched rows, unmatched jobs, unmatched build log rows)
+    """
+
+    if build_log_runs is None:
+        return 0, len(project.job_list), 0
+
+    try:
+        return __merge_join(project, build_log_runs)
+    finally:
+        build_log_runs.remove()
+
+
+def __merge_join(project, build_log_runs):
+    project_output_folder = output_folder + project.project_folder + os.sep
+
+    jobs = sorted(project.job_list, key=lambda job: (job.build_number, job.job_id))
+    project_name = project.project_org + '/' + project.project_name
+
+    matched_count = 0
+    unmatched_job_count = 0
+
+    create_dir_if_not_exists(project_output_folder)
+
+    with open(project_output_folder + join_report_file, "w") as report_file:
+        report_file.write("project,side,build_number,job_id\n")
+
+        if os.path.isfile(build_log_runs.invalid_report_file):
+            with open(build_log_runs.invalid_report_file, "r") as invalid_report_file:
+                copyfileobj(invalid_report_file, report_file)
+
+        if not build_log_runs.has_key_columns:
+            print("{} lacks the {} or {} column".format(build_log_runs.source_file, build_log_build_number_column,
+                                                        build_log_job_id_column))
+            return 0, len(jobs), 0
+
+        unmatched_build_log_count = build_log_runs.invalid_count
+
+        with open(project_output_folder + enriched_data_file, "w") as enriched_file:
+            enriched_file.write(TravisProject.get_csv_header().rstrip('\n') + ","
+                                + __format_csv_row(build_log_runs.header))
+
+            build_log_iterator = iter(build_log_runs.sorted_rows())
+            build_log_item = next(build_log_iterator, None)
+            job_index = 0
+
+            while job_index < len(jobs):
+                job = jobs[job_index]
+                job_key = (job.build_number, job.job_id)
+
+                # Build log rows without a job
+                while build_log_item is not None and build_log_item[0] < job_key:
+                    _write_join_report_row(report_file, project_name, "buildlog", *build_log_item[0])
+                    unmatched_build_log_count += 1
+                    build_log_item = next(build_log_iterator, None)
+
+                if build_log_item is None or build_log_item[0] > job_key:
+                    _write_join_report_row(report_file, project_name, "extracted", *job_key)
+                    unmatched_job_count += 1
+                    job_index += 1
+                    continue
+
+                # Equal keys: pair every build log row with every job of that key
+                key_rows = []
+                while build_log_item is not None and build_log_item[0] == job_key:
+                    key_rows.append(build_log_item[1])
+                    build_log_item = next(build_log_iterator, None)
+
+                while job_index < len(jobs) and (jobs[job_index].build_number, jobs[job_index].job_id) == job_key:
+                    for row in key_rows:
+                        enriched_file.write('"{}",{},{}'.format(project_name, jobs[job_index].get_as_csv(),
+                                                                 __format_csv_row(row)))
+                        matched_count += 1
+                    job_index += 1
+
+            while build_log_item is not None:
+                _write_join_report_row(report_file, project_name, "buildlog", *build_log_item[0])
+                unmatched_build_log_count += 1
+                build_log_item = next(build_log_iterator, None)
+
+    print(project.project_folder, "joined:", matched_count, "matched,", unmatched_job_count, "jobs and",
+          unmatched_build_log_count, "build log rows unmatched")
+
+    return matched_count, unmatched_job_count, unmatched_build_log_count
+
+
+def __format_csv_row(row):
+    row_buffer = io.StringIO()
+    csv.writer(row_buffer, lineterminator='\n').writerow(row)
+    return row_buffer.getvalue()
 
 
 def write_to_csv(project):
     destination_csv_file = output_folder + project.project_folder + os.sep + "extracted.csv"
+    create_dir_if_not_exists(os.path.dirname(destination_csv_file))
     print(project.project_folder, "done. Writing to ", destination_csv_file)
     with open(destination_csv_file, 'w') as csv_file:
 
@@ -128,7 +543,7 @@ def write_to_csv(project):
 def main():
     project_list = []
 
-    file_names = [extracted_data_file, build_log_file, repo_data_file]
+    file_names = [extracted_data_file, build_log_file, repo_data_file, enriched_data_file, join_report_file]
 
     start_time = time.time()
 
@@ -161,10 +576,43 @@ def main():
         os.makedirs(output_folder)
 
     if parallel_enabled:
-        with ProcessPoolExecutor(max_workers=parallel_workers) as executor:
-            future_process_project = \
-                {executor.submit(process_project, 'input' + os.sep + folder):
-                    folder for folder in folder_list}
+        workers = get_parallel_workers()
+        print("Using {} worker processes".format(workers))
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Normalization of the repo/build log data files runs alongside the log parsing, the join of a project
+            # is submitted once both are done
+            future_project_stage = {}
+            for folder in folder_list:
+                future_project_stage[executor.submit(process_project, 'input' + os.sep + folder)] = (folder, "parse")
+                future_project_stage[executor.submit(normalize_project_files, 'input' + os.sep + folder)] = \
+                    (folder, "normalize")
+
+            stage_results = {}
+            future_join_project = {}
+
+            for fps in as_completed(future_project_stage):
+                folder, stage = future_project_stage[fps]
+                try:
+                    stage_results.setdefault(folder, {})[stage] = fps.result()
+                except Exception as e:
+                    print("Stage", stage, "of", folder, "failed:", e)
+                    stage_results.setdefault(folder, {})[stage] = None
+
+                if len(stage_results[folder]) == 2:
+                    project = stage_results[folder]["parse"]
+                    build_log_runs = stage_results[folder]["normalize"]
+
+                    if project is not None:
+                        future_join_project[executor.submit(join_build_log_file, project, build_log_runs)] = folder
+                    elif build_log_runs is not None:
+                        build_log_runs.remove()
+
+            for fjp in as_completed(future_join_project):
+                try:
+                    fjp.result()
+                except Exception as e:
+                    print("Joining", future_join_project[fjp], "failed:", e)
 
     #        for fpp in as_completed(future_process_project):
     #            project_list.append(fpp.result())
@@ -173,9 +621,10 @@ def main():
     else:
         for folder in folder_list:
             project = process_project(folder)
+            join_build_log_file(project, normalize_project_files(folder))
             project_list.append(project)
 
-    out_folder_list = [item for item in glob.glob(output_folder + os.sep + "*") if os.path.isdir(item)]
+    out_folder_list = sorted(item for item in glob.glob(output_folder + os.sep + "*") if os.path.isdir(item))
 
     for file_name in file_names:
         merge_log_files(out_folder_list, file_name)